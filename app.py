@@ -1,24 +1,27 @@
 import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
 import streamlit as st
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
 from dotenv import load_dotenv
+from utils.auth import SCOPES, ManagedOAuth, UserTokenHandler
+from utils.cache import get_response_cache
+from utils.client import SpotifyClient
+from utils.config import MULTI_USER
+from utils.history import start_history_recorder
+from utils.library import open_library, sync_library
+from utils.metrics import begin_page, render_diagnostics
+from utils.swr import clear_all as clear_swr_caches
+from utils.top_items import prefetch_top_items
 
 load_dotenv()
 
-SCOPES = " ".join([
-    "user-top-read",
-    "user-read-recently-played",
-    "user-library-read",
-    "playlist-read-private",
-])
-
 st.set_page_config(
     page_title="My Spotify Wrapped",
     page_icon="🎵",
     layout="wide",
     initial_sidebar_state="expanded",
 )
+begin_page()
 
 st.markdown("""
     <style>
@@ -49,15 +52,36 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-def get_spotify_client():
-    return spotipy.Spotify(auth_manager=SpotifyOAuth(
+@st.cache_resource
+def shared_auth_manager() -> ManagedOAuth:
+    """Single-user mode's OAuth manager, shared by every session so the token is refreshed once."""
+    return ManagedOAuth(
         client_id=os.getenv("SPOTIFY_CLIENT_ID"),
         client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
         redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI", "http://localhost:8888/callback"),
         scope=SCOPES,
         cache_path=".cache",
         open_browser=True,
-    ))
+    )
+
+
+def get_spotify_client():
+    if os.getenv("SPOTIFY_ACCESS_TOKEN"):
+        # A fixed bearer token skips OAuth; used with the offline stub API in benchmarks/.
+        return SpotifyClient(auth=os.getenv("SPOTIFY_ACCESS_TOKEN"), cache=get_response_cache())
+    if MULTI_USER:
+        # Each browser session logs in on its own; tokens never touch the shared .cache file.
+        auth_manager = ManagedOAuth(
+            client_id=os.getenv("SPOTIFY_CLIENT_ID"),
+            client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
+            redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI", "http://localhost:8501"),
+            scope=SCOPES,
+            cache_handler=UserTokenHandler(),
+            open_browser=False,
+        )
+    else:
+        auth_manager = shared_auth_manager()
+    return SpotifyClient(auth_manager=auth_manager, cache=get_response_cache())
 
 
 if "sp" not in st.session_state:
@@ -65,12 +89,32 @@ if "sp" not in st.session_state:
 
 sp = st.session_state.sp
 
+if MULTI_USER and sp.auth_manager is not None and sp.auth_manager.cache_handler.get_cached_token() is None:
+    code = st.query_params.get("code")
+    if code:
+        sp.auth_manager.get_access_token(code, as_dict=False, check_cache=False)
+        st.query_params.clear()
+    else:
+        st.title("🎵 My Spotify Wrapped")
+        st.link_button("Log in with Spotify", sp.auth_manager.get_authorize_url(), type="primary")
+        st.stop()
+
 
-@st.cache_data(ttl=3600)
-def fetch_profile():
-    return sp.current_user()
+@st.cache_resource
+def background_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="home")
 
 
+def fetch_profile() -> Future:
+    """The logged-in user's profile, requested once per session without blocking the page."""
+    if "profile" not in st.session_state:
+        st.session_state.profile = background_executor().submit(sp.current_user)
+    return st.session_state.profile
+
+
+# Started before anything is drawn; the shell below renders while it is in flight.
+profile = fetch_profile()
+
 # ── Page content ──────────────────────────────────────────────────────────────
 
 st.title("🎵 My Spotify Wrapped")
@@ -78,46 +122,86 @@ st.caption("A deeper look at your music — beyond what Spotify shows you.")
 
 st.divider()
 
-try:
-    user = fetch_profile()
-
-    col_avatar, col_info = st.columns([1, 4], gap="large")
-
-    with col_avatar:
-        if user.get("images"):
-            st.image(user["images"][0]["url"], width=140)
-        else:
-            st.markdown("## 👤")
-
-    with col_info:
-        st.markdown(f"## {user['display_name']}")
-        st.markdown(f"[Open Spotify Profile]({user['external_urls']['spotify']})")
-
-        m1, m2, m3 = st.columns(3)
-        with m1:
-            st.markdown(f"<div class='big-number'>{user['followers']['total']:,}</div>", unsafe_allow_html=True)
-            st.markdown("<div class='stat-label'>Followers</div>", unsafe_allow_html=True)
-        with m2:
-            st.markdown(f"<div class='big-number'>{user.get('country', '—')}</div>", unsafe_allow_html=True)
-            st.markdown("<div class='stat-label'>Country</div>", unsafe_allow_html=True)
-        with m3:
-            plan = user.get("product", "—").capitalize()
-            st.markdown(f"<div class='big-number'>{plan}</div>", unsafe_allow_html=True)
-            st.markdown("<div class='stat-label'>Plan</div>", unsafe_allow_html=True)
-
-    st.divider()
-    st.markdown("### Navigate")
-    st.markdown("""
-    Use the **sidebar** to explore your stats:
-
-    | Page | What you'll find |
-    |------|-----------------|
-    | 📊 Top Charts | Your top artists, tracks, and genres across different time ranges |
-    | 🎵 Audio Features | The sonic fingerprint of your taste — energy, mood, danceability |
-    | 🕐 Listening Patterns | When and how you listen, discovery rate, library timeline |
-    | 🎧 Playlist Analysis | Mood maps, diversity scores, and track breakdowns per playlist |
-    """)
-
-except Exception as e:
-    st.error(f"Could not connect to Spotify: {e}")
-    st.info("Make sure your `.env` file has valid `SPOTIFY_CLIENT_ID`, `SPOTIFY_CLIENT_SECRET`, and `SPOTIPY_REDIRECT_URI`.")
+account = st.container()
+
+st.divider()
+st.markdown("### Navigate")
+st.markdown("""
+Use the **sidebar** to explore your stats:
+
+| Page | What you'll find |
+|------|-----------------|
+| 📊 Top Charts | Your top artists, tracks, and genres across different time ranges |
+| 🎵 Audio Features | The sonic fingerprint of your taste — energy, mood, danceability |
+| 🕐 Listening Patterns | When and how you listen, discovery rate, library timeline |
+| 🎧 Playlist Analysis | Mood maps, diversity scores, and track breakdowns per playlist |
+""")
+
+with account:
+    try:
+        with st.spinner("Loading your profile..."):
+            user = profile.result()
+        st.session_state.user_id = user["id"]
+        # From here on, user endpoints are cached under this user's ID.
+        sp.user_scope = user["id"]
+        if isinstance(getattr(sp.auth_manager, "cache_handler", None), UserTokenHandler):
+            sp.auth_manager.cache_handler.bind_user(user["id"])
+        start_history_recorder(sp, user["id"])
+
+        # Top Charts and Audio Features slice these lists, so start downloading them
+        # now; by the time the user opens either page they are usually ready.
+        if "top_items" not in st.session_state or time.time() - st.session_state.top_items_at > 3600:
+            st.session_state.top_items = prefetch_top_items(sp)
+            st.session_state.top_items_at = time.time()
+
+        col_avatar, col_info = st.columns([1, 4], gap="large")
+
+        with col_avatar:
+            if user.get("images"):
+                st.image(user["images"][0]["url"], width=140)
+            else:
+                st.markdown("## 👤")
+
+        with col_info:
+            st.markdown(f"## {user['display_name']}")
+            st.markdown(f"[Open Spotify Profile]({user['external_urls']['spotify']})")
+
+            m1, m2, m3 = st.columns(3)
+            with m1:
+                st.markdown(f"<div class='big-number'>{user['followers']['total']:,}</div>", unsafe_allow_html=True)
+                st.markdown("<div class='stat-label'>Followers</div>", unsafe_allow_html=True)
+            with m2:
+                st.markdown(f"<div class='big-number'>{user.get('country', '—')}</div>", unsafe_allow_html=True)
+                st.markdown("<div class='stat-label'>Country</div>", unsafe_allow_html=True)
+            with m3:
+                plan = user.get("product", "—").capitalize()
+                st.markdown(f"<div class='big-number'>{plan}</div>", unsafe_allow_html=True)
+                st.markdown("<div class='stat-label'>Plan</div>", unsafe_allow_html=True)
+
+        st.divider()
+        st.markdown("### Library")
+        library = open_library(user["id"])
+        last_synced = library.last_synced()
+        col_sync_info, col_sync_button = st.columns([4, 1])
+        with col_sync_info:
+            if last_synced:
+                age_min = int((time.time() - last_synced) // 60)
+                st.caption(f"Library last synced {age_min} min ago. Pages read your saved tracks and playlists from the local copy.")
+            else:
+                st.caption("Your library hasn't been synced yet. The first sync downloads every saved track and playlist; later syncs only fetch what changed.")
+        with col_sync_button:
+            if st.button("Sync library", use_container_width=True):
+                with st.spinner("Syncing your library..."):
+                    changes = sync_library(sp, library)
+                st.cache_data.clear()
+                clear_swr_caches()
+                st.success(f"Synced {changes['saved_tracks']} saved tracks and {changes['playlists']} changed playlists.")
+
+    except Exception as e:
+        if profile.done() and profile.exception() is not None:
+            # Ask again on the next run rather than keep serving the failure.
+            del st.session_state.profile
+        st.error(f"Could not connect to Spotify: {e}")
+        st.info("Make sure your `.env` file has valid `SPOTIFY_CLIENT_ID`, `SPOTIFY_CLIENT_SECRET`, and `SPOTIPY_REDIRECT_URI`.")
+
+render_diagnostics("Home")
@@ -0,0 +1 @@
+"""Offline stub of the Spotify Web API and the page benchmark harness."""
@@ -0,0 +1,239 @@
+"""End-to-end page benchmarks against the offline stub API.
+
+Starts the stub server, then renders each page with Streamlit's AppTest in a
+fresh worker process (empty data directory and caches): once cold, once warm
+from a second session in the same process. For each render it records wall
+time, API calls, peak resident memory and the page sections timed with
+utils.metrics.end_section, prints a table and optionally writes JSON and
+compares it with an earlier run.
+
+    python -m benchmarks.run --tracks 10000 --playlists 1000 --sync --out bench.json
+    python -m benchmarks.run --tracks 10000 --playlists 1000 --sync --baseline bench.json
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from pathlib import Path
+
+from benchmarks.stub_server import USER_ID, add_library_arguments, start_stub_server, state_from_args
+
+ROOT = Path(__file__).resolve().parent.parent
+PAGES = [
+    "app.py",
+    "pages/1_Top_Charts.py",
+    "pages/2_Audio_Features.py",
+    "pages/3_Listening_Patterns.py",
+    "pages/4_Playlist_Analysis.py",
+]
+# (metric, absolute slack) pairs checked against --baseline; the slack keeps
+# tiny numbers from tripping the relative tolerance.
+REGRESSION_METRICS = [
+    ("cold.seconds", 0.05),
+    ("warm.seconds", 0.05),
+    ("cold.api_calls", 0),
+    ("warm.api_calls", 0),
+    ("cold.peak_mb", 5),
+]
+SECTION_SLACK = 0.05  # seconds, for the page sections compared the same way
+
+
+class PeakMemory:
+    """Samples resident memory while the block runs; peak_mb is growth over the start."""
+
+    INTERVAL = 0.005
+
+    def __enter__(self):
+        self.start = self.peak = _rss()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(self.INTERVAL):
+            self.peak = max(self.peak, _rss())
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss())
+
+    @property
+    def peak_mb(self) -> float:
+        return (self.peak - self.start) / 2**20
+
+
+def _rss() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # No /proc (macOS): fall back to the process high-water mark, in bytes there.
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _stub_stats(prefix: str, reset: bool = True) -> dict:
+    with urllib.request.urlopen(f"{prefix}_stats" + ("?reset=1" if reset else "")) as response:
+        return json.load(response)
+
+
+def _settle(prefix: str, quiet: float = 0.3):
+    """Wait until background work (prefetches, recorder) stops calling the API."""
+    total = -1
+    while total != (total := _stub_stats(prefix, reset=False)["total"]):
+        time.sleep(quiet)
+
+
+# ── Worker (one page, one fresh process) ──────────────────────────────────────
+
+def run_page(page: str, sync: bool, timeout: float) -> dict:
+    from streamlit.testing.v1 import AppTest
+
+    from utils.cache import get_response_cache
+    from utils.client import SpotifyClient
+    from utils.library import open_library, sync_library
+    from utils.metrics import METRICS
+
+    prefix = os.environ["SPOTIFY_API_PREFIX"]
+
+    def client():
+        return SpotifyClient(auth=os.environ["SPOTIFY_ACCESS_TOKEN"], cache=get_response_cache())
+
+    result = {"page": page}
+    if sync:
+        _stub_stats(prefix)
+        start = time.perf_counter()
+        sync_library(client(), open_library(USER_ID))
+        seconds = time.perf_counter() - start
+        _settle(prefix)
+        stats = _stub_stats(prefix)
+        result["sync"] = {"seconds": seconds, "api_calls": stats["total"], "throttled": stats["throttled"]}
+
+    for phase in ("cold", "warm"):
+        at = AppTest.from_file(str(ROOT / page), default_timeout=timeout)
+        if page != "app.py":
+            # Pages expect the session the Home page sets up.
+            at.session_state["sp"] = client()
+            at.session_state["user_id"] = USER_ID
+        _stub_stats(prefix)
+        METRICS.reset()
+        with PeakMemory() as memory:
+            start = time.perf_counter()
+            at.run()
+            seconds = time.perf_counter() - start
+        _settle(prefix)
+        stats = _stub_stats(prefix)
+        result[phase] = {
+            "seconds": seconds,
+            "api_calls": stats["total"],
+            "throttled": stats["throttled"],
+            "peak_mb": memory.peak_mb,
+            "sections": {
+                row["function"].removeprefix("section:"): row["seconds"]
+                for row in METRICS.snapshot()["functions"] if row["function"].startswith("section:")
+            },
+            "errors": [str(e.value)[:200] for e in [*at.exception, *at.error]],
+        }
+    return result
+
+
+# ── Driver ────────────────────────────────────────────────────────────────────
+
+def _metric(result: dict, name: str) -> float:
+    phase, key = name.split(".")
+    return result[phase][key]
+
+
+def find_regressions(results: list[dict], baseline: list[dict], tolerance: float) -> list[str]:
+    old = {r["page"]: r for r in baseline}
+    problems = []
+    for result in results:
+        if result["page"] not in old:
+            continue
+        for name, slack in REGRESSION_METRICS:
+            before, after = _metric(old[result["page"]], name), _metric(result, name)
+            if after > before * (1 + tolerance) + slack:
+                problems.append(f"{result['page']}: {name} {before:.3g} → {after:.3g}")
+        for phase in ("cold", "warm"):
+            old_sections = old[result["page"]][phase].get("sections", {})
+            for section, after in result[phase].get("sections", {}).items():
+                before = old_sections.get(section)
+                if before is not None and after > before * (1 + tolerance) + SECTION_SLACK:
+                    problems.append(f"{result['page']}: {phase} {section} {before:.3g} → {after:.3g} s")
+    return problems
+
+
+def print_table(results: list[dict]):
+    header = f"{'page':<32}{'cold s':>9}{'warm s':>9}{'cold calls':>12}{'warm calls':>12}{'429s':>6}{'peak MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cold, warm = r["cold"], r["warm"]
+        print(f"{r['page']:<32}{cold['seconds']:>9.2f}{warm['seconds']:>9.2f}{cold['api_calls']:>12}"
+              f"{warm['api_calls']:>12}{cold['throttled'] + warm['throttled']:>6}{cold['peak_mb']:>9.1f}")
+        if "sync" in r:
+            sync = r["sync"]
+            print(f"{'':<4}library sync: {sync['seconds']:.2f} s, {sync['api_calls']} calls, {sync['throttled']} 429s")
+        for name, seconds in cold.get("sections", {}).items():
+            print(f"{'':<4}{name}: {seconds:.2f} s cold, {warm.get('sections', {}).get(name, 0):.2f} s warm")
+        for error in cold["errors"] + warm["errors"]:
+            print(f"{'':<4}error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_library_arguments(parser)
+    parser.add_argument("--pages", nargs="+", default=PAGES)
+    parser.add_argument("--sync", action="store_true", help="sync the library before rendering each page")
+    parser.add_argument("--rate-limit", type=float, help="client requests per second (SPOTIFY_RATE_LIMIT)")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds allowed per render")
+    parser.add_argument("--out", type=Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, help="earlier --out file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_page(args.worker, args.sync, args.timeout)))
+        return
+
+    server, prefix = start_stub_server(state_from_args(args))
+    results = []
+    for page in args.pages:
+        env = {
+            **os.environ,
+            "SPOTIFY_API_PREFIX": prefix,
+            "SPOTIFY_ACCESS_TOKEN": "stub",
+            "SPOTIFY_DATA_DIR": tempfile.mkdtemp(prefix="spotify-bench-"),
+        }
+        if args.rate_limit:
+            env["SPOTIFY_RATE_LIMIT"] = str(args.rate_limit)
+        command = [sys.executable, "-m", "benchmarks.run", "--worker", page, "--timeout", str(args.timeout)]
+        if args.sync:
+            command.append("--sync")
+        proc = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.exit(f"{page} failed:\n{proc.stderr[-2000:]}")
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    server.shutdown()
+
+    print_table(results)
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+    if args.baseline:
+        problems = find_regressions(results, json.loads(args.baseline.read_text()), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
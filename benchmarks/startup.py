@@ -0,0 +1,110 @@
+"""Import-time budget for every page.
+
+Each page's prologue (everything above st.set_page_config, i.e. its imports)
+runs in a fresh interpreter that has already imported Streamlit, as the
+server has. The fastest of a few runs is compared with the page's budget, and
+the page fails if it goes over or loads a module it should defer.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --scale 2 --out startup.json   # slower machine
+"""
+import argparse
+import ast
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Seconds on top of `import streamlit`. The Home page only needs the client,
+# the library store and the history recorder; the others defer pandas and
+# plotly until they build a table or draw a chart.
+IMPORT_BUDGETS = {
+    "app.py": 0.3,
+    "pages/1_Top_Charts.py": 0.35,
+    "pages/2_Audio_Features.py": 0.35,
+    "pages/3_Listening_Patterns.py": 0.35,
+    "pages/4_Playlist_Analysis.py": 0.35,
+}
+DEFERRED_MODULES = ["pandas", "plotly.express", "pyarrow.dataset"]
+
+
+def prologue(page: str) -> str:
+    """Source of the page's top-level statements before st.set_page_config."""
+    source = (ROOT / page).read_text()
+    tree = ast.parse(source)
+    body = []
+    for node in tree.body:
+        if "set_page_config" in ast.get_source_segment(source, node):
+            break
+        body.append(node)
+    return ast.unparse(ast.Module(body=body, type_ignores=[]))
+
+
+def measure(page: str) -> dict:
+    import streamlit  # noqa: F401  (already loaded in the server)
+
+    code = compile(prologue(page), page, "exec")
+    start = time.perf_counter()
+    exec(code, {"__name__": "__main__"})
+    seconds = time.perf_counter() - start
+    return {
+        "page": page,
+        "seconds": seconds,
+        "loaded": [name for name in DEFERRED_MODULES if name in sys.modules],
+    }
+
+
+def run_page(page: str, repeat: int) -> dict:
+    env = {**os.environ, "SPOTIFY_DATA_DIR": tempfile.mkdtemp(prefix="spotify-startup-")}
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, "-m", "benchmarks.startup", "--worker", page],
+                              cwd=ROOT, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            sys.exit(f"{page} failed:\n{proc.stderr[-2000:]}")
+        runs.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+    return min(runs, key=lambda r: r["seconds"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", nargs="+", help="default: every page")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per page; the fastest counts")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply every budget by this")
+    parser.add_argument("--out", type=Path, help="write results as JSON")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(measure(args.worker)))
+        return
+    # Imported here so workers start without the stub server's NumPy import.
+    from benchmarks.run import PAGES
+
+    results, problems = [], []
+    print(f"{'page':<32}{'import s':>10}{'budget s':>10}  eagerly loaded")
+    for page in args.pages or PAGES:
+        result = run_page(page, args.repeat)
+        result["budget"] = IMPORT_BUDGETS.get(page, max(IMPORT_BUDGETS.values())) * args.scale
+        results.append(result)
+        print(f"{page:<32}{result['seconds']:>10.3f}{result['budget']:>10.2f}  {', '.join(result['loaded']) or '-'}")
+        if result["seconds"] > result["budget"]:
+            problems.append(f"{page}: imports take {result['seconds']:.3f} s, budget {result['budget']:.2f} s")
+        if result["loaded"]:
+            problems.append(f"{page}: imports {', '.join(result['loaded'])} before rendering")
+
+    if args.out:
+        args.out.write_text(json.dumps(results, indent=2))
+    for problem in problems:
+        print(f"OVER BUDGET {problem}")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
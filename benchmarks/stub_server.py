@@ -0,0 +1,360 @@
+"""Local stand-in for the Spotify Web API, serving a synthetic library.
+
+Every object is derived from its index and a seed, so a library of 100k
+tracks and 1k playlists costs a few NumPy arrays rather than 100k dicts, and
+two runs with the same arguments see exactly the same data. Latency and 429
+responses can be injected to exercise the client's limiter and retries.
+
+Run it on its own and point the app at it:
+
+    python -m benchmarks.stub_server --tracks 10000 --playlists 1000
+    SPOTIFY_API_PREFIX=http://127.0.0.1:8765/v1/ SPOTIFY_ACCESS_TOKEN=stub \\
+        streamlit run app.py
+"""
+import argparse
+import functools
+import json
+import random
+import struct
+import threading
+import time
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import numpy as np
+
+USER_ID = "stub-user"
+NOW = datetime(2026, 1, 1, tzinfo=timezone.utc)
+GENRE_STYLES = ["indie", "dark", "dream", "alt", "neo", "chamber", "lo-fi", "modern", "classic", "nu"]
+GENRE_BASES = ["pop", "rock", "folk", "jazz", "house", "techno", "hip hop", "r&b", "soul", "metal",
+               "punk", "country", "ambient", "disco", "trap"]
+GENRES = GENRE_BASES + [f"{style} {base}" for style in GENRE_STYLES for base in GENRE_BASES]
+FEATURES = ["danceability", "energy", "valence", "acousticness", "instrumentalness", "speechiness", "liveness"]
+TOP_LIMIT = 50
+IMAGE_SIZE = 640  # Spotify's largest cover size
+
+
+def spotify_id(kind: str, i: int) -> str:
+    """22-character ID whose first letter names the kind and the rest is the index."""
+    return f"{kind[0]}{i:021d}"
+
+
+def index_of(spotify_id: str) -> int:
+    return int(spotify_id[1:])
+
+
+def _iso(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+@functools.lru_cache(maxsize=256)
+def _png(rgb: tuple[int, int, int], size: int = 64) -> bytes:
+    """A solid-colour PNG, so image URLs resolve without any imaging library."""
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data))
+    row = b"\x00" + bytes(rgb) * size
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * size)) + chunk(b"IEND", b""))
+
+
+class SyntheticLibrary:
+    def __init__(self, tracks: int = 1000, playlists: int = 50, playlist_size: int = 100,
+                 audio_features: bool = True, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.n_tracks = tracks
+        self.n_artists = max(50, tracks // 10)
+        self.n_albums = max(30, tracks // 8)
+        self.n_playlists = playlists
+        self.audio_features_enabled = audio_features
+        self.base_url = ""
+
+        self.track_artist = rng.integers(0, self.n_artists, tracks)
+        self.track_album = rng.integers(0, self.n_albums, tracks)
+        self.track_popularity = rng.integers(0, 101, tracks)
+        self.track_duration = rng.integers(90_000, 420_000, tracks)
+        self.features = rng.random((tracks, len(FEATURES)), dtype=np.float32)
+        self.tempo = rng.uniform(60, 190, tracks)
+        self.loudness = rng.uniform(-30, 0, tracks)
+        self.artist_popularity = rng.integers(0, 101, self.n_artists)
+        self.artist_followers = rng.integers(0, 5_000_000, self.n_artists)
+        self.artist_genres = [
+            sorted(rng.choice(len(GENRES), rng.integers(0, 5), replace=False).tolist())
+            for _ in range(self.n_artists)
+        ]
+        self.playlist_sizes = rng.integers(1, 2 * playlist_size, playlists)
+        self.playlist_snapshots = ["s1"] * playlists
+
+    # ── Objects ────────────────────────────────────────────────────────────
+
+    def image(self, kind: str, i: int) -> list[dict]:
+        return [{"url": f"{self.base_url}images/{kind}-{i}.png", "height": IMAGE_SIZE, "width": IMAGE_SIZE}]
+
+    def artist_ref(self, i: int) -> dict:
+        return {"id": spotify_id("artist", i), "name": f"Artist {i}", "type": "artist"}
+
+    def artist(self, i: int) -> dict:
+        return {
+            **self.artist_ref(i),
+            "genres": [GENRES[g] for g in self.artist_genres[i]],
+            "popularity": int(self.artist_popularity[i]),
+            "followers": {"total": int(self.artist_followers[i])},
+            "images": self.image("artist", i),
+            "external_urls": {"spotify": f"https://open.spotify.com/artist/{spotify_id('artist', i)}"},
+        }
+
+    def track(self, i: int) -> dict:
+        album = int(self.track_album[i])
+        artist = int(self.track_artist[i])
+        # Every fifth track is a collaboration with the next artist.
+        artists = [self.artist_ref(artist)] + ([self.artist_ref((artist + 1) % self.n_artists)] if i % 5 == 0 else [])
+        return {
+            "id": spotify_id("track", i),
+            "name": f"Track {i}",
+            "type": "track",
+            "artists": artists,
+            "album": {"id": spotify_id("album", album), "name": f"Album {album}", "images": self.image("album", album)},
+            "popularity": int(self.track_popularity[i]),
+            "duration_ms": int(self.track_duration[i]),
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{spotify_id('track', i)}"},
+        }
+
+    def audio_features(self, i: int) -> dict:
+        return {
+            "id": spotify_id("track", i),
+            **{name: float(v) for name, v in zip(FEATURES, self.features[i])},
+            "tempo": float(self.tempo[i]),
+            "loudness": float(self.loudness[i]),
+        }
+
+    def playlist(self, j: int) -> dict:
+        return {
+            "id": spotify_id("playlist", j),
+            "name": f"Playlist {j}",
+            "snapshot_id": self.playlist_snapshots[j],
+            "tracks": {"total": int(self.playlist_sizes[j])},
+            "images": self.image("playlist", j),
+            "owner": {"id": USER_ID, "display_name": "Stub User"},
+        }
+
+    def playlist_track(self, j: int, k: int) -> int:
+        return (j * 7919 + k * 104_729) % self.n_tracks
+
+    def saved_item(self, i: int) -> dict:
+        return {"added_at": _iso(NOW - timedelta(hours=7 * i)), "track": self.track(i)}
+
+    def recently_played(self, limit: int, after: int | None) -> list[dict]:
+        items = []
+        for n in range(limit):
+            played_at = NOW - timedelta(minutes=4 * n)
+            if after is not None and played_at.timestamp() * 1000 <= after:
+                break
+            items.append({
+                "played_at": played_at.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+                "track": self.track((n * 31) % self.n_tracks),
+            })
+        return items
+
+    def profile(self) -> dict:
+        return {
+            "id": USER_ID,
+            "display_name": "Stub User",
+            "images": [],
+            "followers": {"total": 42},
+            "country": "US",
+            "product": "premium",
+            "external_urls": {"spotify": f"https://open.spotify.com/user/{USER_ID}"},
+        }
+
+
+class StubState:
+    """Library plus injected faults and per-endpoint request counts."""
+
+    def __init__(self, library: SyntheticLibrary, latency: float = 0.0, rate_429: float = 0.0, seed: int = 0,
+                 rate_503: float = 0.0, retry_after: float = 1):
+        self.library = library
+        self.latency = latency
+        self.rate_429 = rate_429
+        self.rate_503 = rate_503
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.throttled = 0
+        self.failed = 0
+        self.images = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str) -> int | None:
+        """Count a request; the error status (429 or 503) to answer it with, if any."""
+        with self._lock:
+            self.calls[endpoint] += 1
+            if self._random.random() < self.rate_429:
+                self.throttled += 1
+                return 429
+            if self.rate_503 and self._random.random() < self.rate_503:
+                self.failed += 1
+                return 503
+            return None
+
+    def record_image(self):
+        with self._lock:
+            self.images += 1
+
+    def stats(self, reset: bool = False) -> dict:
+        with self._lock:
+            stats = {"calls": dict(self.calls), "total": sum(self.calls.values()), "throttled": self.throttled,
+                     "failed": self.failed, "images": self.images}
+            if reset:
+                self.calls.clear()
+                self.throttled = 0
+                self.failed = 0
+                self.images = 0
+            return stats
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # headers and body go out separately; avoid 40 ms delayed-ACK stalls
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json", headers: dict | None = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, payload, status: int = 200, headers: dict | None = None):
+        self._send(status, json.dumps(payload, separators=(",", ":")).encode(), headers=headers)
+
+    def _page(self, path: str, params: dict, total: int, item, default_limit: int = 20, max_limit: int = 50) -> dict:
+        limit = min(int(params.get("limit", default_limit)), max_limit)
+        offset = int(params.get("offset", 0))
+        stop = min(offset + limit, total)
+
+        def link(new_offset):
+            return f"{self.state.library.base_url}{path}?{urlencode({**params, 'offset': new_offset, 'limit': limit})}"
+        return {
+            "href": link(offset),
+            "items": [item(i) for i in range(offset, stop)],
+            "limit": limit,
+            "offset": offset,
+            "total": total,
+            "next": link(stop) if stop < total else None,
+            "previous": link(max(0, offset - limit)) if offset else None,
+        }
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = url.path.removeprefix("/v1/").strip("/")
+        lib = self.state.library
+
+        if path == "_stats":
+            return self._json(self.state.stats(reset="reset" in params))
+        if path.startswith("images/"):
+            self.state.record_image()
+            i = int(path.rsplit("-", 1)[1].removesuffix(".png"))
+            return self._send(200, _png(((i * 67) % 256, (i * 151) % 256, (i * 23) % 256), IMAGE_SIZE), "image/png")
+
+        endpoint = "/".join(p for p in path.split("/") if not (len(p) == 22 and p[1:].isdigit()))
+        status = self.state.record(endpoint)
+        if status == 429:
+            return self._json({"error": {"status": 429, "message": "API rate limit exceeded"}}, 429,
+                              {"Retry-After": f"{self.state.retry_after:g}"})
+        if status == 503:
+            return self._json({"error": {"status": 503, "message": "Service unavailable"}}, 503)
+        if self.state.latency:
+            time.sleep(self.state.latency)
+
+        ids = [i for i in params.get("ids", "").split(",") if i]
+        parts = path.split("/")
+        if path == "me":
+            return self._json(lib.profile())
+        if path == "me/top/artists":
+            shift = ["short_term", "medium_term", "long_term"].index(params.get("time_range", "medium_term"))
+            total = min(TOP_LIMIT, lib.n_artists)
+            return self._json(self._page(path, params, total, lambda i: lib.artist((i + 7 * shift) % lib.n_artists)))
+        if path == "me/top/tracks":
+            shift = ["short_term", "medium_term", "long_term"].index(params.get("time_range", "medium_term"))
+            total = min(TOP_LIMIT, lib.n_tracks)
+            return self._json(self._page(path, params, total, lambda i: lib.track((i + 11 * shift) % lib.n_tracks)))
+        if path == "me/tracks":
+            return self._json(self._page(path, params, lib.n_tracks, lib.saved_item))
+        if path == "me/playlists":
+            return self._json(self._page(path, params, lib.n_playlists, lib.playlist))
+        if len(parts) == 3 and parts[0] == "playlists" and parts[2] in ("tracks", "items"):
+            j = index_of(parts[1])
+            return self._json(self._page(
+                path, params, int(lib.playlist_sizes[j]),
+                lambda k: {"added_at": _iso(NOW - timedelta(days=k)), "track": lib.track(lib.playlist_track(j, k))},
+                default_limit=100, max_limit=100,
+            ))
+        if path == "me/player/recently-played":
+            after = int(params["after"]) if "after" in params else None
+            items = lib.recently_played(min(int(params.get("limit", 20)), 50), after)
+            newest = str(int(NOW.timestamp() * 1000)) if items else None
+            return self._json({"items": items, "cursors": {"after": newest, "before": None}, "next": None})
+        if path == "artists":
+            return self._json({"artists": [lib.artist(index_of(i)) for i in ids]})
+        if path == "tracks":
+            return self._json({"tracks": [lib.track(index_of(i)) for i in ids]})
+        if path == "audio-features":
+            if not lib.audio_features_enabled:
+                return self._json({"error": {"status": 403, "message": "Forbidden"}}, 403)
+            return self._json({"audio_features": [lib.audio_features(index_of(i)) for i in ids]})
+        return self._json({"error": {"status": 404, "message": f"No stub for {path}"}}, 404)
+
+
+def start_stub_server(state: StubState, host: str = "127.0.0.1", port: int = 0) -> tuple[ThreadingHTTPServer, str]:
+    """Serve `state` from a daemon thread; returns the server and its API prefix."""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    prefix = f"http://{host}:{server.server_address[1]}/v1/"
+    state.library.base_url = prefix
+    threading.Thread(target=server.serve_forever, name="spotify-stub", daemon=True).start()
+    return server, prefix
+
+
+def add_library_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--tracks", type=int, default=1000, help="saved tracks (100 to 100k)")
+    parser.add_argument("--playlists", type=int, default=50)
+    parser.add_argument("--playlist-size", type=int, default=100, help="average tracks per playlist")
+    parser.add_argument("--no-audio-features", action="store_true", help="answer /audio-features with 403")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="delay added to every API response")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--rate-503", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def state_from_args(args) -> StubState:
+    library = SyntheticLibrary(args.tracks, args.playlists, args.playlist_size,
+                               audio_features=not args.no_audio_features, seed=args.seed)
+    return StubState(library, latency=args.latency_ms / 1000, rate_429=args.rate_429, seed=args.seed,
+                     rate_503=args.rate_503)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    add_library_arguments(parser)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    server, prefix = start_stub_server(state_from_args(args), port=args.port)
+    print(f"Stub Spotify API at {prefix} (stats: {prefix}_stats)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,144 @@
+"""Headless entry point: sync Spotify data and precompute the dashboard's tables.
+
+    python main.py sync           # library sync and recent plays
+    python main.py precompute     # write the bundle the pages read at startup
+    python main.py refresh        # both; e.g. from cron:  0 5 * * *  cd /app && python main.py refresh
+
+Single-user mode uses the token in .cache, so log in through the dashboard
+once first. With SPOTIFY_MULTI_USER set, every user with a stored token
+(.data/tokens/) is processed, or only those given with --user.
+"""
+import argparse
+import functools
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from spotipy.cache_handler import CacheFileHandler
+
+from utils.auth import SCOPES, ManagedOAuth, UserTokenHandler
+from utils.bundle import BundleWriter
+from utils.cache import get_response_cache
+from utils.client import SpotifyClient
+from utils.config import MULTI_USER, TOKEN_DIR
+from utils.history import open_history, record_recent_plays
+from utils.library import open_library, sync_library
+from utils.tables import (
+    feature_table, playlist_summaries, playlist_table, saved_timeline_table, top_artist_table, top_track_table,
+)
+from utils.top_items import TIME_RANGES, resolve_top_items
+
+WORKERS = 8
+
+
+def oauth(cache_handler) -> ManagedOAuth:
+    return ManagedOAuth(
+        client_id=os.getenv("SPOTIFY_CLIENT_ID"),
+        client_secret=os.getenv("SPOTIFY_CLIENT_SECRET"),
+        redirect_uri=os.getenv("SPOTIPY_REDIRECT_URI", "http://localhost:8888/callback"),
+        scope=SCOPES,
+        cache_handler=cache_handler,
+        open_browser=False,
+    )
+
+
+def clients(user_ids: list[str] | None) -> list[SpotifyClient]:
+    """One client per user to process, authenticated the way the dashboard would be."""
+    if os.getenv("SPOTIFY_ACCESS_TOKEN"):
+        # A fixed bearer token skips OAuth; used with the offline stub API in benchmarks/.
+        return [SpotifyClient(auth=os.getenv("SPOTIFY_ACCESS_TOKEN"), cache=get_response_cache())]
+    if MULTI_USER:
+        user_ids = user_ids or sorted(path.stem for path in TOKEN_DIR.glob("*.json"))
+        if not user_ids:
+            sys.exit(f"No stored tokens in {TOKEN_DIR}; log in through the dashboard first.")
+        try:
+            handlers = [UserTokenHandler.load(user_id) for user_id in user_ids]
+        except FileNotFoundError as e:
+            sys.exit(f"No stored token for that user ({e.filename}); log in through the dashboard first.")
+        return [SpotifyClient(auth_manager=oauth(handler), cache=get_response_cache()) for handler in handlers]
+    handler = CacheFileHandler(cache_path=".cache")
+    if handler.get_cached_token() is None:
+        sys.exit("No token in .cache; run the dashboard and log in first.")
+    return [SpotifyClient(auth_manager=oauth(handler), cache=get_response_cache())]
+
+
+def connect(sp: SpotifyClient) -> str:
+    """The client's user ID; user endpoints are cached under it from here on, as in the dashboard."""
+    user_id = sp.current_user()["id"]
+    sp.user_scope = user_id
+    return user_id
+
+
+def sync(sp, user_id: str, full: bool = False) -> dict:
+    """Library sync and recent-plays recording, side by side."""
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        library = pool.submit(sync_library, sp, open_library(user_id), full)
+        plays = pool.submit(record_recent_plays, sp, open_history(user_id))
+        return {**library.result(), "plays": plays.result()}
+
+
+def precompute(sp, user_id: str, workers: int = WORKERS) -> dict:
+    """Build every page table from the synced library and write them as the user's bundle."""
+    library = open_library(user_id)
+    if library.last_synced() is None:
+        sync_library(sp, library)
+    top = resolve_top_items(sp, library=library)
+    playlists = playlist_summaries(library.playlists())
+
+    # (table, key, builder); each builder runs on the pool and its result is written as it finishes.
+    jobs = [
+        ("playlists", None, lambda: playlists),
+        ("saved_tracks", None, lambda: saved_timeline_table(sp, library.saved_tracks())),
+    ]
+    for time_range in TIME_RANGES:
+        jobs += [
+            ("top_artists", time_range, functools.partial(top_artist_table, top[("artists", time_range)])),
+            ("top_tracks", time_range, functools.partial(top_track_table, top[("tracks", time_range)])),
+            ("audio_features", time_range, functools.partial(feature_table, sp, top[("tracks", time_range)])),
+        ]
+    for playlist in playlists:
+        jobs.append(("playlist_tracks", playlist["id"],
+                     functools.partial(lambda pid: playlist_table(sp, library.playlist_tracks(pid)), playlist["id"])))
+
+    writer = BundleWriter(user_id)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(lambda name, key, build: writer.add(name, build(), key), *job) for job in jobs]
+        for future in futures:
+            future.result()
+    return writer.commit()
+
+
 def main():
-    print("Hello from spotify-exploration!")
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    for name, summary in [
+        ("sync", "bring the local library and listening history up to date"),
+        ("precompute", "write the page tables to a bundle the dashboard reads"),
+        ("refresh", "sync, then precompute"),
+    ]:
+        command = commands.add_parser(name, help=summary, description=summary)
+        command.add_argument("--user", dest="users", action="append", help="multi-user mode: only this user (repeatable)")
+        if name != "precompute":
+            command.add_argument("--full", action="store_true", help="resync every saved track, not just new ones")
+        if name != "sync":
+            command.add_argument("--workers", type=int, default=WORKERS, help="tables built in parallel")
+    args = parser.parse_args()
+
+    for sp in clients(args.users):
+        user_id = connect(sp)
+        if args.command in ("sync", "refresh"):
+            start = time.perf_counter()
+            result = sync(sp, user_id, full=args.full)
+            print(f"{user_id}: synced {result['saved_tracks']} saved tracks, {result['playlists']} playlists, "
+                  f"{result['artists']} artists and {result['plays']} plays in {time.perf_counter() - start:.1f} s")
+        if args.command in ("precompute", "refresh"):
+            start = time.perf_counter()
+            manifest = precompute(sp, user_id, workers=args.workers)
+            print(f"{user_id}: wrote {len(manifest['tables'])} tables ({sum(manifest['tables'].values()):,} rows) "
+                  f"in {time.perf_counter() - start:.1f} s")
 
 
 if __name__ == "__main__":
@@ -1,9 +1,22 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
+import functools
+import numpy as np
+from utils.bundle import open_bundle
+from utils.genres import get_genre_index
+from utils.history import open_history
+from utils.lazy import lazy_import
+from utils.library import open_library
+from utils.metrics import begin_page, render_diagnostics, timed_cache_data
+from utils.tables import top_artist_table, top_track_table
+from utils.thumbnails import get_thumbnail_cache
+from utils.top_items import resolve_top_items
+
+pd = lazy_import("pandas")
+px = lazy_import("plotly.express")
+go = lazy_import("plotly.graph_objects")
 
 st.set_page_config(page_title="Top Charts", page_icon="📊", layout="wide")
+begin_page()
 
 st.markdown("""
     <style>
@@ -13,11 +26,17 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-if "sp" not in st.session_state:
+if "user_id" not in st.session_state:
     st.error("Not connected to Spotify. Please go back to the Home page first.")
     st.stop()
 
 sp = st.session_state.sp
+user_id = st.session_state.user_id
+library = open_library(user_id)
+synced_at = library.last_synced()
+changed_at = library.last_changed()
+bundle = open_bundle(user_id, changed_at=changed_at)
+prefetched = st.session_state.get("top_items")
 
 SPOTIFY_GREEN = "#1DB954"
 CHART_TEMPLATE = "plotly_dark"
@@ -29,53 +48,48 @@ TIME_RANGES = {
 }
 
 
-@st.cache_data(ttl=3600)
-def fetch_top_artists(time_range: str, limit: int = 20):
-    results = sp.current_user_top_artists(limit=limit, time_range=time_range)
-    rows = []
-    for i, artist in enumerate(results["items"], 1):
-        genres = artist.get("genres", [])
-        rows.append({
-            "rank": i,
-            "name": artist["name"],
-            "popularity": artist["popularity"],
-            "followers": artist["followers"]["total"],
-            "genres": genres,
-            "primary_genre": genres[0] if genres else "Unknown",
-            "image_url": artist["images"][0]["url"] if artist["images"] else None,
-            "spotify_url": artist["external_urls"]["spotify"],
-        })
-    return pd.DataFrame(rows)
-
-
-@st.cache_data(ttl=3600)
-def fetch_top_tracks(time_range: str, limit: int = 20):
-    results = sp.current_user_top_tracks(limit=limit, time_range=time_range)
-    rows = []
-    for i, track in enumerate(results["items"], 1):
-        rows.append({
-            "rank": i,
-            "name": track["name"],
-            "artist": ", ".join(a["name"] for a in track["artists"]),
-            "album": track["album"]["name"],
-            "popularity": track["popularity"],
-            "duration_ms": track["duration_ms"],
-            "duration_min": round(track["duration_ms"] / 60000, 2),
-            "image_url": track["album"]["images"][0]["url"] if track["album"]["images"] else None,
-            "spotify_url": track["external_urls"]["spotify"],
-        })
-    return pd.DataFrame(rows)
-
-
-def genre_counts(artists_df: pd.DataFrame) -> pd.DataFrame:
-    all_genres = [g for genres in artists_df["genres"] for g in genres]
-    return (
-        pd.Series(all_genres)
-        .value_counts()
-        .reset_index()
-        .rename(columns={"index": "genre", 0: "count", "count": "count"})
-        .head(15)
-    )
+@functools.cache
+def top_items() -> dict[tuple[str, str], list[dict]]:
+    """The prefetched top lists; only waited on when the bundle doesn't have a table."""
+    return resolve_top_items(sp, prefetched, library)
+
+
+@timed_cache_data(ttl=3600)
+def fetch_top_artists(user_id: str, time_range: str, limit: int = 20):
+    bundled = bundle.frame("top_artists", time_range) if bundle else None
+    if bundled is not None:
+        return bundled.head(limit)
+    return top_artist_table(top_items()[("artists", time_range)][:limit])
+
+
+@timed_cache_data(ttl=3600)
+def fetch_top_tracks(user_id: str, time_range: str, limit: int = 20):
+    bundled = bundle.frame("top_tracks", time_range) if bundle else None
+    if bundled is not None:
+        return bundled.head(limit)
+    return top_track_table(top_items()[("tracks", time_range)][:limit])
+
+
+def genre_counts(artists_df: "pd.DataFrame") -> "pd.DataFrame":
+    index = get_genre_index()
+    return index.genre_share(index.rows_for(artists_df["id"]), top=15)
+
+
+@timed_cache_data(ttl=3600)
+def library_genres(user_id: str, changed_at: float):
+    """Genre share and co-occurrence over every artist in the library, weighted by tracks."""
+    counts = library.artist_track_counts()
+    index = get_genre_index()
+    rows = index.rows_for(counts)
+    weights = np.fromiter(counts.values(), float, len(counts))
+    return index.genre_share(rows, weights, top=20), index.cooccurrence(rows, weights, top=12)
+
+
+@timed_cache_data(ttl=300)
+def history_genres(user_id: str, plays: int):
+    """Monthly plays per genre across the recorded history."""
+    months, artists, matrix = open_history(user_id).cube().monthly_totals("artists")
+    return get_genre_index().genre_over_time(months, artists, matrix)
 
 
 # ── Layout ────────────────────────────────────────────────────────────────────
@@ -90,8 +104,8 @@ time_label = st.radio(
 )
 time_range = TIME_RANGES[time_label]
 
-artists_df = fetch_top_artists(time_range)
-tracks_df = fetch_top_tracks(time_range)
+artists_df = fetch_top_artists(user_id, time_range)
+tracks_df = fetch_top_tracks(user_id, time_range)
 
 st.divider()
 
@@ -123,11 +137,12 @@ with col_chart:
 
 with col_cards:
     st.markdown("**Your top 5**")
+    covers = get_thumbnail_cache().prefetch(artists_df.head(5)["image_url"], width=56)
     for _, row in artists_df.head(5).iterrows():
         c1, c2 = st.columns([1, 3])
         with c1:
             if row["image_url"]:
-                st.image(row["image_url"], width=56)
+                st.image(covers.get(row["image_url"], row["image_url"]), width=56)
         with c2:
             st.markdown(f"**#{row['rank']} [{row['name']}]({row['spotify_url']})**")
             st.caption(row["primary_genre"].title() if row["primary_genre"] != "Unknown" else "")
@@ -162,11 +177,12 @@ with col_tchart:
 
 with col_tcards:
     st.markdown("**Your top 5**")
+    covers = get_thumbnail_cache().prefetch(tracks_df.head(5)["image_url"], width=56)
     for _, row in tracks_df.head(5).iterrows():
         c1, c2 = st.columns([1, 3])
         with c1:
             if row["image_url"]:
-                st.image(row["image_url"], width=56)
+                st.image(covers.get(row["image_url"], row["image_url"]), width=56)
         with c2:
             st.markdown(f"**#{row['rank']} [{row['name']}]({row['spotify_url']})**")
             st.caption(row["artist"])
@@ -212,3 +228,65 @@ with col_bar:
         margin=dict(l=0, r=0, t=10, b=0),
     )
     st.plotly_chart(fig4, use_container_width=True)
+
+# ── Genres Across Your Library ────────────────────────────────────────────────
+
+history_plays = len(open_history(user_id).cube())
+
+if synced_at or history_plays:
+    st.divider()
+    st.subheader("🧬 Genres Beyond Your Top Artists")
+
+    tab_names = (["Library share", "Genres that go together"] if synced_at else []) + (["Over time"] if history_plays else [])
+    tabs = dict(zip(tab_names, st.tabs(tab_names)))
+
+    if synced_at:
+        share_df, co_df = library_genres(user_id, changed_at)
+        with tabs["Library share"]:
+            st.caption("Every artist in your saved tracks and playlists, weighted by how many of their tracks you have.")
+            fig5 = px.bar(
+                share_df,
+                x="share",
+                y="genre",
+                orientation="h",
+                color="share",
+                color_continuous_scale=[[0, "#191414"], [1, SPOTIFY_GREEN]],
+                template=CHART_TEMPLATE,
+                labels={"share": "Share of library", "genre": ""},
+            )
+            fig5.update_layout(
+                yaxis={"categoryorder": "total ascending"},
+                xaxis_tickformat=".0%",
+                coloraxis_showscale=False,
+                margin=dict(l=0, r=0, t=10, b=0),
+                height=520,
+            )
+            st.plotly_chart(fig5, use_container_width=True)
+        with tabs["Genres that go together"]:
+            st.caption("How many library tracks come from artists tagged with both genres.")
+            fig6 = px.imshow(
+                co_df,
+                color_continuous_scale=[[0, "#191414"], [1, SPOTIFY_GREEN]],
+                template=CHART_TEMPLATE,
+                aspect="auto",
+            )
+            fig6.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=520, coloraxis_showscale=False)
+            st.plotly_chart(fig6, use_container_width=True)
+
+    if history_plays:
+        with tabs["Over time"]:
+            st.caption("Monthly plays from your recorded listening history, by genre of the artist.")
+            over_time = history_genres(user_id, history_plays)
+            fig7 = px.area(
+                over_time,
+                x="month",
+                y="plays",
+                color="genre",
+                template=CHART_TEMPLATE,
+                color_discrete_sequence=px.colors.sequential.Greens_r,
+                labels={"month": "", "plays": "Plays", "genre": ""},
+            )
+            fig7.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=420)
+            st.plotly_chart(fig7, use_container_width=True)
+
+render_diagnostics("Top Charts")
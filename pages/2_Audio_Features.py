@@ -1,10 +1,18 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import spotipy
+from utils.bundle import open_bundle
+from utils.figures import bin_counts, dataset_hash, histogram_figure, mood_map, mood_map_mode
+from utils.lazy import lazy_import
+from utils.library import open_library
+from utils.metrics import begin_page, render_diagnostics, timed_cache_resource
+from utils.swr import freshness_label, replacing, swr_cache
+from utils.tables import feature_table
+from utils.top_items import fetch_top_list, resolve_top_items
+
+pd = lazy_import("pandas")
+go = lazy_import("plotly.graph_objects")
 
 st.set_page_config(page_title="Audio Features", page_icon="🎵", layout="wide")
+begin_page()
 
 st.markdown("""
     <style>
@@ -14,11 +22,14 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-if "sp" not in st.session_state:
+if "user_id" not in st.session_state:
     st.error("Not connected to Spotify. Please go back to the Home page first.")
     st.stop()
 
 sp = st.session_state.sp
+user_id = st.session_state.user_id
+library = open_library(user_id)
+prefetched = st.session_state.get("top_items")
 
 SPOTIFY_GREEN = "#1DB954"
 CHART_TEMPLATE = "plotly_dark"
@@ -35,6 +46,9 @@ FEATURE_DESCRIPTIONS = {
 
 RADAR_FEATURES = ["danceability", "energy", "valence", "acousticness", "instrumentalness", "speechiness"]
 
+# Column -> (bins, value range); None means the data's own min and max.
+DISTRIBUTION_BINS = {**{feat: (15, (0.0, 1.0)) for feat in RADAR_FEATURES}, "tempo": (20, None), "loudness": (20, None)}
+
 TIME_RANGES = {
     "Last 4 weeks": "short_term",
     "Last 6 months": "medium_term",
@@ -42,45 +56,45 @@ TIME_RANGES = {
 }
 
 
-@st.cache_data(ttl=3600)
-def fetch_tracks_with_features(time_range: str, limit: int = 50):
-    results = sp.current_user_top_tracks(limit=limit, time_range=time_range)
-    tracks = results["items"]
-    if not tracks:
-        return pd.DataFrame()
-
-    ids = [t["id"] for t in tracks]
-    # Fetch in batches of 100 (API limit)
-    features = []
-    try:
-        for i in range(0, len(ids), 100):
-            batch = sp.audio_features(ids[i:i+100])
-            if batch:
-                features.extend([f for f in batch if f])
-    except spotipy.exceptions.SpotifyException as e:
-        if e.http_status == 403:
-            return pd.DataFrame()
-        raise
-
-    feature_map = {f["id"]: f for f in features}
-
-    rows = []
-    for track in tracks:
-        feat = feature_map.get(track["id"])
-        if not feat:
-            continue
-        rows.append({
-            "name": track["name"],
-            "artist": ", ".join(a["name"] for a in track["artists"]),
-            "popularity": track["popularity"],
-            "image_url": track["album"]["images"][0]["url"] if track["album"]["images"] else None,
-            "spotify_url": track["external_urls"]["spotify"],
-            **{k: feat[k] for k in RADAR_FEATURES},
-            "tempo": feat["tempo"],
-            "loudness": feat["loudness"],
-            "duration_min": round(track["duration_ms"] / 60000, 2),
-        })
-    return pd.DataFrame(rows)
+@swr_cache(ttl=3600)
+def fetch_tracks_with_features(user_id: str, time_range: str, limit: int = 50):
+    # A refresh only uses a bundle written since the value it replaces, and
+    # asks Spotify rather than the session's prefetch, which never changes.
+    previous = replacing()
+    bundle = open_bundle(user_id, changed_at=library.last_changed())
+    if bundle and (previous is None or bundle.created_at > previous):
+        bundled = bundle.frame("audio_features", time_range)
+        if bundled is not None:
+            return bundled.head(limit)
+    if previous is None:
+        tracks = resolve_top_items(sp, prefetched, library)[("tracks", time_range)]
+    else:
+        tracks = fetch_top_list(sp.fresh(), "tracks", time_range)
+    return feature_table(sp, tracks[:limit])
+
+
+@timed_cache_resource(max_entries=32)
+def distribution_figures(data_hash: str, _df: "pd.DataFrame") -> dict:
+    """Histogram figures per feature, built once per distinct dataset and shared across reruns."""
+    figures = {}
+    for feat in RADAR_FEATURES:
+        figures[feat] = histogram_figure(
+            *bin_counts(_df[feat].to_numpy(), *DISTRIBUTION_BINS[feat]),
+            color=SPOTIFY_GREEN, template=CHART_TEMPLATE, x_label=feat.capitalize(),
+            title=dict(text=feat.capitalize(), font=dict(size=13)), margin=dict(l=0, r=0, t=30, b=0), height=200,
+        )
+        figures[feat].update_xaxes(range=[0, 1])
+    figures["tempo"] = histogram_figure(
+        *bin_counts(_df["tempo"].to_numpy(), *DISTRIBUTION_BINS["tempo"]),
+        color=SPOTIFY_GREEN, template=CHART_TEMPLATE, x_label="BPM",
+        title="Tempo Distribution (BPM)", margin=dict(l=0, r=0, t=40, b=0), height=280,
+    )
+    figures["loudness"] = histogram_figure(
+        *bin_counts(_df["loudness"].to_numpy(), *DISTRIBUTION_BINS["loudness"]),
+        color=SPOTIFY_GREEN, template=CHART_TEMPLATE, x_label="Loudness (dB)",
+        title="Loudness Distribution (dB)", margin=dict(l=0, r=0, t=40, b=0), height=280,
+    )
+    return figures
 
 
 # ── Layout ────────────────────────────────────────────────────────────────────
@@ -91,7 +105,11 @@ st.caption("The sonic fingerprint of your taste.")
 time_label = st.radio("Time range", list(TIME_RANGES.keys()), horizontal=True, index=1)
 time_range = TIME_RANGES[time_label]
 
-df = fetch_tracks_with_features(time_range)
+df = fetch_tracks_with_features(user_id, time_range)
+st.caption(freshness_label(
+    fetch_tracks_with_features.last_refreshed(user_id, time_range),
+    fetch_tracks_with_features.is_refreshing(user_id, time_range),
+))
 
 if df.empty:
     st.warning(
@@ -141,36 +159,12 @@ st.divider()
 # ── Mood Quadrant ─────────────────────────────────────────────────────────────
 
 st.subheader("😊 Mood Quadrant")
-st.caption("Valence (happiness) vs Energy. Each dot is one of your top tracks.")
-
-fig_mood = px.scatter(
-    df,
-    x="valence",
-    y="energy",
-    hover_name="name",
-    hover_data={"artist": True, "valence": ":.2f", "energy": ":.2f"},
-    color="danceability",
-    color_continuous_scale=[[0, "#191414"], [1, SPOTIFY_GREEN]],
-    size="popularity",
-    size_max=20,
-    template=CHART_TEMPLATE,
-    labels={"valence": "Valence (sad → happy)", "energy": "Energy (calm → intense)"},
-)
-
-# Quadrant labels
-for x, y, label in [
-    (0.15, 0.85, "Angry / Intense"),
-    (0.75, 0.85, "Happy / Energetic"),
-    (0.15, 0.15, "Sad / Calm"),
-    (0.75, 0.15, "Peaceful / Content"),
-]:
-    fig_mood.add_annotation(x=x, y=y, text=label, showarrow=False,
-                             font=dict(color="#535353", size=11))
-
-fig_mood.add_hline(y=0.5, line_dash="dot", line_color="#535353")
-fig_mood.add_vline(x=0.5, line_dash="dot", line_color="#535353")
-fig_mood.update_layout(height=480, margin=dict(l=0, r=0, t=10, b=0))
-st.plotly_chart(fig_mood, use_container_width=True)
+mood_mode = mood_map_mode(len(df))
+if mood_mode == "density":
+    st.caption(f"Valence (happiness) vs Energy for {len(df):,} tracks. Click a cell or drag a box to list its tracks.")
+else:
+    st.caption("Valence (happiness) vs Energy. Each dot is one of your top tracks.")
+mood_map(df, mood_mode, key=f"mood_cells_{time_range}", color=SPOTIFY_GREEN, template=CHART_TEMPLATE)
 
 st.divider()
 
@@ -179,26 +173,12 @@ st.divider()
 st.subheader("📊 Feature Distributions")
 st.caption("How your top tracks are spread across each audio feature.")
 
+figures = distribution_figures(dataset_hash(df, list(DISTRIBUTION_BINS)), df)
+
 cols = st.columns(3)
 for i, feat in enumerate(RADAR_FEATURES):
     with cols[i % 3]:
-        fig_hist = px.histogram(
-            df,
-            x=feat,
-            nbins=15,
-            template=CHART_TEMPLATE,
-            color_discrete_sequence=[SPOTIFY_GREEN],
-            labels={feat: feat.capitalize()},
-        )
-        fig_hist.update_layout(
-            showlegend=False,
-            margin=dict(l=0, r=0, t=30, b=0),
-            height=200,
-            title=dict(text=feat.capitalize(), font=dict(size=13)),
-            bargap=0.05,
-        )
-        fig_hist.update_xaxes(range=[0, 1])
-        st.plotly_chart(fig_hist, use_container_width=True)
+        st.plotly_chart(figures[feat], use_container_width=True)
 
 st.divider()
 
@@ -209,25 +189,11 @@ st.subheader("🥁 Tempo & Loudness")
 col_t, col_l = st.columns(2, gap="large")
 
 with col_t:
-    fig_tempo = px.histogram(
-        df, x="tempo", nbins=20,
-        template=CHART_TEMPLATE,
-        color_discrete_sequence=[SPOTIFY_GREEN],
-        labels={"tempo": "BPM"},
-        title="Tempo Distribution (BPM)",
-    )
-    fig_tempo.update_layout(showlegend=False, margin=dict(l=0, r=0, t=40, b=0), height=280)
-    st.plotly_chart(fig_tempo, use_container_width=True)
+    st.plotly_chart(figures["tempo"], use_container_width=True)
     st.caption(f"Average tempo: **{df['tempo'].mean():.0f} BPM**")
 
 with col_l:
-    fig_loud = px.histogram(
-        df, x="loudness", nbins=20,
-        template=CHART_TEMPLATE,
-        color_discrete_sequence=[SPOTIFY_GREEN],
-        labels={"loudness": "Loudness (dB)"},
-        title="Loudness Distribution (dB)",
-    )
-    fig_loud.update_layout(showlegend=False, margin=dict(l=0, r=0, t=40, b=0), height=280)
-    st.plotly_chart(fig_loud, use_container_width=True)
+    st.plotly_chart(figures["loudness"], use_container_width=True)
     st.caption(f"Average loudness: **{df['loudness'].mean():.1f} dB**")
+
+render_diagnostics("Audio Features")
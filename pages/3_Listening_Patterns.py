@@ -1,10 +1,24 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime, timezone
+import io
+import pyarrow as pa
+from utils.aggregates import CUBE_COLUMNS, ListeningCube, last_days, year_window
+from utils.bundle import open_bundle
+from utils.history import open_history
+from utils.lazy import lazy_import
+from utils.library import open_library
+from utils.metrics import begin_page, render_diagnostics
+from utils.streaming_import import import_streaming_history
+from utils.swr import freshness_label, swr_cache
+from utils.tables import recent_play_table, saved_timeline_table
+from utils.thumbnails import get_thumbnail_cache
+from utils.tracks import with_display_columns
+
+pd = lazy_import("pandas")
+px = lazy_import("plotly.express")
+go = lazy_import("plotly.graph_objects")
 
 st.set_page_config(page_title="Listening Patterns", page_icon="🕐", layout="wide")
+begin_page()
 
 st.markdown("""
     <style>
@@ -16,11 +30,16 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-if "sp" not in st.session_state:
+if "user_id" not in st.session_state:
     st.error("Not connected to Spotify. Please go back to the Home page first.")
     st.stop()
 
 sp = st.session_state.sp
+user_id = st.session_state.user_id
+library = open_library(user_id)
+synced = library.last_synced() is not None
+history = open_history(user_id)
+bundle = open_bundle(user_id, changed_at=library.last_changed())
 
 SPOTIFY_GREEN = "#1DB954"
 CHART_TEMPLATE = "plotly_dark"
@@ -28,48 +47,22 @@ CHART_TEMPLATE = "plotly_dark"
 DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
 
 
-@st.cache_data(ttl=1800)
-def fetch_recently_played(limit: int = 50):
-    results = sp.current_user_recently_played(limit=limit)
-    rows = []
-    for item in results["items"]:
-        track = item["track"]
-        played_at = datetime.fromisoformat(item["played_at"].replace("Z", "+00:00"))
-        rows.append({
-            "name": track["name"],
-            "artist": ", ".join(a["name"] for a in track["artists"]),
-            "album": track["album"]["name"],
-            "played_at": played_at,
-            "hour": played_at.hour,
-            "day": played_at.strftime("%A"),
-            "day_num": played_at.weekday(),
-            "date": played_at.date(),
-            "image_url": track["album"]["images"][0]["url"] if track["album"]["images"] else None,
-            "spotify_url": track["external_urls"]["spotify"],
-            "duration_ms": track["duration_ms"],
-        })
-    return pd.DataFrame(rows)
-
-
-@st.cache_data(ttl=3600)
-def fetch_saved_tracks_timeline(limit: int = 50):
-    """Fetch recently saved tracks with added_at timestamps."""
-    results = sp.current_user_saved_tracks(limit=limit)
-    rows = []
-    for item in results["items"]:
-        track = item["track"]
-        added_at = datetime.fromisoformat(item["added_at"].replace("Z", "+00:00"))
-        artists = sp.artists([a["id"] for a in track["artists"][:1]])
-        genres = artists["artists"][0].get("genres", []) if artists["artists"] else []
-        rows.append({
-            "name": track["name"],
-            "artist": ", ".join(a["name"] for a in track["artists"]),
-            "added_at": added_at,
-            "date": added_at.date(),
-            "month": added_at.strftime("%Y-%m"),
-            "genres": genres,
-        })
-    return pd.DataFrame(rows)
+@swr_cache(ttl=1800)
+def fetch_recently_played(user_id: str, limit: int = 50):
+    return recent_play_table(sp.current_user_recently_played(limit=limit)["items"])
+
+
+@swr_cache(ttl=3600)
+def fetch_saved_tracks_timeline(user_id: str, limit: int | None = 50):
+    """Fetch recently saved tracks with added_at timestamps (all of them when limit is None)."""
+    bundled = bundle.frame("saved_tracks") if bundle else None
+    if bundled is not None:
+        return bundled if limit is None else bundled.head(limit)
+    if synced:
+        items = library.saved_tracks(limit)
+    else:
+        items = sp.current_user_saved_tracks(limit=limit or 50)["items"]
+    return saved_timeline_table(sp, items)
 
 
 # ── Layout ────────────────────────────────────────────────────────────────────
@@ -79,25 +72,47 @@ st.caption("When you listen, what you discover, and how your library grew.")
 
 st.divider()
 
-recent_df = fetch_recently_played()
+recent_df = fetch_recently_played(user_id)
+st.caption(freshness_label(fetch_recently_played.last_refreshed(user_id), fetch_recently_played.is_refreshing(user_id)))
+
+# The recorder's history covers far more than the API's last 50 plays; use its
+# aggregates for the stats and heatmap once it has caught up.
+cube = history.cube()
+if len(cube) <= len(recent_df):
+    cube = ListeningCube()
+    cube.add(pa.Table.from_pandas(recent_df[CUBE_COLUMNS], preserve_index=False))
+
+window_options = {"All time": (None, None)}
+span = cube.span()
+if span and len(cube) > len(recent_df):
+    window_options["Last 30 days"] = last_days(30)
+    window_options["Last 12 months"] = last_days(365)
+    for year in range(span[1].year, span[0].year - 1, -1):
+        window_options[str(year)] = year_window(year)
+    col_caption, col_window = st.columns([3, 1])
+    with col_window:
+        window_label = st.selectbox("Period", list(window_options), label_visibility="collapsed")
+    with col_caption:
+        st.caption(f"Based on {len(cube):,} recorded plays since {span[0]:%b %d, %Y}.")
+else:
+    window_label = "All time"
+start, end = window_options[window_label]
+summary = cube.summary(start, end)
 
 # ── Summary stats ─────────────────────────────────────────────────────────────
 
 m1, m2, m3, m4 = st.columns(4)
 with m1:
-    st.markdown(f"<div class='big-number'>{len(recent_df)}</div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='big-number'>{summary['plays']:,}</div>", unsafe_allow_html=True)
     st.markdown("<div class='stat-label'>Tracks in history</div>", unsafe_allow_html=True)
 with m2:
-    unique_artists = recent_df["artist"].nunique()
-    st.markdown(f"<div class='big-number'>{unique_artists}</div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='big-number'>{summary['artists']}</div>", unsafe_allow_html=True)
     st.markdown("<div class='stat-label'>Unique artists</div>", unsafe_allow_html=True)
 with m3:
-    total_min = recent_df["duration_ms"].sum() // 60000
-    st.markdown(f"<div class='big-number'>{total_min}</div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='big-number'>{summary['minutes']}</div>", unsafe_allow_html=True)
     st.markdown("<div class='stat-label'>Minutes listened</div>", unsafe_allow_html=True)
 with m4:
-    unique_tracks = recent_df["name"].nunique()
-    st.markdown(f"<div class='big-number'>{unique_tracks}</div>", unsafe_allow_html=True)
+    st.markdown(f"<div class='big-number'>{summary['tracks']}</div>", unsafe_allow_html=True)
     st.markdown("<div class='stat-label'>Unique tracks</div>", unsafe_allow_html=True)
 
 st.divider()
@@ -107,22 +122,11 @@ st.divider()
 st.subheader("🗓️ When Do You Listen?")
 st.caption("Listening activity by hour of day and day of week.")
 
-if not recent_df.empty:
-    heat_data = (
-        recent_df.groupby(["day_num", "hour"])
-        .size()
-        .reset_index(name="plays")
-    )
-    pivot = heat_data.pivot(index="day_num", columns="hour", values="plays").fillna(0)
-    pivot.index = [DAYS[i] for i in pivot.index]
-    # Fill missing hours
-    for h in range(24):
-        if h not in pivot.columns:
-            pivot[h] = 0
-    pivot = pivot[sorted(pivot.columns)]
+if summary["plays"]:
+    grid = cube.heatmap(start, end)
 
     fig_heat = px.imshow(
-        pivot,
+        pd.DataFrame(grid, index=DAYS, columns=range(24)),
         color_continuous_scale=[[0, "#191414"], [0.3, "#1a4a28"], [1, SPOTIFY_GREEN]],
         template=CHART_TEMPLATE,
         labels={"x": "Hour of day", "y": "Day", "color": "Plays"},
@@ -142,8 +146,8 @@ if not recent_df.empty:
     st.plotly_chart(fig_heat, use_container_width=True)
 
     # Peak hour callout
-    peak_hour = int(recent_df["hour"].mode()[0])
-    peak_day = recent_df["day"].mode()[0]
+    peak_hour = int(grid.sum(axis=0).argmax())
+    peak_day = DAYS[int(grid.sum(axis=1).argmax())]
     st.info(f"🎧 Your peak listening time is around **{peak_hour:02d}:00** and you listen most on **{peak_day}s**.")
 
 st.divider()
@@ -154,11 +158,13 @@ st.subheader("⏱️ Recently Played")
 
 show_n = st.slider("Show last N tracks", min_value=10, max_value=50, value=20, step=5)
 
-for _, row in recent_df.head(show_n).iterrows():
+feed = with_display_columns(recent_df.head(show_n))
+covers = get_thumbnail_cache().prefetch(feed["image_url"], width=48)
+for _, row in feed.iterrows():
     c1, c2, c3 = st.columns([1, 5, 2])
     with c1:
         if row["image_url"]:
-            st.image(row["image_url"], width=48)
+            st.image(covers.get(row["image_url"], row["image_url"]), width=48)
     with c2:
         st.markdown(f"**[{row['name']}]({row['spotify_url']})**")
         st.caption(row["artist"])
@@ -169,15 +175,20 @@ st.divider()
 
 # ── Library Timeline ──────────────────────────────────────────────────────────
 
-st.subheader("📚 Recently Saved to Library")
-st.caption("Your last 50 liked songs and when you added them.")
+if synced:
+    st.subheader("📚 Your Library Over Time")
+    st.caption("Every liked song, by the month you added it.")
+else:
+    st.subheader("📚 Recently Saved to Library")
+    st.caption("Your last 50 liked songs and when you added them. Sync your library on the Home page to see all of them.")
 
 try:
-    saved_df = fetch_saved_tracks_timeline()
+    saved_df = fetch_saved_tracks_timeline(user_id, limit=None if synced else 50)
 
     if not saved_df.empty:
-        daily = saved_df.groupby("date").size().reset_index(name="tracks_added")
-        daily["date"] = pd.to_datetime(daily["date"])
+        period = "month" if synced else "date"
+        daily = saved_df.groupby(period).size().reset_index(name="tracks_added")
+        daily["date"] = pd.to_datetime(daily[period])
 
         fig_timeline = px.bar(
             daily,
@@ -210,3 +221,22 @@ try:
 
 except Exception as e:
     st.warning(f"Could not load saved tracks timeline: {e}")
+
+# ── Import Streaming History ──────────────────────────────────────────────────
+
+st.divider()
+with st.expander("📥 Import your full streaming history"):
+    st.caption(
+        "Request your data at spotify.com/account/privacy, then upload the "
+        "`StreamingHistory*.json` or `endsong_*.json` / `Streaming_History_Audio_*.json` files. "
+        "Plays already recorded are skipped."
+    )
+    uploads = st.file_uploader("Streaming history files", type="json", accept_multiple_files=True)
+    if uploads and st.button("Import"):
+        imported = 0
+        with st.spinner("Importing plays..."):
+            for upload in uploads:
+                imported += import_streaming_history(io.TextIOWrapper(upload, encoding="utf-8"), history)
+        st.success(f"Imported {imported:,} new plays.")
+
+render_diagnostics("Listening Patterns")
@@ -1,11 +1,26 @@
 import streamlit as st
-import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 import numpy as np
-import spotipy
+import time
+from utils.bundle import open_bundle
+from utils.catalog import get_catalog
+from utils.compare import build_playlist_matrix, compare_playlists, top_pairs
+from utils.figures import mood_map, mood_map_mode
+from utils.lazy import lazy_import
+from utils.library import open_library
+from utils.metrics import begin_page, end_section, render_diagnostics, timed_cache_data, timed_cache_resource
+from utils.paginate import paginate
+from utils.search import SearchIndex
+from utils.swr import freshness_label, swr_cache
+from utils.tables import playlist_summaries, playlist_table
+from utils.thumbnails import data_uri, get_thumbnail_cache
+from utils.tracks import memory_report, with_display_columns
+
+pd = lazy_import("pandas")
+px = lazy_import("plotly.express")
+go = lazy_import("plotly.graph_objects")
 
 st.set_page_config(page_title="Playlist Analysis", page_icon="🎧", layout="wide")
+begin_page()
 
 st.markdown("""
     <style>
@@ -17,92 +32,121 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-if "sp" not in st.session_state:
+if "user_id" not in st.session_state:
     st.error("Not connected to Spotify. Please go back to the Home page first.")
     st.stop()
 
 sp = st.session_state.sp
+user_id = st.session_state.user_id
+library = open_library(user_id)
+synced = library.last_synced() is not None
+bundle = open_bundle(user_id, changed_at=library.last_changed())
 
 SPOTIFY_GREEN = "#1DB954"
 CHART_TEMPLATE = "plotly_dark"
 AUDIO_FEATURES = ["danceability", "energy", "valence", "acousticness", "instrumentalness", "speechiness"]
+PAGE_SIZES = [25, 50, 100, 250]
+TABLE_THUMBNAIL_WIDTH = 40
 
 
-@st.cache_data(ttl=3600)
-def fetch_playlists():
-    playlists = []
-    results = sp.current_user_playlists(limit=50)
-    while results:
-        for p in results["items"]:
-            if p and p.get("tracks", {}).get("total", 0) > 0:
-                playlists.append({
-                    "id": p["id"],
-                    "name": p["name"],
-                    "total_tracks": p["tracks"]["total"],
-                    "image_url": p["images"][0]["url"] if p.get("images") else None,
-                    "owner": p["owner"]["display_name"],
-                })
-        results = sp.next(results) if results["next"] else None
-    return playlists
-
-
-@st.cache_data(ttl=3600)
-def fetch_playlist_tracks(playlist_id: str):
+@swr_cache(ttl=3600)
+def fetch_playlists(user_id: str):
+    bundled = bundle.rows("playlists") if bundle else None
+    if bundled is not None:
+        return bundled
+    if synced:
+        items = library.playlists()
+    else:
+        items = paginate(lambda offset, limit: sp.current_user_playlists(limit=limit, offset=offset), limit=50)
+    return playlist_summaries(items)
+
+
+def load_playlist_tracks(playlist_id: str):
+    """Not cached itself: build_playlist_df's cache covers it, so a refresh reads current tracks."""
+    if synced:
+        return library.playlist_tracks(playlist_id)
+    items = paginate(
+        lambda offset, limit: sp.playlist_items(
+            playlist_id, limit=limit, offset=offset, additional_types=("track",)
+        ),
+        limit=100,
+    )
     tracks = []
-    results = sp.playlist_tracks(playlist_id, limit=100)
-    while results:
-        for item in results["items"]:
-            track = item.get("track")
-            if track and track.get("id"):
-                tracks.append(track)
-        results = sp.next(results) if results["next"] else None
+    for item in items:
+        track = item.get("track")
+        if track and track.get("id"):
+            tracks.append(track)
     return tracks
 
 
-@st.cache_data(ttl=3600)
-def build_playlist_df(playlist_id: str):
-    tracks = fetch_playlist_tracks(playlist_id)
-    if not tracks:
-        return pd.DataFrame()
-
-    ids = [t["id"] for t in tracks]
-    features = []
-    has_audio = True
-    try:
-        for i in range(0, len(ids), 100):
-            batch = sp.audio_features(ids[i:i+100])
-            if batch:
-                features.extend([f for f in batch if f])
-    except spotipy.exceptions.SpotifyException as e:
-        if e.http_status == 403:
-            has_audio = False
-        else:
-            raise
-
-    feat_map = {f["id"]: f for f in features}
-
-    rows = []
-    for track in tracks:
-        row = {
-            "name": track["name"],
-            "artist": ", ".join(a["name"] for a in track["artists"]),
-            "album": track["album"]["name"],
-            "popularity": track["popularity"],
-            "duration_min": round(track["duration_ms"] / 60000, 2),
-            "image_url": track["album"]["images"][0]["url"] if track["album"]["images"] else None,
-            "spotify_url": track["external_urls"]["spotify"],
-        }
-        if has_audio:
-            feat = feat_map.get(track["id"])
-            if feat:
-                row.update({k: feat[k] for k in AUDIO_FEATURES})
-                row["tempo"] = feat["tempo"]
-                row["loudness"] = feat["loudness"]
-        rows.append(row)
-    return pd.DataFrame(rows)
-
-
-def diversity_score(df: pd.DataFrame) -> float:
+@swr_cache(ttl=3600)
+def build_playlist_df(user_id: str, playlist_id: str):
+    bundled = bundle.frame("playlist_tracks", playlist_id) if bundle else None
+    if bundled is not None:
+        return bundled
+    return playlist_table(sp, load_playlist_tracks(playlist_id))
+
+
+@timed_cache_data(ttl=3600)
+def build_library_comparison(user_id: str, playlists: list[dict]):
+    """Compare every synced playlist in one pass over the membership bitset."""
+    memberships = library.playlist_memberships()
+    feature_map = get_catalog().audio_features(sp, {t for _, t in memberships})
+    matrix = build_playlist_matrix([p["id"] for p in playlists], memberships, feature_map, AUDIO_FEATURES)
+    result = compare_playlists(matrix)
+    names = [p["name"] for p in playlists]
+
+    overlap = pd.DataFrame([
+        {"Playlist A": names[i], "Playlist B": names[j],
+         "Shared tracks": int(result["intersections"][i, j]), "Overlap": v}
+        for i, j, v in top_pairs(result["jaccard"], 25) if v > 0
+    ])
+    similar = pd.DataFrame([
+        {"Playlist A": names[i], "Playlist B": names[j], "Sound distance": v}
+        for i, j, v in top_pairs(result["distances"], 25, largest=False)
+    ]) if feature_map is not None else pd.DataFrame()
+
+    counts = result["track_counts"]
+    shared = np.flatnonzero(counts > 1)
+    shared = shared[np.argsort(-counts[shared], kind="stable")][:25]
+    tracks = library.tracks(matrix.track_ids[shared])
+    duplicates = pd.DataFrame([
+        {"Track": tracks[t]["name"], "Artist": ", ".join(a["name"] for a in tracks[t]["artists"]),
+         "Playlists": int(counts[i])}
+        for i, t in zip(shared, matrix.track_ids[shared]) if t in tracks
+    ])
+
+    largest = np.argsort(-result["sizes"], kind="stable")[:30]
+    heatmap = pd.DataFrame(
+        result["jaccard"][np.ix_(largest, largest)],
+        index=[names[i] for i in largest],
+        columns=[names[i] for i in largest],
+    )
+    return {
+        "playlists": len(playlists),
+        "tracks": len(matrix.track_ids),
+        "shared_tracks": int((counts > 1).sum()),
+        "repeats": int(matrix.repeats.sum()),
+        "overlap": overlap,
+        "similar": similar,
+        "duplicates": duplicates,
+        "heatmap": heatmap,
+    }
+
+
+@timed_cache_resource(ttl=3600, max_entries=16)
+def playlist_search_index(user_id: str, playlist_id: str, refreshed_at: float, _df: "pd.DataFrame") -> SearchIndex:
+    """Built once per playlist from build_playlist_df's output and reused across reruns."""
+    return SearchIndex(_df["name"], _df["artist"])
+
+
+@timed_cache_data(ttl=3600, max_entries=16)
+def playlist_memory(user_id: str, playlist_id: str, refreshed_at: float, _df: "pd.DataFrame") -> dict[str, int]:
+    """The table's memory report, worked out once per loaded playlist for the caption."""
+    return memory_report(_df)
+
+
+def diversity_score(df: "pd.DataFrame") -> float:
     """0–100 score based on std deviation across audio features."""
     if df.empty or len(df) < 2:
         return 0.0
@@ -118,12 +162,76 @@ st.caption("Explore the mood, energy, and diversity of your playlists.")
 st.divider()
 
 with st.spinner("Loading your playlists..."):
-    playlists = fetch_playlists()
+    playlists = fetch_playlists(user_id)
 
 if not playlists:
     st.warning("No playlists found.")
     st.stop()
 
+mode = st.radio("View", ["Single playlist", "All playlists"], horizontal=True)
+
+# ── All Playlists ─────────────────────────────────────────────────────────────
+
+if mode == "All playlists":
+    if not synced:
+        st.info("Comparing all playlists needs a local copy of your library. Sync it from the Home page first.")
+        st.stop()
+
+    with st.spinner("Comparing all playlists..."):
+        comparison = build_library_comparison(user_id, playlists)
+
+    m1, m2, m3, m4 = st.columns(4)
+    for col, value, label in [
+        (m1, comparison["playlists"], "Playlists compared"),
+        (m2, comparison["tracks"], "Unique tracks"),
+        (m3, comparison["shared_tracks"], "Tracks in 2+ playlists"),
+        (m4, comparison["repeats"], "Repeats within a playlist"),
+    ]:
+        with col:
+            st.markdown(f"<div class='big-number'>{value:,}</div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='stat-label'>{label}</div>", unsafe_allow_html=True)
+
+    st.divider()
+
+    st.subheader("🔗 Playlist Overlap")
+    st.caption("Share of tracks two playlists have in common (Jaccard), for your 30 largest playlists.")
+    fig_overlap = px.imshow(
+        comparison["heatmap"],
+        color_continuous_scale=[[0, "#191414"], [0.3, "#1a4a28"], [1, SPOTIFY_GREEN]],
+        template=CHART_TEMPLATE,
+        labels={"color": "Overlap"},
+        aspect="auto",
+    )
+    fig_overlap.update_layout(height=560, margin=dict(l=0, r=0, t=10, b=0))
+    st.plotly_chart(fig_overlap, use_container_width=True)
+
+    col_overlap, col_similar = st.columns(2, gap="large")
+    with col_overlap:
+        st.markdown("**Most overlapping pairs**")
+        st.dataframe(
+            comparison["overlap"],
+            column_config={"Overlap": st.column_config.ProgressColumn("Overlap", min_value=0, max_value=1, format="%.2f")},
+            hide_index=True,
+            use_container_width=True,
+        )
+    with col_similar:
+        st.markdown("**Most similar-sounding pairs**")
+        if comparison["similar"].empty:
+            st.caption("Needs audio features, which Spotify no longer serves to this app.")
+        else:
+            st.dataframe(
+                comparison["similar"],
+                column_config={"Sound distance": st.column_config.NumberColumn(format="%.3f")},
+                hide_index=True,
+                use_container_width=True,
+            )
+
+    st.markdown("**Tracks saved in the most playlists**")
+    st.dataframe(comparison["duplicates"], hide_index=True, use_container_width=True)
+    st.stop()
+
+# ── Single Playlist ───────────────────────────────────────────────────────────
+
 # Playlist picker
 playlist_options = {p["name"]: p for p in playlists}
 selected_name = st.selectbox(
@@ -136,7 +244,7 @@ selected = playlist_options[selected_name]
 col_img, col_meta = st.columns([1, 5], gap="large")
 with col_img:
     if selected["image_url"]:
-        st.image(selected["image_url"], width=110)
+        st.image(get_thumbnail_cache().fetch(selected["image_url"], 110) or selected["image_url"], width=110)
 with col_meta:
     st.markdown(f"## {selected['name']}")
     st.caption(f"By {selected['owner']}  ·  {selected['total_tracks']} tracks")
@@ -144,7 +252,12 @@ with col_meta:
 st.divider()
 
 with st.spinner("Fetching tracks and audio features..."):
-    df = build_playlist_df(selected["id"])
+    df, df_refreshed_at = build_playlist_df.with_refreshed(user_id, selected["id"])
+
+st.caption(freshness_label(
+    df_refreshed_at,
+    build_playlist_df.is_refreshing(user_id, selected["id"]),
+))
 
 if df.empty:
     st.warning("No track data available for this playlist.")
@@ -168,8 +281,9 @@ with m2:
     st.markdown(f"<div class='big-number'>{df['artist'].nunique()}</div>", unsafe_allow_html=True)
     st.markdown("<div class='stat-label'>Unique artists</div>", unsafe_allow_html=True)
 with m3:
-    total_h = int(df["duration_min"].sum() // 60)
-    total_m = int(df["duration_min"].sum() % 60)
+    total_min = df["duration_ms"].sum() / 60000
+    total_h = int(total_min // 60)
+    total_m = int(total_min % 60)
     st.markdown(f"<div class='big-number'>{total_h}h {total_m}m</div>", unsafe_allow_html=True)
     st.markdown("<div class='stat-label'>Total duration</div>", unsafe_allow_html=True)
 with m4:
@@ -187,35 +301,14 @@ st.divider()
 
 if has_audio:
     st.subheader("😊 Mood Map")
-    st.caption("Every track plotted by happiness (valence) and energy. Dot size = popularity.")
-
-    fig_mood = px.scatter(
-        df,
-        x="valence",
-        y="energy",
-        hover_name="name",
-        hover_data={"artist": True, "valence": ":.2f", "energy": ":.2f", "danceability": ":.2f"},
-        color="danceability",
-        color_continuous_scale=[[0, "#191414"], [1, SPOTIFY_GREEN]],
-        size="popularity",
-        size_max=22,
-        template=CHART_TEMPLATE,
-        labels={"valence": "Valence (sad → happy)", "energy": "Energy (calm → intense)"},
-    )
-
-    for x, y, label in [
-        (0.12, 0.88, "Angry / Intense"),
-        (0.75, 0.88, "Happy / Energetic"),
-        (0.12, 0.12, "Sad / Calm"),
-        (0.75, 0.12, "Peaceful / Content"),
-    ]:
-        fig_mood.add_annotation(x=x, y=y, text=label, showarrow=False,
-                                 font=dict(color="#535353", size=11))
-
-    fig_mood.add_hline(y=0.5, line_dash="dot", line_color="#535353")
-    fig_mood.add_vline(x=0.5, line_dash="dot", line_color="#535353")
-    fig_mood.update_layout(height=460, margin=dict(l=0, r=0, t=10, b=0))
-    st.plotly_chart(fig_mood, use_container_width=True)
+    mood_mode = mood_map_mode(len(df))
+    if mood_mode == "density":
+        st.caption(f"{len(df):,} tracks binned by happiness (valence) and energy. "
+                   "Click a cell or drag a box to list the tracks in it.")
+    else:
+        st.caption("Every track plotted by happiness (valence) and energy. Dot size = popularity.")
+    mood_map(df, mood_mode, key=f"mood_cells_{selected['id']}", color=SPOTIFY_GREEN, template=CHART_TEMPLATE,
+             height=460)
 
     st.divider()
 
@@ -251,32 +344,63 @@ if has_audio:
 
 # ── Track List ────────────────────────────────────────────────────────────────
 
+section_start = time.perf_counter()
 st.subheader("🎵 Track List")
 
-search = st.text_input("Search tracks", placeholder="Filter by name or artist...")
-display_df = df.copy()
+col_search, col_fuzzy = st.columns([5, 1], vertical_alignment="bottom")
+with col_search:
+    search = st.text_input("Search tracks", placeholder="Filter by name or artist...")
+with col_fuzzy:
+    fuzzy = st.toggle("Fuzzy", help="Also match close spellings, e.g. typos.")
+
+display_df = df
 if search:
-    mask = (
-        display_df["name"].str.contains(search, case=False, na=False) |
-        display_df["artist"].str.contains(search, case=False, na=False)
+    index = playlist_search_index(user_id, selected["id"], df_refreshed_at, df)
+    display_df = df.iloc[index.search(search, fuzzy=fuzzy)]
+
+# One st.dataframe per page of rows keeps render cost flat however long the playlist is.
+col_size, col_page, col_info = st.columns([1, 1, 3])
+with col_size:
+    page_size = st.selectbox("Rows per page", PAGE_SIZES, index=1)
+n_pages = max(1, -(-len(display_df) // page_size))
+with col_page:
+    page = st.number_input("Page", min_value=1, max_value=n_pages, value=1, step=1)
+first_row = (page - 1) * page_size
+page_df = with_display_columns(display_df.iloc[first_row:first_row + page_size])
+covers = get_thumbnail_cache().prefetch(page_df["image_url"], width=TABLE_THUMBNAIL_WIDTH)
+page_df["image_url"] = [data_uri(covers[url]) if url in covers else url for url in page_df["image_url"]]
+
+if has_audio:
+    table_columns = ["image_url", "name", "artist", "energy", "valence", "danceability", "duration_min", "spotify_url"]
+else:
+    table_columns = ["image_url", "name", "artist", "popularity", "duration_min", "spotify_url"]
+
+st.dataframe(
+    page_df[table_columns],
+    column_config={
+        "image_url": st.column_config.ImageColumn("", width="small"),
+        "name": st.column_config.TextColumn("Track"),
+        "artist": st.column_config.TextColumn("Artist"),
+        "energy": st.column_config.NumberColumn("Energy", format="%.2f"),
+        "valence": st.column_config.NumberColumn("Valence", format="%.2f"),
+        "danceability": st.column_config.NumberColumn("Dance", format="%.2f"),
+        "popularity": st.column_config.NumberColumn("Popularity"),
+        "duration_min": st.column_config.NumberColumn("Minutes", format="%.1f"),
+        "spotify_url": st.column_config.LinkColumn("", display_text="Open ↗"),
+    },
+    hide_index=True,
+    use_container_width=True,
+)
+# Search, cover thumbnails and the table's serialization; the browser draws it afterwards.
+section_ms = end_section("Track List", section_start) * 1000
+
+with col_info:
+    st.caption(
+        f"Showing {min(first_row + 1, len(display_df))}–{first_row + len(page_df)} of {len(display_df)} tracks "
+        f"· page {page}/{n_pages} prepared in {section_ms:.0f} ms on the server"
     )
-    display_df = display_df[mask]
-
-for _, row in display_df.iterrows():
-    c1, c2, c3, c4 = st.columns([1, 4, 2, 2])
-    with c1:
-        if row["image_url"]:
-            st.image(row["image_url"], width=48)
-    with c2:
-        st.markdown(f"**[{row['name']}]({row['spotify_url']})**")
-        st.caption(row["artist"])
-    with c3:
-        if has_audio:
-            st.caption(f"Energy: {row['energy']:.2f}  ·  Valence: {row['valence']:.2f}")
-        else:
-            st.caption(f"Popularity: {row['popularity']}")
-    with c4:
-        if has_audio:
-            st.caption(f"Dance: {row['danceability']:.2f}  ·  {row['duration_min']:.1f} min")
-        else:
-            st.caption(f"{row['duration_min']:.1f} min")
+    if not df.empty:
+        mem = playlist_memory(user_id, selected["id"], df_refreshed_at, df)
+        st.caption(f"Table uses {mem['after'] / 2**20:.2f} MB in memory (untyped: {mem['before'] / 2**20:.2f} MB)")
+
+render_diagnostics("Playlist Analysis")
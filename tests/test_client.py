@@ -0,0 +1,148 @@
+"""SpotifyClient against the local stub API: rate limiting, retries and coalescing.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import threading
+import time
+import unittest
+from unittest import mock
+
+import spotipy
+
+from benchmarks.stub_server import StubState, SyntheticLibrary, spotify_id, start_stub_server
+from utils import paginate
+from utils.client import Coalescer, SpotifyClient, TokenBucket
+from utils.metrics import METRICS
+from utils.paginate import MAX_RETRIES, with_backoff
+
+
+def stub_client(**faults) -> tuple[SpotifyClient, StubState]:
+    """A client talking to a fresh stub, with its own limiter so tests don't pause each other."""
+    state = StubState(SyntheticLibrary(tracks=200, playlists=2), **faults)
+    server, prefix = start_stub_server(state)
+    sp = SpotifyClient(auth="stub")
+    sp.prefix = prefix
+    sp.limiter = TokenBucket(rate=1000, capacity=50)
+    return sp, state
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_rate(self):
+        bucket = TokenBucket(rate=50, capacity=5)
+        start = time.monotonic()
+        for _ in range(15):
+            bucket.acquire()
+        # 5 tokens are free, the other 10 arrive at 50/s.
+        self.assertAlmostEqual(time.monotonic() - start, 0.2, delta=0.1)
+
+    def test_pause_blocks_everyone(self):
+        bucket = TokenBucket(rate=1000, capacity=10)
+        bucket.pause(0.3)
+        start = time.monotonic()
+        bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.29)
+
+
+class CoalescerTest(unittest.TestCase):
+    def test_concurrent_callers_share_one_call(self):
+        coalescer, calls, results = Coalescer(), [], []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.2)
+            return "done"
+
+        threads = [threading.Thread(target=lambda: results.append(coalescer.run("k", slow))) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["done"] * 8)
+
+    def test_errors_reach_every_caller(self):
+        coalescer, errors = Coalescer(), []
+
+        def failing():
+            time.sleep(0.1)
+            raise ValueError("boom")
+
+        def call():
+            try:
+                coalescer.run("k", failing)
+            except ValueError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=call) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(errors), 4)
+
+
+class StubClientTest(unittest.TestCase):
+    def setUp(self):
+        METRICS.reset()
+
+    def retries(self, reason: str) -> int:
+        return sum(r["count"] for r in METRICS.snapshot()["retries"] if r["reason"] == reason)
+
+    def test_429_waits_for_retry_after_and_succeeds(self):
+        sp, state = stub_client(rate_429=0.3, retry_after=0.2, seed=3)
+        start = time.monotonic()
+        for i in range(10):
+            self.assertEqual(len(sp.artists([spotify_id("artist", i)])["artists"]), 1)
+        throttled = state.stats()["throttled"]
+        self.assertGreater(throttled, 0)
+        self.assertEqual(self.retries("429"), throttled)
+        # Every 429 paused the limiter for its Retry-After.
+        self.assertGreaterEqual(time.monotonic() - start, 0.2 * throttled - 0.05)
+
+    def test_backoff_does_not_retry_the_clients_429s_again(self):
+        sp, state = stub_client(rate_429=1.0, retry_after=0.01)
+        with self.assertRaises(spotipy.exceptions.SpotifyException) as raised:
+            with_backoff(sp.current_user_saved_tracks, limit=50)
+        self.assertEqual(raised.exception.http_status, 429)
+        self.assertEqual(state.stats()["throttled"], MAX_RETRIES + 1)
+        self.assertEqual(self.retries("429"), MAX_RETRIES)
+
+    def test_backoff_retries_429s_without_retry_after(self):
+        responses = [spotipy.exceptions.SpotifyException(429, -1, "slow down", headers={})] * 2 + [{"items": []}]
+
+        def call():
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+
+        with mock.patch.object(paginate, "BASE_DELAY", 0.01):
+            self.assertEqual(with_backoff(call), {"items": []})
+        self.assertEqual(self.retries("429"), 2)
+
+    def test_server_errors_are_not_rate_limits(self):
+        sp, state = stub_client(rate_503=1.0)
+        start = time.monotonic()
+        with self.assertRaises(spotipy.exceptions.SpotifyException) as raised:
+            sp.artists([spotify_id("artist", 1)])
+        self.assertEqual(raised.exception.http_status, 503)
+        self.assertEqual(state.stats()["total"], 4)  # one call and the session's three retries
+        self.assertEqual(self.retries("429"), 0)
+        self.assertEqual(self.retries("5xx"), 3)
+        # The shared limiter was not paused.
+        sp.limiter.acquire()
+        self.assertLess(time.monotonic() - start, 5)
+
+    def test_identical_concurrent_requests_are_coalesced(self):
+        sp, state = stub_client(latency=0.2)
+        ids = [spotify_id("artist", 7)]
+        threads = [threading.Thread(target=sp.artists, args=(ids,)) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(state.stats()["calls"], {"artists": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
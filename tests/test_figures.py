@@ -0,0 +1,29 @@
+"""Mood-map binning in utils.figures.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import unittest
+
+import numpy as np
+
+from utils.figures import MOOD_BINS, NO_CELL, mood_cells, mood_density_figure
+
+
+class MoodCellsTest(unittest.TestCase):
+    def test_cells(self):
+        cells = mood_cells([0.0, 0.99, 1.0, 0.5], [0.0, 0.0, 1.0, 0.05])
+        self.assertEqual(list(cells), [0, MOOD_BINS - 1, MOOD_BINS * MOOD_BINS - 1, MOOD_BINS + MOOD_BINS // 2])
+
+    def test_missing_values_get_no_cell(self):
+        cells = mood_cells(np.array([np.nan, 0.1, 0.2], np.float32), [0.1, np.nan, 0.2])
+        self.assertEqual(list(cells), [NO_CELL, NO_CELL, 4 * MOOD_BINS + 4])
+        # The "Sad / Calm" corner is cell 0; a selection of it must not pick them up.
+        self.assertFalse(np.isin(cells, [0]).any())
+
+    def test_density_counts_only_complete_tracks(self):
+        fig = mood_density_figure([0.1, np.nan, 0.1], [0.1, 0.5, np.nan], color="#1DB954", template="plotly_dark")
+        self.assertEqual([list(point) for point in fig.data[1].customdata], [[2 * MOOD_BINS + 2, 1]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+"""The artist genre index and the catalog version it is keyed on.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from utils import genres
+from utils.catalog import CatalogStore
+
+
+def artist(i: int, *genre_names: str) -> dict:
+    return {"id": f"artist{i}", "name": f"Artist {i}", "genres": list(genre_names)}
+
+
+class GenreIndexTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        path = Path(self._tmp.name) / "catalog.sqlite"
+        # Two stores on one file stand in for the dashboard and `main.py sync`.
+        self.dashboard, self.cli = CatalogStore(path), CatalogStore(path)
+        for patcher in (mock.patch.object(genres, "get_catalog", return_value=self.dashboard),
+                        mock.patch.object(genres, "_index", None)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self._tmp.cleanup)
+
+    def test_artists_written_elsewhere_reach_the_index(self):
+        self.dashboard.put_artists([artist(1, "house")])
+        self.assertEqual(len(genres.get_genre_index()), 1)
+        self.cli.put_artists([artist(2, "techno")])
+        index = genres.get_genre_index()
+        self.assertEqual(index.primary_genres(index.rows_for(["artist1", "artist2"])), ["house", "techno"])
+
+    def test_unchanged_artists_keep_the_index(self):
+        self.dashboard.put_artists([artist(1, "house"), artist(2, "techno")])
+        version = self.dashboard.genre_version
+        index = genres.get_genre_index()
+        self.cli.put_artists([artist(2, "techno"), artist(1, "house")])
+        self.assertEqual(self.dashboard.genre_version, version)
+        self.assertIs(genres.get_genre_index(), index)
+        self.cli.put_artists([artist(2, "techno", "minimal")])
+        self.assertGreater(self.dashboard.genre_version, version)
+        self.assertIsNot(genres.get_genre_index(), index)
+
+
+if __name__ == "__main__":
+    unittest.main()
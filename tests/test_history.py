@@ -0,0 +1,66 @@
+"""HistoryStore's listening cube when several processes append to one store.
+
+Each HistoryStore instance keeps its own in-memory cube, so two instances on
+one directory stand in for the dashboard and the CLI.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import pickle
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
+
+from utils import history
+from utils.aggregates import ListeningCube
+from utils.history import HistoryStore, play_row
+
+START = datetime(2024, 3, 1, 12, tzinfo=timezone.utc)
+
+
+def plays(first: int, count: int) -> list[dict]:
+    return [play_row(START + timedelta(minutes=5 * i), None, f"Track {i}", "Artist", None, 180_000, "api")
+            for i in range(first, first + count)]
+
+
+class CrossProcessCubeTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def total(self, store: HistoryStore) -> int:
+        return store.cube().summary()["plays"]
+
+    def test_appends_from_both_sides_are_counted(self):
+        dashboard, cli = HistoryStore(self.root), HistoryStore(self.root)
+        dashboard.append(plays(0, 3))
+        self.assertEqual(self.total(dashboard), 3)
+        cli.append(plays(3, 4))
+        dashboard.append(plays(7, 2))
+        self.assertEqual(self.total(dashboard), 9)
+        self.assertEqual(self.total(cli), 9)
+        self.assertEqual(self.total(HistoryStore(self.root)), 9)
+
+    def test_compaction_elsewhere(self):
+        dashboard, cli = HistoryStore(self.root), HistoryStore(self.root)
+        dashboard.append(plays(0, 2))
+        self.assertEqual(self.total(dashboard), 2)
+        with mock.patch.object(history, "MAX_FILES_PER_MONTH", 2):
+            for i in range(2, 6):
+                cli.append(plays(i, 1))
+        self.assertEqual(len(list(self.root.glob("month=*/*.parquet"))), 1)  # the dashboard's part was merged too
+        self.assertEqual(self.total(cli), 6)
+        self.assertEqual(self.total(dashboard), 6)
+
+    def test_pickle_without_parts_is_rebuilt(self):
+        HistoryStore(self.root).append(plays(0, 4))
+        (self.root / "cube.pickle").write_bytes(pickle.dumps(ListeningCube()))
+        self.assertEqual(self.total(HistoryStore(self.root)), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+"""Library syncs against the local stub API.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from benchmarks.stub_server import StubState, SyntheticLibrary, start_stub_server
+from utils import artists, library
+from utils.catalog import CatalogStore
+from utils.client import SpotifyClient, TokenBucket
+from utils.library import LibraryStore, sync_library
+
+
+class SyncLibraryTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        root = Path(self._tmp.name)
+        catalog = CatalogStore(root / "catalog.sqlite")
+        for patcher in (mock.patch.object(library, "get_catalog", return_value=catalog),
+                        mock.patch.object(artists, "get_catalog", return_value=catalog),
+                        mock.patch.object(artists, "_cache", {})):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.store = LibraryStore(root / "library.sqlite3", catalog.path)
+
+        self.state = StubState(SyntheticLibrary(tracks=200, playlists=3))
+        server, prefix = start_stub_server(self.state)
+        self.addCleanup(server.shutdown)
+        self.sp = SpotifyClient(auth="stub", cache=None)
+        self.sp.prefix = prefix
+        self.sp.limiter = TokenBucket(rate=1000, capacity=50)
+
+    def test_last_changed_only_moves_on_changes(self):
+        sync_library(self.sp, self.store)
+        changed, synced = self.store.last_changed(), self.store.last_synced()
+        self.assertEqual(changed, synced)
+
+        sync_library(self.sp, self.store)
+        self.assertGreater(self.store.last_synced(), synced)
+        self.assertEqual(self.store.last_changed(), changed)
+
+        self.state.library.playlist_snapshots[1] = "s2"
+        self.assertEqual(sync_library(self.sp, self.store)["playlists"], 1)
+        self.assertGreater(self.store.last_changed(), changed)
+
+    def test_failed_write_rolls_back(self):
+        with mock.patch.object(LibraryStore, "_put_tracks", side_effect=RuntimeError("disk full")):
+            with self.assertRaises(RuntimeError):
+                sync_library(self.sp, self.store)
+        self.assertFalse(self.store._db.in_transaction)
+        self.assertEqual(self.store.saved_tracks(), [])
+        self.assertIsNone(self.store._meta("saved_total"))
+        self.assertEqual(sync_library(self.sp, self.store)["saved_tracks"], 200)
+
+    def test_reads_do_not_wait_on_the_network(self):
+        self.state.latency = 0.1
+        sync = threading.Thread(target=sync_library, args=(self.sp, self.store))
+        started = time.monotonic()
+        sync.start()
+        waits = []
+        while sync.is_alive():
+            t = time.monotonic()
+            self.store.playlists()
+            waits.append(time.monotonic() - t)
+            time.sleep(0.02)
+        self.assertGreater(time.monotonic() - started, 0.5)
+        self.assertLess(max(waits), 0.05)
+        self.assertEqual(len(self.store.playlists()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""Per-run diagnostics in utils.metrics when several sessions share the process.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import metrics
+from utils.metrics import METRICS, begin_page, carry_run
+
+
+def api_calls(m: metrics.Metrics) -> int:
+    return sum(row["count"] for row in m.snapshot()["api"])
+
+
+class PerRunMetricsTest(unittest.TestCase):
+    def setUp(self):
+        METRICS.reset()
+
+    def test_sessions_only_see_their_own_calls(self):
+        runs, ready = {}, threading.Barrier(2)
+
+        def session(name: str, calls: int):
+            begin_page()
+            ready.wait()
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(carry_run(lambda i: METRICS.observe_api("me/tracks", "network", 0.01)), range(calls)))
+            METRICS.count_retry("me/tracks", "429")
+            runs[name] = metrics._run.get()
+
+        threads = [threading.Thread(target=session, args=args) for args in (("a", 3), ("b", 5))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(api_calls(runs["a"]), 3)
+        self.assertEqual(api_calls(runs["b"]), 5)
+        self.assertEqual(len(runs["a"].snapshot()["retries"]), 1)
+        self.assertEqual(api_calls(METRICS), 8)
+
+    def test_each_run_starts_empty(self):
+        counts = []
+
+        def reruns():
+            for calls in (2, 0):
+                begin_page()
+                for _ in range(calls):
+                    METRICS.observe_api("me", "network", 0.01)
+                counts.append(api_calls(metrics._run.get()))
+
+        thread = threading.Thread(target=reruns)
+        thread.start()
+        thread.join()
+        self.assertEqual(counts, [2, 0])
+        self.assertIsNone(metrics._run.get())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+"""Track search in utils.search.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import unittest
+
+from utils.search import SearchIndex
+
+
+class SearchIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.index = SearchIndex([f"Track {i}" for i in range(5000)] + ["Halo"],
+                                [f"Artist {i % 300}" for i in range(5000)] + ["Beyoncé"])
+
+    def test_exact_and_accent_folded(self):
+        self.assertEqual(list(self.index.search("track 1234")), [1234])
+        self.assertEqual(list(self.index.search("BEYONCE")), [5000])
+
+    def test_fuzzy_catches_typos(self):
+        self.assertEqual(list(self.index.search("beyonse")), [])
+        self.assertEqual(list(self.index.search("beyonse", fuzzy=True)), [5000])
+
+    def test_fuzzy_needs_every_word(self):
+        # "trak" is close to a word in every row; "4999" narrows it back down.
+        rows = self.index.search("trak 4999", fuzzy=True)
+        self.assertIn(4999, rows)
+        self.assertLess(len(rows), 50)
+        self.assertLess(len(self.index.search("artst 12", fuzzy=True)), 500)
+
+    def test_fuzzy_keeps_exact_matches(self):
+        self.assertTrue(set(self.index.search("track 12")) <= set(self.index.search("track 12", fuzzy=True)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""Streaming-history import against the export fixtures in tests/fixtures/.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import pyarrow.compute as pc
+
+from utils.history import HistoryStore, api_play_row
+from utils.streaming_import import import_files, import_streaming_history, iter_json_array, normalize_record
+
+FIXTURES = Path(__file__).parent / "fixtures"
+ACCOUNT_DATA = FIXTURES / "StreamingHistory0.json"
+EXTENDED = FIXTURES / "endsong_0.json"
+
+
+class IterJsonArrayTest(unittest.TestCase):
+    def test_records_straddling_chunks(self):
+        for path in (ACCOUNT_DATA, EXTENDED):
+            expected = json.loads(path.read_text(encoding="utf-8"))
+            for chunk_size in (1, 7, 64, 1 << 20):
+                with self.subTest(path=path.name, chunk_size=chunk_size), open(path, encoding="utf-8") as fp:
+                    self.assertEqual(list(iter_json_array(fp, chunk_size=chunk_size)), expected)
+
+    def test_rejects_non_arrays(self):
+        with tempfile.TemporaryFile("w+") as fp:
+            fp.write('{"endTime": "2024-03-01 10:00"}')
+            fp.seek(0)
+            with self.assertRaises(ValueError):
+                list(iter_json_array(fp, chunk_size=4))
+
+
+class NormalizeRecordTest(unittest.TestCase):
+    def test_podcasts_and_blanks_are_skipped(self):
+        records = json.loads(ACCOUNT_DATA.read_text(encoding="utf-8")) + json.loads(EXTENDED.read_text(encoding="utf-8"))
+        skipped = [r for r in records if normalize_record(r) is None]
+        self.assertEqual(len(skipped), 2)
+        self.assertEqual(skipped[0]["trackName"], "")
+        self.assertEqual(skipped[1]["episode_name"], "Episode 12")
+
+    def test_extended_rows_keep_track_ids(self):
+        with open(EXTENDED, encoding="utf-8") as fp:
+            row = normalize_record(next(iter_json_array(fp)))
+        self.assertEqual(row["track_id"], "2VEZx7NWsZ1D0eJ4uv5Fym")
+        self.assertEqual(row["album"], "Discovery")
+        self.assertEqual(row["source"], "export")
+
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.store = HistoryStore(Path(self._tmp.name))
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def import_file(self, path, **kwargs) -> int:
+        with open(path, encoding="utf-8") as fp:
+            return import_streaming_history(fp, self.store, **kwargs)
+
+    def test_same_minute_plays_are_all_kept(self):
+        self.assertEqual(self.import_file(ACCOUNT_DATA), 6)
+        plays = self.store.scan(["played_at", "name"])
+        same_minute = plays.filter(pc.equal(pc.strftime(plays["played_at"], format="%Y-%m-%d %H:%M"), "2024-03-01 10:00"))
+        self.assertEqual(same_minute.num_rows, 3)
+        # Reckoner and Nude land in different month partitions.
+        self.assertEqual(sorted(p.name for p in Path(self._tmp.name).glob("month=*")), ["month=2024-03", "month=2024-04"])
+
+    def test_reimport_writes_nothing(self):
+        self.assertEqual(import_files([ACCOUNT_DATA, EXTENDED], self.store), 9)
+        self.assertEqual(import_files([ACCOUNT_DATA, EXTENDED], self.store), 0)
+        self.assertEqual(self.store.scan(["name"]).num_rows, 9)
+
+    def test_small_batches_match_one_batch(self):
+        self.assertEqual(self.import_file(ACCOUNT_DATA, batch_rows=2), 6)
+        self.assertEqual(self.import_file(ACCOUNT_DATA, batch_rows=1), 0)
+        self.assertEqual(self.import_file(EXTENDED, batch_rows=2), 3)
+
+    def test_both_export_flavours_reconcile(self):
+        self.import_file(ACCOUNT_DATA)
+        # Digital Love is in both files: minute precision in one, seconds in the other.
+        self.assertEqual(self.import_file(EXTENDED), 3)
+        names = self.store.scan(["name"])["name"]
+        self.assertEqual(pc.sum(pc.equal(names, "Digital Love")).as_py(), 1)
+
+    def test_api_plays_reconcile_with_exports(self):
+        self.import_file(EXTENDED)
+        item = {
+            "played_at": "2024-03-01T10:05:37.512Z",
+            "track": {"id": "2VEZx7NWsZ1D0eJ4uv5Fym", "name": "Digital Love", "duration_ms": 301000,
+                      "artists": [{"name": "Daft Punk"}], "album": {"name": "Discovery"}},
+        }
+        self.assertEqual(self.store.append([api_play_row(item)]), 0)
+        later = {**item, "played_at": "2024-03-01T11:00:00.000Z"}
+        self.assertEqual(self.store.append([api_play_row(later)]), 1)
+        self.assertEqual(self.store.append([api_play_row(later)]), 0)
+
+    def test_cube_counts_every_play(self):
+        import_files([ACCOUNT_DATA, EXTENDED], self.store)
+        self.assertEqual(self.store.cube().summary()["plays"], 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+"""Stale-while-revalidate caching in utils.swr.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import time
+import unittest
+
+from utils.swr import replacing, swr_cache
+
+
+class SWRCacheTest(unittest.TestCase):
+    def test_refresh_knows_what_it_replaces(self):
+        seen = []
+
+        @swr_cache(ttl=0.05)
+        def load(key):
+            seen.append(replacing())
+            return len(seen)
+
+        self.assertEqual(load("a"), 1)
+        first = load.last_refreshed("a")
+        time.sleep(0.1)
+        self.assertEqual(load("a"), 1)  # stale value, refreshed in the background
+        for _ in range(50):
+            if load.last_refreshed("a") != first:
+                break
+            time.sleep(0.01)
+        self.assertEqual(load("a"), 2)
+        self.assertEqual(seen, [None, first])
+        self.assertIsNone(replacing())
+
+    def test_value_and_refresh_time_come_together(self):
+        @swr_cache(ttl=60)
+        def load(key):
+            return key * 2
+
+        value, refreshed_at = load.with_refreshed(3)
+        self.assertEqual(value, 6)
+        self.assertEqual(refreshed_at, load.last_refreshed(3))
+
+
+if __name__ == "__main__":
+    unittest.main()
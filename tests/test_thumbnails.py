@@ -0,0 +1,88 @@
+"""ThumbnailCache against the stub server's cover images.
+
+    python -m unittest discover tests      (or python -m pytest tests)
+"""
+import io
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from PIL import Image
+
+from benchmarks.stub_server import StubState, SyntheticLibrary, start_stub_server
+from utils.thumbnails import PIXEL_RATIO, ThumbnailCache
+
+
+class ThumbnailCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmp.cleanup)
+        self.root = Path(self._tmp.name)
+        self.state = StubState(SyntheticLibrary(tracks=100, playlists=1))
+        server, self.prefix = start_stub_server(self.state)
+        self.addCleanup(server.shutdown)
+
+    def cover(self, i: int) -> str:
+        return f"{self.prefix}images/album-{i}.png"
+
+    def slow_downloads(self, cache: ThumbnailCache, delay: float = 0.2):
+        """Hold every download open long enough for concurrent callers to overlap."""
+        get = cache._session.get
+
+        def slow_get(*args, **kwargs):
+            time.sleep(delay)
+            return get(*args, **kwargs)
+        cache._session.get = slow_get
+
+    def test_output_width(self):
+        cache = ThumbnailCache(self.root)
+        data = cache.prefetch([self.cover(1)], width=48)[self.cover(1)]
+        with Image.open(io.BytesIO(data)) as image:
+            self.assertEqual(image.format, "JPEG")
+            self.assertEqual(image.size, (48 * PIXEL_RATIO, 48 * PIXEL_RATIO))
+        self.assertEqual(cache.get(self.cover(1), 48), data)
+
+    def test_concurrent_fetches_share_one_download(self):
+        cache = ThumbnailCache(self.root)
+        self.slow_downloads(cache)
+        urls = [self.cover(i) for i in range(3)]
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.prefetch(urls + urls, width=56)))
+                   for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(self.state.images, 3)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(result == results[0] and len(result) == 3 for result in results))
+
+    def test_eviction_at_the_byte_budget(self):
+        size = len(ThumbnailCache(self.root / "probe").prefetch([self.cover(0)], width=56)[self.cover(0)])
+        cache = ThumbnailCache(self.root / "cache", max_bytes=int(size * 3.5))
+        for i in range(8):
+            cache.prefetch([self.cover(i)], width=56)
+            time.sleep(0.01)  # distinct access times, so LRU order is the fetch order
+        stats = cache.stats()
+        self.assertLessEqual(stats["size_bytes"], cache.max_bytes)
+        self.assertEqual(stats["files"], len(list((self.root / "cache").glob("*/*.jpg"))))
+        self.assertIsNone(cache.get(self.cover(0), 56))
+        self.assertIsNotNone(cache.get(self.cover(7), 56))
+
+    def test_failed_fetch_falls_back_to_the_original_url(self):
+        cache = ThumbnailCache(self.root)
+        broken = f"{self.prefix}missing.png"
+        covers = cache.prefetch([broken, self.cover(2)], width=56)
+        self.assertEqual(list(covers), [self.cover(2)])
+        # What the pages show: the thumbnail when there is one, otherwise the original URL.
+        self.assertEqual(covers.get(broken, broken), broken)
+        # The failure is remembered, so the next rerun doesn't request it again.
+        calls = sum(self.state.calls.values())
+        self.assertEqual(cache.prefetch([broken], width=56), {})
+        self.assertEqual(sum(self.state.calls.values()), calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
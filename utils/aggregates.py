@@ -0,0 +1,212 @@
+"""Listening aggregates maintained incrementally as plays are recorded.
+
+Every play is folded into per-day cells when it is appended: a (days × 24)
+play-count array, milliseconds listened per day, and per-day counts of
+interned artist and track IDs. Window queries (the last 30 days, a given
+year, all time) sum those cells, so their cost depends on the number of days
+in the window rather than the number of plays.
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+DAY_MS = 86_400_000
+HOUR_MS = 3_600_000
+EPOCH_WEEKDAY = 3  # 1970-01-01 was a Thursday; Monday is 0 as in datetime.weekday()
+
+CUBE_COLUMNS = ["played_at", "name", "artist", "duration_ms"]
+ROLLUPS = ("artists", "tracks")
+
+
+def _epoch_day(dt: datetime) -> int:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000) // DAY_MS
+
+
+def last_days(n: int, now: datetime | None = None) -> tuple[datetime, datetime]:
+    """The [start, end) window covering the last n days, today included."""
+    today = (now or datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=n - 1), today + timedelta(days=1)
+
+
+def year_window(year: int) -> tuple[datetime, datetime]:
+    return datetime(year, 1, 1, tzinfo=timezone.utc), datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+
+
+class ListeningCube:
+    """Per-day listening cells; all times are UTC, like the history's hour/day_num."""
+
+    def __init__(self):
+        self.first_day: int | None = None
+        self.hourly = np.zeros((0, 24), np.int32)
+        self.listened_ms = np.zeros(0, np.int64)
+        # kind -> label -> interned ID, kind -> labels by ID, kind -> epoch day -> Counter of IDs
+        self.ids = {kind: {} for kind in ROLLUPS}
+        self.labels = {kind: [] for kind in ROLLUPS}
+        self.counts = {kind: {} for kind in ROLLUPS}
+        self._lock = threading.Lock()
+        self._arrays = {kind: {} for kind in ROLLUPS}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"], state["_arrays"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+        self._arrays = {kind: {} for kind in ROLLUPS}
+
+    def __len__(self):
+        return int(self.hourly.sum())
+
+    def _grow(self, lo: int, hi: int):
+        """Extend the day axis to cover epoch days lo..hi."""
+        if self.first_day is None:
+            self.first_day = lo
+            self.hourly = np.zeros((hi - lo + 1, 24), np.int32)
+            self.listened_ms = np.zeros(hi - lo + 1, np.int64)
+            return
+        before = max(0, self.first_day - lo)
+        after = max(0, hi - (self.first_day + len(self.listened_ms) - 1))
+        if before or after:
+            self.hourly = np.pad(self.hourly, ((before, after), (0, 0)))
+            self.listened_ms = np.pad(self.listened_ms, (before, after))
+            self.first_day -= before
+
+    def add(self, table: pa.Table):
+        """Fold new plays (at least CUBE_COLUMNS) into the cells."""
+        if table.num_rows == 0:
+            return
+        played_at = pc.cast(table["played_at"], pa.timestamp("ms", tz="UTC"))
+        ts = played_at.cast(pa.int64()).to_numpy()
+        days = ts // DAY_MS
+        hours = (ts % DAY_MS) // HOUR_MS
+        durations = table["duration_ms"].to_numpy(zero_copy_only=False).astype(np.int64)
+        artists = table["artist"].to_pylist()
+        names = table["name"].to_pylist()
+
+        with self._lock:
+            self._grow(int(days.min()), int(days.max()))
+            rows = days - self.first_day
+            np.add.at(self.hourly, (rows, hours), 1)
+            np.add.at(self.listened_ms, rows, durations)
+            for day, artist, name in zip(days.tolist(), artists, names):
+                self._count("artists", day, artist)
+                self._count("tracks", day, (name, artist))
+
+    def _count(self, kind: str, day: int, label):
+        ids = self.ids[kind]
+        if label not in ids:
+            ids[label] = len(self.labels[kind])
+            self.labels[kind].append(label)
+        self.counts[kind].setdefault(day, Counter())[ids[label]] += 1
+        self._arrays[kind].pop(day, None)
+
+    def _rows(self, start: datetime | None, end: datetime | None) -> slice:
+        """Rows of the day axis inside [start, end), clipped to the recorded range."""
+        if self.first_day is None:
+            return slice(0, 0)
+        lo = 0 if start is None else _epoch_day(start) - self.first_day
+        hi = len(self.listened_ms) if end is None else _epoch_day(end - timedelta(microseconds=1)) - self.first_day + 1
+        lo, hi = max(lo, 0), min(hi, len(self.listened_ms))
+        return slice(lo, max(lo, hi))
+
+    def _totals(self, kind: str, rows: slice) -> np.ndarray:
+        """Plays per interned ID over the window, as a dense vector."""
+        counts, arrays = self.counts[kind], self._arrays[kind]
+        ids, plays = [], []
+        if rows.stop > rows.start:
+            for day in range(self.first_day + rows.start, self.first_day + rows.stop):
+                if day not in counts:
+                    continue
+                if day not in arrays:
+                    arrays[day] = (np.fromiter(counts[day].keys(), np.int32), np.fromiter(counts[day].values(), np.int64))
+                ids.append(arrays[day][0])
+                plays.append(arrays[day][1])
+        if not ids:
+            return np.zeros(len(self.labels[kind]), np.int64)
+        return np.bincount(np.concatenate(ids), np.concatenate(plays), minlength=len(self.labels[kind]))
+
+    def _top(self, kind: str, n: int, rows: slice) -> list:
+        totals = self._totals(kind, rows)
+        top = np.argsort(-totals, kind="stable")[:n]
+        return [(self.labels[kind][i], int(totals[i])) for i in top if totals[i]]
+
+    def span(self) -> tuple[datetime, datetime] | None:
+        """First and last day with recorded plays."""
+        if self.first_day is None:
+            return None
+        played = np.flatnonzero(self.hourly.any(axis=1))
+        first, last = (self.first_day + int(played[i]) for i in (0, -1))
+        return (datetime.fromtimestamp(first * DAY_MS / 1000, timezone.utc),
+                datetime.fromtimestamp(last * DAY_MS / 1000, timezone.utc))
+
+    def heatmap(self, start: datetime | None = None, end: datetime | None = None) -> np.ndarray:
+        """7×24 play counts by weekday (Monday first) and hour."""
+        grid = np.zeros((7, 24), np.int64)
+        with self._lock:
+            rows = self._rows(start, end)
+            if rows.stop > rows.start:
+                weekdays = (np.arange(rows.start, rows.stop) + self.first_day + EPOCH_WEEKDAY) % 7
+                np.add.at(grid, weekdays, self.hourly[rows])
+        return grid
+
+    def summary(self, start: datetime | None = None, end: datetime | None = None) -> dict:
+        with self._lock:
+            rows = self._rows(start, end)
+            return {
+                "plays": int(self.hourly[rows].sum()),
+                "minutes": int(self.listened_ms[rows].sum() // 60000),
+                "artists": int(np.count_nonzero(self._totals("artists", rows))),
+                "tracks": int(np.count_nonzero(self._totals("tracks", rows))),
+            }
+
+    def daily(self, start: datetime | None = None, end: datetime | None = None) -> "pd.DataFrame":
+        """Plays and minutes per UTC day, including days without plays."""
+        with self._lock:
+            rows = self._rows(start, end)
+            days = np.arange(rows.start, rows.stop) + (self.first_day or 0)
+            return pd.DataFrame({
+                "date": pd.to_datetime(days * DAY_MS, unit="ms", utc=True),
+                "plays": self.hourly[rows].sum(axis=1),
+                "minutes": self.listened_ms[rows] / 60000,
+            })
+
+    def monthly(self, start: datetime | None = None, end: datetime | None = None) -> "pd.DataFrame":
+        daily = self.daily(start, end)
+        month = daily["date"].dt.strftime("%Y-%m")
+        return daily.groupby(month)[["plays", "minutes"]].sum().rename_axis("month").reset_index()
+
+    def monthly_totals(self, kind: str, start: datetime | None = None,
+                       end: datetime | None = None) -> tuple[list[str], list, np.ndarray]:
+        """Months, labels, and a (months × labels) play-count matrix for one rollup."""
+        with self._lock:
+            rows = self._rows(start, end)
+            if rows.stop <= rows.start:
+                return [], list(self.labels[kind]), np.zeros((0, len(self.labels[kind])), np.int64)
+            days = np.arange(rows.start, rows.stop) + self.first_day
+            months = days.astype("datetime64[D]").astype("datetime64[M]")
+            bounds = np.flatnonzero(np.r_[True, months[1:] != months[:-1]]) + rows.start
+            ends = np.r_[bounds[1:], rows.stop]
+            matrix = np.stack([self._totals(kind, slice(lo, hi)) for lo, hi in zip(bounds, ends)])
+            return [str(m) for m in np.unique(months)], list(self.labels[kind]), matrix
+
+    def top_artists(self, n: int = 10, start: datetime | None = None, end: datetime | None = None) -> list[tuple[str, int]]:
+        with self._lock:
+            return self._top("artists", n, self._rows(start, end))
+
+    def top_tracks(self, n: int = 10, start: datetime | None = None,
+                   end: datetime | None = None) -> list[tuple[tuple[str, str], int]]:
+        """((name, artist), plays) pairs, most played first."""
+        with self._lock:
+            return self._top("tracks", n, self._rows(start, end))
@@ -0,0 +1,55 @@
+"""Batched artist lookups with a process-wide metadata cache.
+
+Artist metadata (name, genres, images, popularity) is the same for every user,
+so resolved artists are kept in one in-memory map shared by all pages and
+sessions, backed by the shared catalog on disk. Pages that already hold full
+artist objects (e.g. top artists) seed the cache so later genre lookups don't
+hit the API again.
+"""
+import threading
+
+from utils.catalog import get_catalog
+
+ARTIST_BATCH_SIZE = 50  # max IDs per GET /artists
+
+_cache: dict[str, dict] = {}
+_lock = threading.Lock()
+
+
+def _remember(artists):
+    with _lock:
+        for artist in artists:
+            _cache[artist["id"]] = artist
+
+
+def remember_artists(artists):
+    """Store full artist objects so later lookups can skip the API."""
+    artists = [a for a in artists if a and a.get("id")]
+    _remember(artists)
+    get_catalog().put_artists(artists)
+
+
+def resolve_artists(sp, artist_ids) -> dict[str, dict]:
+    """Return {artist_id: artist} for the given IDs, fetching only unknown ones."""
+    wanted = list(dict.fromkeys(a for a in artist_ids if a))
+    with _lock:
+        missing = [a for a in wanted if a not in _cache]
+
+    if missing:
+        stored = get_catalog().artists(missing)
+        _remember(stored.values())
+        missing = [a for a in missing if a not in stored]
+
+    for i in range(0, len(missing), ARTIST_BATCH_SIZE):
+        batch = sp.artists(missing[i:i + ARTIST_BATCH_SIZE])
+        remember_artists(batch.get("artists", []))
+
+    with _lock:
+        return {a: _cache[a] for a in wanted if a in _cache}
+
+
+def first_artist_genres(sp, tracks) -> list[list[str]]:
+    """Genres of each track's first artist, resolved in batched calls."""
+    first_ids = [t["artists"][0]["id"] if t.get("artists") else None for t in tracks]
+    artists = resolve_artists(sp, first_ids)
+    return [artists.get(a, {}).get("genres", []) for a in first_ids]
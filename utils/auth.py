@@ -0,0 +1,141 @@
+"""OAuth token handling: proactive refresh, and per-user storage for multi-user mode."""
+import json
+import os
+import threading
+import time
+
+import requests
+from spotipy.cache_handler import CacheHandler
+from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
+
+from utils.config import TOKEN_DIR
+from utils.metrics import METRICS
+
+SCOPES = " ".join([
+    "user-top-read",
+    "user-read-recently-played",
+    "user-library-read",
+    "playlist-read-private",
+])
+
+REFRESH_AHEAD = 300  # seconds before expiry that the background refresh runs
+RETRY_DELAY = 30
+IDLE_TIMEOUT = 3600  # stop refreshing tokens nobody has used for this long
+
+
+class ManagedOAuth(SpotifyOAuth):
+    """SpotifyOAuth that refreshes its access token in the background, ahead of expiry.
+
+    Plain SpotifyOAuth re-reads its cache on every request and refreshes inside
+    whichever API call finds the token expired, so that call pays for the round
+    trip and concurrent sessions can refresh (and rewrite .cache) at the same
+    time. Here the token lives in memory, a timer refreshes it REFRESH_AHEAD
+    seconds early, and a lock keeps refreshes one at a time. A token that has
+    already expired (after a long idle spell, say) is still refreshed in the
+    foreground.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock = threading.Lock()
+        self._token = None
+        self._timer = None
+        self._used_at = time.time()
+
+    def get_access_token(self, code=None, as_dict=True, check_cache=True):
+        if code or not check_cache:
+            # Completing a login: exchange the code, then keep the result.
+            with self._lock:
+                super().get_access_token(code, as_dict=False, check_cache=check_cache)
+                self._token = self.cache_handler.get_cached_token()
+                self._schedule(self._token)
+            token_info = self._token
+        else:
+            self._used_at = time.time()
+            token_info = self._token
+            if token_info is None or self._timer is None or self.is_token_expired(token_info):
+                token_info = self._ensure(ahead=0, source="on_demand")
+        return token_info if as_dict else token_info["access_token"]
+
+    def _ensure(self, ahead: float, source: str) -> dict:
+        """The token, refreshed first if it expires within `ahead` seconds."""
+        with self._lock:
+            token_info = self._token
+            if token_info is None:
+                # First use: spotipy loads the cache (or runs its login flow) and refreshes if needed.
+                super().get_access_token(as_dict=False)
+                token_info = self.cache_handler.get_cached_token()
+            elif token_info["expires_at"] - time.time() < ahead or self.is_token_expired(token_info):
+                start = time.perf_counter()
+                token_info = self.refresh_access_token(token_info["refresh_token"])
+                METRICS.observe_api("token", source, time.perf_counter() - start)
+            self._token = token_info
+            self._schedule(token_info)
+            return token_info
+
+    def _schedule(self, token_info: dict, delay: float | None = None):
+        if self._timer is not None:
+            self._timer.cancel()
+        if delay is None:
+            delay = max(0.0, token_info["expires_at"] - REFRESH_AHEAD - time.time())
+        self._timer = threading.Timer(delay, self._refresh_ahead)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _refresh_ahead(self):
+        if time.time() - self._used_at > IDLE_TIMEOUT:
+            with self._lock:
+                self._timer = None  # the next request starts it again
+            return
+        try:
+            self._ensure(ahead=REFRESH_AHEAD, source="refresh_ahead")
+        except (SpotifyOauthError, requests.RequestException):
+            with self._lock:
+                if not self.is_token_expired(self._token):
+                    self._schedule(self._token, RETRY_DELAY)
+                else:
+                    self._timer = None  # left to the next request
+
+
+class UserTokenHandler(CacheHandler):
+    """Keeps one session's token in memory, and on disk once the user is known.
+
+    The on-disk copy (TOKEN_DIR/<user_id>.json) lets background jobs such as
+    the history recorder or the CLI keep working for that user. It is a plain
+    object rather than st.session_state so worker threads can refresh tokens.
+    """
+
+    def __init__(self):
+        self.token_info = None
+        self.user_id = None
+
+    @classmethod
+    def load(cls, user_id: str) -> "UserTokenHandler":
+        """The stored token of a user who has logged in before, for jobs outside the dashboard."""
+        handler = cls()
+        handler.token_info = json.loads(user_token_path(user_id).read_text())
+        handler.user_id = user_id
+        return handler
+
+    def get_cached_token(self):
+        return self.token_info
+
+    def save_token_to_cache(self, token_info):
+        self.token_info = token_info
+        self._persist()
+
+    def bind_user(self, user_id: str):
+        self.user_id = user_id
+        self._persist()
+
+    def _persist(self):
+        if not (self.user_id and self.token_info):
+            return
+        TOKEN_DIR.mkdir(parents=True, exist_ok=True)
+        fd = os.open(user_token_path(self.user_id), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.token_info, f)
+
+
+def user_token_path(user_id: str):
+    return TOKEN_DIR / f"{user_id}.json"
@@ -0,0 +1,123 @@
+"""Precomputed page tables, written by `python main.py precompute` and read by the pages.
+
+A bundle is one directory per user with an Arrow IPC file per table
+(name.arrow, or name/key.arrow for tables kept per time range or per
+playlist) and a manifest.json listing them. Files are opened through a memory
+map, so a page reads a table without parsing it or calling the API. A new
+bundle is written beside the old one and swapped in with renames; pages that
+still hold tables from the old files keep their mappings.
+
+Bundles older than BUNDLE_MAX_AGE, or built before the library's last sync,
+are ignored and the pages fetch live data.
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import pyarrow as pa
+import pyarrow.ipc
+
+from utils.config import BUNDLE_DIR, BUNDLE_MAX_AGE
+from utils.lazy import lazy_import
+from utils.metrics import METRICS
+
+pd = lazy_import("pandas")
+
+MANIFEST = "manifest.json"
+
+
+def _entry(name: str, key: str | None = None) -> str:
+    return name if key is None else f"{name}/{key}"
+
+
+class BundleWriter:
+    """Collects tables in a scratch directory; commit() makes them the user's bundle."""
+
+    def __init__(self, user_id: str, root=BUNDLE_DIR):
+        self.user_id = user_id
+        self.root = root
+        self._scratch = root / f".{user_id}.{os.getpid()}.tmp"
+        shutil.rmtree(self._scratch, ignore_errors=True)
+        self._scratch.mkdir(parents=True)
+        self._tables: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, data, key: str | None = None):
+        """Write a DataFrame, or a list of flat dicts, as one table."""
+        if isinstance(data, list):
+            table = pa.Table.from_pylist(data)
+        else:
+            table = pa.Table.from_pandas(data, preserve_index=False)
+        entry = _entry(name, key)
+        path = self._scratch / f"{entry}.arrow"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        with self._lock:
+            self._tables[entry] = table.num_rows
+
+    def commit(self) -> dict:
+        manifest = {"user_id": self.user_id, "created_at": time.time(), "tables": dict(sorted(self._tables.items()))}
+        (self._scratch / MANIFEST).write_text(json.dumps(manifest, indent=1))
+        target = self.root / self.user_id
+        old = self.root / f".{self.user_id}.{os.getpid()}.old"
+        if target.exists():
+            target.rename(old)
+        self._scratch.rename(target)
+        shutil.rmtree(old, ignore_errors=True)
+        return manifest
+
+
+class Bundle:
+    def __init__(self, path, manifest: dict):
+        self.path = path
+        self.created_at = manifest["created_at"]
+        self.tables: dict[str, int] = manifest["tables"]
+
+    def __contains__(self, entry: str) -> bool:
+        return entry in self.tables
+
+    def table(self, name: str, key: str | None = None) -> pa.Table | None:
+        """The memory-mapped table, or None if the bundle doesn't have it."""
+        entry = _entry(name, key)
+        if entry not in self.tables:
+            return None
+        start = time.perf_counter()
+        try:
+            table = pa.ipc.open_file(pa.memory_map(str(self.path / f"{entry}.arrow"))).read_all()
+        except (FileNotFoundError, pa.ArrowInvalid):
+            return None  # replaced or removed since the manifest was read
+        METRICS.observe_api(f"bundle/{name}", "bundle", time.perf_counter() - start, table.nbytes)
+        return table
+
+    def frame(self, name: str, key: str | None = None) -> "pd.DataFrame | None":
+        table = self.table(name, key)
+        if table is None:
+            return None
+        df = table.to_pandas()
+        # Arrow-backed strings come back Python-backed; restore what build_track_table made.
+        for column in df.select_dtypes("string").columns:
+            df[column] = df[column].astype("string[pyarrow]")
+        return df
+
+    def rows(self, name: str, key: str | None = None) -> list[dict] | None:
+        table = self.table(name, key)
+        return None if table is None else table.to_pylist()
+
+
+def open_bundle(user_id: str, root=BUNDLE_DIR, max_age: float | None = BUNDLE_MAX_AGE,
+                changed_at: float | None = None) -> Bundle | None:
+    """The user's bundle, or None if there is none, it is older than max_age seconds,
+    or it was built before the library last changed at `changed_at` (a Unix time)."""
+    path = root / user_id
+    try:
+        manifest = json.loads((path / MANIFEST).read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if max_age is not None and time.time() - manifest["created_at"] > max_age:
+        return None
+    if changed_at is not None and changed_at > manifest["created_at"]:
+        return None
+    return Bundle(path, manifest)
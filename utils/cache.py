@@ -0,0 +1,155 @@
+"""Persistent response cache for Spotify Web API GET requests.
+
+Responses are stored in a small SQLite file keyed by endpoint path and
+normalised query parameters, so they survive Streamlit restarts and are
+shared by every page and session. Each endpoint family has its own TTL, and
+the file is kept under a byte budget by evicting least-recently-used rows.
+"""
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from collections import defaultdict
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+from utils.config import RESPONSE_CACHE_MAX_BYTES, RESPONSE_CACHE_PATH
+
+API_PREFIX = "https://api.spotify.com/v1/"
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+# Longest matching path prefix wins; anything unlisted falls back to DEFAULT_TTL.
+ENDPOINT_TTLS = {
+    "me": HOUR,
+    "me/top": HOUR,
+    "me/player/recently-played": 60,  # the history recorder polls this with a moving cursor
+    "me/tracks": HOUR,
+    "me/playlists": HOUR,
+    "playlists": HOUR,
+    "artists": 7 * DAY,
+    "tracks": 7 * DAY,
+    "albums": 7 * DAY,
+    "audio-features": 30 * DAY,
+}
+DEFAULT_TTL = HOUR
+
+# Catalog data that is identical for every user.
+SHARED_ENDPOINTS = {"artists", "tracks", "albums", "audio-features"}
+
+
+def endpoint_for(path: str) -> str:
+    """Map a request path like 'playlists/<id>/tracks' to its ENDPOINT_TTLS key."""
+    parts = path.strip("/").split("/")
+    for n in range(len(parts), 0, -1):
+        candidate = "/".join(parts[:n])
+        if candidate in ENDPOINT_TTLS:
+            return candidate
+    return parts[0]
+
+
+def request_key(url: str, params: dict | None = None, prefix: str = API_PREFIX) -> tuple[str, str]:
+    """Return (endpoint, key) for a GET, with query parameters merged and sorted."""
+    if url.startswith(prefix):
+        url = url[len(prefix):]
+    parts = urlsplit(url)
+    path = parts.path.strip("/")
+    query = dict(parse_qsl(parts.query))
+    query.update({k: str(v) for k, v in (params or {}).items() if v is not None})
+    return endpoint_for(path), f"{path}?{urlencode(sorted(query.items()))}"
+
+
+class ResponseCache:
+    def __init__(self, path=RESPONSE_CACHE_PATH, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttls: dict | None = None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = {**ENDPOINT_TTLS, **(ttls or {})}
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+        self._lock = threading.Lock()
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, endpoint: str, key: str):
+        """Return the cached response, or None if missing or older than the endpoint TTL."""
+        ttl = self.ttls.get(endpoint, DEFAULT_TTL)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > ttl:
+                self.misses[endpoint] += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits[endpoint] += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def set(self, endpoint: str, key: str, value):
+        body = zlib.compress(json.dumps(value, separators=(",", ":")).encode())
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, endpoint, body, len(body), now, now),
+            )
+            self._size += len(body) - (old[0] if old else 0)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least-recently-used rows until the file is back to 90% of the budget."""
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+        doomed = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            doomed.append((key,))
+            self._size -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._size = 0
+
+    def stats(self) -> dict:
+        endpoints = sorted(set(self.hits) | set(self.misses))
+        return {
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "endpoints": {e: {"hits": self.hits[e], "misses": self.misses[e]} for e in endpoints},
+        }
+
+
+_shared: ResponseCache | None = None
+_shared_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """The process-wide cache instance, opened on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ResponseCache()
+        return _shared
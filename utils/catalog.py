@@ -0,0 +1,225 @@
+"""Shared tier for public catalog data, keyed by Spotify ID.
+
+Nothing in here depends on who is logged in, so one copy serves every user
+of a deployment:
+
+* audio features, which are fixed per track, so they are fetched once and
+  kept forever. Null results are remembered too, and so is a 403 from the
+  (deprecated) endpoint, so new playlists don't keep re-probing it;
+* full artist objects, refreshed after ARTIST_TTL since genres and
+  popularity drift, plus an artist→genre edge table over interned genre IDs
+  that utils.genres loads as a sparse matrix. A genre_version counter in
+  meta goes up whenever an artist's name or genres change, so every process
+  sharing the catalog knows when to rebuild that matrix;
+* full track objects, written by library syncs and read back by ID.
+"""
+import json
+import sqlite3
+import threading
+import time
+
+import spotipy
+
+from utils.config import CATALOG_PATH
+
+FEATURES_BATCH_SIZE = 100  # max IDs per GET /audio-features
+UNAVAILABLE_RECHECK = 24 * 3600
+ARTIST_TTL = 7 * 24 * 3600
+SQL_VARIABLE_LIMIT = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audio_features (
+    track_id TEXT PRIMARY KEY,
+    data TEXT
+);
+CREATE TABLE IF NOT EXISTS artists (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS genres (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS artist_genres (
+    artist_id TEXT NOT NULL,
+    genre_id INTEGER NOT NULL,
+    PRIMARY KEY (artist_id, genre_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS tracks (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS endpoint_status (
+    endpoint TEXT PRIMARY KEY,
+    http_status INTEGER NOT NULL,
+    checked_at REAL NOT NULL
+);
+"""
+
+
+class CatalogStore:
+    def __init__(self, path=CATALOG_PATH):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        if self._db.execute("SELECT NOT EXISTS (SELECT 1 FROM artist_genres) AND EXISTS (SELECT 1 FROM artists)").fetchone()[0]:
+            # Catalogs written before the genre tables existed.
+            self._index_genres([json.loads(data) for (data,) in self._db.execute("SELECT data FROM artists")])
+
+    def _lookup(self, table: str, key: str, ids: list[str]) -> dict[str, dict | None]:
+        found = {}
+        for i in range(0, len(ids), SQL_VARIABLE_LIMIT):
+            chunk = ids[i:i + SQL_VARIABLE_LIMIT]
+            marks = ",".join("?" * len(chunk))
+            rows = self._db.execute(f"SELECT {key}, data FROM {table} WHERE {key} IN ({marks})", chunk)
+            for item_id, data in rows:
+                found[item_id] = json.loads(data) if data is not None else None
+        return found
+
+    def artists(self, artist_ids) -> dict[str, dict]:
+        """Stored artists fetched within ARTIST_TTL."""
+        found = {}
+        ids = list(artist_ids)
+        cutoff = time.time() - ARTIST_TTL
+        for i in range(0, len(ids), SQL_VARIABLE_LIMIT):
+            chunk = ids[i:i + SQL_VARIABLE_LIMIT]
+            marks = ",".join("?" * len(chunk))
+            rows = self._db.execute(
+                f"SELECT id, data FROM artists WHERE id IN ({marks}) AND fetched_at >= ?", (*chunk, cutoff)
+            )
+            for artist_id, data in rows:
+                found[artist_id] = json.loads(data)
+        return found
+
+    @property
+    def genre_version(self) -> int:
+        """Bumped, in the database, by every write that changes the genre index's input."""
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'genre_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def put_artists(self, artists):
+        artists = list(artists)
+        now = time.time()
+        with self._lock:
+            stored = self._lookup("artists", "id", [a["id"] for a in artists])
+            self._db.executemany(
+                "INSERT OR REPLACE INTO artists VALUES (?, ?, ?)",
+                [(a["id"], json.dumps(a, separators=(",", ":")), now) for a in artists],
+            )
+        # Refetches of unchanged artists only renew fetched_at; the index stays as it is.
+        self._index_genres([a for a in artists if _genre_key(a) != _genre_key(stored.get(a["id"]))])
+
+    def _index_genres(self, artists):
+        if not artists:
+            return
+        names = {g for a in artists for g in a.get("genres", [])}
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR IGNORE INTO genres (name) VALUES (?)", [(g,) for g in names])
+                self._db.executemany("DELETE FROM artist_genres WHERE artist_id = ?", [(a["id"],) for a in artists])
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO artist_genres SELECT ?, id FROM genres WHERE name = ?",
+                    [(a["id"], g) for a in artists for g in a.get("genres", [])],
+                )
+                self._db.execute(
+                    """INSERT INTO meta VALUES ('genre_version', '1')
+                       ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"""
+                )
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def genre_edges(self) -> tuple[list[str], list[tuple[str, str]], list[tuple[str, int]]]:
+        """Genre names by ID, (artist_id, name) for every stored artist, and all artist→genre edges."""
+        with self._lock:
+            genres = self._db.execute("SELECT id, name FROM genres").fetchall()
+            artists = self._db.execute("SELECT id, json_extract(data, '$.name') FROM artists").fetchall()
+            edges = self._db.execute("SELECT artist_id, genre_id FROM artist_genres").fetchall()
+        names = [""] * (max((i for i, _ in genres), default=0) + 1)
+        for genre_id, name in genres:
+            names[genre_id] = name
+        return names, artists, edges
+
+    def tracks(self, track_ids) -> dict[str, dict]:
+        return self._lookup("tracks", "id", list(track_ids))
+
+    def put_tracks(self, tracks):
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?)",
+                [(t["id"], json.dumps(t, separators=(",", ":"))) for t in tracks],
+            )
+
+    def endpoint_unavailable(self, endpoint: str) -> bool:
+        row = self._db.execute(
+            "SELECT http_status, checked_at FROM endpoint_status WHERE endpoint = ?", (endpoint,)
+        ).fetchone()
+        return row is not None and row[0] == 403 and time.time() - row[1] < UNAVAILABLE_RECHECK
+
+    def _mark_endpoint(self, endpoint: str, http_status: int):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO endpoint_status VALUES (?, ?, ?)",
+                (endpoint, http_status, time.time()),
+            )
+
+    def audio_features(self, sp, track_ids) -> dict[str, dict | None] | None:
+        """Return {track_id: features or None}, fetching only IDs never seen before.
+
+        Returns None when the endpoint answers 403 (removed for newer apps).
+        """
+        wanted = list(dict.fromkeys(t for t in track_ids if t))
+        known = self._lookup("audio_features", "track_id", wanted)
+        missing = [t for t in wanted if t not in known]
+        if not missing:
+            return known
+        if self.endpoint_unavailable("audio-features"):
+            return None
+
+        for i in range(0, len(missing), FEATURES_BATCH_SIZE):
+            batch = missing[i:i + FEATURES_BATCH_SIZE]
+            try:
+                results = sp.audio_features(batch) or []
+            except spotipy.exceptions.SpotifyException as e:
+                if e.http_status == 403:
+                    self._mark_endpoint("audio-features", 403)
+                    return None
+                raise
+            by_id = {f["id"]: f for f in results if f}
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO audio_features VALUES (?, ?)",
+                    [(t, json.dumps(by_id[t]) if t in by_id else None) for t in batch],
+                )
+            for t in batch:
+                known[t] = by_id.get(t)
+        self._mark_endpoint("audio-features", 200)
+        return known
+
+
+_shared: CatalogStore | None = None
+_shared_lock = threading.Lock()
+
+
+def _genre_key(artist: dict | None):
+    """What the genre index reads from an artist object."""
+    return None if artist is None else (artist.get("name"), sorted(artist.get("genres", [])))
+
+
+def get_catalog() -> CatalogStore:
+    """The process-wide catalog store, opened on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = CatalogStore()
+        return _shared
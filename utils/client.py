@@ -0,0 +1,206 @@
+"""Spotify client shared by every page.
+
+SpotifyClient wraps spotipy.Spotify with the pieces the pages used to lack:
+
+* one pooled requests.Session for the whole process,
+* a token-bucket rate limiter shared by all pages and sessions, which also
+  holds every caller back when Spotify answers 429 with Retry-After,
+* automatic retry of 429s that carry Retry-After (5xx are retried by the session),
+* coalescing of identical concurrent GETs into a single HTTP call,
+* read-through of the persistent ResponseCache,
+* per-endpoint latency, payload and retry metrics (utils.metrics).
+
+User endpoints are cached and coalesced under `user_scope` (the user's
+Spotify ID, set once the profile is known) and are not cached at all before
+that. Catalog endpoints share one scope across all users. fresh() returns a
+client that skips cache reads (but still stores what it fetches), for jobs
+such as the library sync that must see the current state.
+
+Set SPOTIFY_API_PREFIX to point the client at a local stub server.
+"""
+import copy
+import os
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+
+import requests
+import spotipy
+from urllib3.util.retry import Retry
+
+from utils.cache import SHARED_ENDPOINTS, ResponseCache, request_key
+from utils.metrics import METRICS
+from utils.paginate import MAX_RETRIES, retry_after
+
+API_PREFIX = os.getenv("SPOTIFY_API_PREFIX", "https://api.spotify.com/v1/")
+RATE_PER_SECOND = float(os.getenv("SPOTIFY_RATE_LIMIT", "10"))
+BURST = 20
+POOL_SIZE = 32
+
+
+class TokenBucket:
+    """Blocking token bucket; pause() stops everyone until a deadline passes."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+
+class Coalescer:
+    """Lets concurrent callers with the same key share one in-flight call."""
+
+    def __init__(self):
+        self._calls: dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def run(self, key: str, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+
+def _record_response(response: requests.Response, *args, **kwargs):
+    """Session hook: time, size and status of every HTTP response."""
+    url = response.request.url
+    endpoint = request_key(url, prefix=API_PREFIX)[0] if url.startswith(API_PREFIX) else urlsplit(url).netloc
+    METRICS.observe_api(endpoint, "network", response.elapsed.total_seconds(), len(response.content),
+                        response.status_code)
+    history = getattr(getattr(response.raw, "retries", None), "history", ())
+    for _ in history:
+        METRICS.count_retry(endpoint, "5xx")
+
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    session.hooks["response"].append(_record_response)
+    # 429s are left to SpotifyClient so the shared limiter sees them (urllib3
+    # would otherwise sleep on Retry-After itself). Once the 5xx retries run
+    # out the last response is returned rather than a RetryError, which
+    # spotipy would report as a 429.
+    retry = Retry(
+        total=3,
+        connect=None,
+        read=False,
+        allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+        status=3,
+        backoff_factor=0.3,
+        status_forcelist=(500, 502, 503, 504),
+        raise_on_status=False,
+        respect_retry_after_header=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=POOL_SIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_session = _build_session()
+_limiter = TokenBucket(RATE_PER_SECOND, BURST)
+_coalescer = Coalescer()
+
+
+class SpotifyClient(spotipy.Spotify):
+    def __init__(self, *args, cache: ResponseCache | None = None, user_scope: str | None = None, **kwargs):
+        kwargs.setdefault("requests_session", _session)
+        super().__init__(*args, **kwargs)
+        self.prefix = API_PREFIX
+        self.cache = cache
+        self.user_scope = user_scope
+        self.limiter = _limiter
+        self.read_cache = True
+
+    def fresh(self) -> "SpotifyClient":
+        """This client, minus cache reads: every GET goes to the API and refreshes the cache."""
+        clone = copy.copy(self)
+        clone.read_cache = False
+        return clone
+
+    def __del__(self):
+        pass  # the pooled session outlives any one client
+
+    def _internal_call(self, method, url, payload, params):
+        for attempt in range(MAX_RETRIES + 1):
+            self.limiter.acquire()
+            try:
+                return super()._internal_call(method, url, payload, dict(params))
+            except spotipy.exceptions.SpotifyException as e:
+                # Only a real 429 (a response that says how long to wait) holds everyone back.
+                delay = retry_after(e) if e.http_status == 429 else None
+                if delay is None or attempt == MAX_RETRIES:
+                    raise
+                METRICS.count_retry(request_key(url, params, prefix=self.prefix)[0], "429")
+                self.limiter.pause(delay)
+
+    def _get(self, url, args=None, payload=None, **kwargs):
+        if args:
+            kwargs.update(args)
+        endpoint, key = request_key(url, kwargs, prefix=self.prefix)
+        if endpoint in SHARED_ENDPOINTS:
+            scope = "shared"
+        else:
+            scope = self.user_scope
+        cache = self.cache if scope is not None else None
+        if scope is not None:
+            key = f"{scope}/{key}"
+
+        start = time.perf_counter()
+        if cache is not None and self.read_cache:
+            cached = cache.get(endpoint, key)
+            if cached is not None:
+                METRICS.observe_api(endpoint, "response_cache", time.perf_counter() - start)
+                return cached
+
+        led = False
+
+        def fetch():
+            nonlocal led
+            led = True
+            result = self._internal_call("GET", url, payload, kwargs)
+            if result is not None and cache is not None:
+                cache.set(endpoint, key, result)
+            return result
+
+        result = _coalescer.run(key if scope is not None else f"{id(self)}/{key}", fetch)
+        if not led:
+            METRICS.observe_api(endpoint, "coalesced", time.perf_counter() - start)
+        return result
@@ -0,0 +1,105 @@
+"""Library-wide playlist comparison in one vectorized pass.
+
+Playlist membership is held as a playlists × tracks bitset (one bit per
+track, packed with np.packbits), next to a tracks × features float32 matrix.
+compare_playlists() walks the bitset in column blocks, unpacking one block at
+a time, and accumulates everything it needs from the same block:
+
+* pairwise intersections (A @ A.T), giving Jaccard overlap,
+* per-playlist feature sums, giving centroids and centroid distances,
+* per-track playlist counts, giving cross-playlist duplicates.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+BLOCK_BYTES = 2048  # 16,384 tracks per unpacked block
+
+
+@dataclass
+class PlaylistMatrix:
+    playlist_ids: list[str]
+    track_ids: np.ndarray
+    bits: np.ndarray            # (playlists, ceil(tracks / 8)) uint8
+    features: np.ndarray        # (tracks, features) float32, NaN where unknown
+    repeats: np.ndarray         # (playlists,) items that repeat a track already in the playlist
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """Unique tracks per playlist."""
+        return np.unpackbits(self.bits, axis=1).sum(axis=1) if self.bits.size else np.zeros(0, int)
+
+
+def build_playlist_matrix(playlist_ids, memberships, feature_map, feature_names) -> PlaylistMatrix:
+    """memberships: (playlist_id, track_id) pairs; feature_map: track_id -> features or None."""
+    position = {pid: i for i, pid in enumerate(playlist_ids)}
+    pairs = [(position[p], t) for p, t in memberships if p in position]
+    p_idx = np.fromiter((p for p, _ in pairs), dtype=np.int32, count=len(pairs))
+    track_ids, t_idx = np.unique(np.array([t for _, t in pairs], dtype=object), return_inverse=True)
+    n_playlists, n_tracks = len(playlist_ids), len(track_ids)
+
+    bits = np.zeros((n_playlists, (n_tracks + 7) // 8), dtype=np.uint8)
+    np.bitwise_or.at(bits, (p_idx, t_idx >> 3), (128 >> (t_idx & 7)).astype(np.uint8))
+
+    pair_codes = p_idx.astype(np.int64) * max(n_tracks, 1) + t_idx
+    unique_pairs = np.unique(pair_codes)
+    repeats = np.bincount(p_idx, minlength=n_playlists) - np.bincount(
+        (unique_pairs // max(n_tracks, 1)).astype(np.int64), minlength=n_playlists
+    )
+
+    features = np.full((n_tracks, len(feature_names)), np.nan, dtype=np.float32)
+    for row, track_id in enumerate(track_ids):
+        feat = (feature_map or {}).get(track_id)
+        if feat:
+            features[row] = [feat[k] for k in feature_names]
+
+    return PlaylistMatrix(list(playlist_ids), track_ids, bits, features, repeats)
+
+
+def compare_playlists(m: PlaylistMatrix) -> dict[str, np.ndarray]:
+    n_playlists, n_bytes = m.bits.shape
+    n_tracks, n_features = m.features.shape
+    known = ~np.isnan(m.features).any(axis=1)
+    filled = np.where(known[:, None], m.features, 0).astype(np.float32)
+
+    intersections = np.zeros((n_playlists, n_playlists), dtype=np.float32)
+    feature_sums = np.zeros((n_playlists, n_features), dtype=np.float32)
+    feature_counts = np.zeros(n_playlists, dtype=np.float32)
+    track_counts = np.zeros(n_tracks, dtype=np.int32)
+
+    for start in range(0, n_bytes, BLOCK_BYTES):
+        stop = min(start + BLOCK_BYTES, n_bytes)
+        cols = slice(start * 8, min(stop * 8, n_tracks))
+        block = np.unpackbits(m.bits[:, start:stop], axis=1)[:, :cols.stop - cols.start].astype(np.float32)
+        intersections += block @ block.T
+        feature_sums += block @ filled[cols]
+        feature_counts += block @ known[cols].astype(np.float32)
+        track_counts[cols] = block.sum(axis=0)
+
+    sizes = np.diag(intersections)
+    unions = sizes[:, None] + sizes[None, :] - intersections
+    jaccard = np.divide(intersections, unions, out=np.zeros_like(intersections), where=unions > 0)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centroids = feature_sums / feature_counts[:, None]
+    diffs = centroids[:, None, :] - centroids[None, :, :]
+    distances = np.sqrt((diffs ** 2).sum(axis=2))
+
+    return {
+        "sizes": sizes.astype(np.int32),
+        "intersections": intersections.astype(np.int32),
+        "jaccard": jaccard,
+        "centroids": centroids,
+        "distances": distances,
+        "track_counts": track_counts,
+    }
+
+
+def top_pairs(matrix: np.ndarray, n: int, largest: bool = True) -> list[tuple[int, int, float]]:
+    """The n best (i, j, value) pairs from the upper triangle of a symmetric matrix, NaNs skipped."""
+    i, j = np.triu_indices(len(matrix), k=1)
+    values = matrix[i, j]
+    valid = ~np.isnan(values)
+    i, j, values = i[valid], j[valid], values[valid]
+    order = np.argsort(-values if largest else values, kind="stable")[:n]
+    return [(int(i[k]), int(j[k]), float(values[k])) for k in order]
@@ -0,0 +1,21 @@
+"""Locations and limits for the dashboard's local data."""
+import os
+from pathlib import Path
+
+DATA_DIR = Path(os.getenv("SPOTIFY_DATA_DIR", ".data"))
+
+RESPONSE_CACHE_PATH = DATA_DIR / "responses.sqlite3"
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("SPOTIFY_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+LIBRARY_DIR = DATA_DIR / "library"
+HISTORY_DIR = DATA_DIR / "history"
+CATALOG_PATH = DATA_DIR / "catalog.sqlite3"
+TOKEN_DIR = DATA_DIR / "tokens"
+THUMBNAIL_DIR = DATA_DIR / "thumbnails"
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("SPOTIFY_THUMBNAIL_MAX_MB", "64")) * 1024 * 1024
+BUNDLE_DIR = DATA_DIR / "bundles"
+BUNDLE_MAX_AGE = float(os.getenv("SPOTIFY_BUNDLE_MAX_HOURS", "24")) * 3600  # older bundles are ignored
+
+# Serve many users from one deployment: OAuth happens in the browser, tokens are
+# kept per session/user, and user data is cached under the user's ID.
+MULTI_USER = os.getenv("SPOTIFY_MULTI_USER", "").lower() in ("1", "true", "yes")
@@ -0,0 +1,196 @@
+"""Figures whose size does not grow with the number of tracks.
+
+px.histogram embeds every data point in the figure and bins them in the
+browser, so the payload and render time grow with the table. Here the counts
+come from one np.histogram pass per column and the figure only holds one bar
+per bin, whatever the number of tracks. dataset_hash() gives pages a key to
+cache the finished figures under.
+
+Mood maps (valence × energy) follow the same idea at scale: SVG markers up
+to WEBGL_POINTS tracks, WebGL markers up to DENSITY_POINTS, and beyond that a
+MOOD_BINS × MOOD_BINS count grid whose cells can be selected to list the
+tracks inside them. mood_map() draws whichever fits, with the drill-down,
+for both Audio Features and Playlist Analysis.
+"""
+import hashlib
+
+import numpy as np
+import streamlit as st
+
+from utils.lazy import lazy_import
+from utils.metrics import timed_cache_resource
+
+pd = lazy_import("pandas")
+px = lazy_import("plotly.express")
+go = lazy_import("plotly.graph_objects")
+
+WEBGL_POINTS = 1_500
+DENSITY_POINTS = 15_000
+MOOD_BINS = 20
+NO_CELL = -1  # tracks without valence or energy; never selectable
+
+
+def dataset_hash(df: "pd.DataFrame", columns: list[str]) -> str:
+    """Content hash of the given columns, independent of the index."""
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    return hashlib.blake2b(hashes.tobytes(), digest_size=16).hexdigest()
+
+
+def bin_counts(values, bins: int, value_range: tuple[float, float] | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """(counts, edges) of the non-null values."""
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    if value_range is None and values.size == 0:
+        value_range = (0.0, 1.0)
+    return np.histogram(values, bins=bins, range=value_range)
+
+
+def histogram_figure(counts: np.ndarray, edges: np.ndarray, *, color: str, template: str,
+                     x_label: str, unit: str = "tracks", **layout) -> "go.Figure":
+    """Bar chart of precomputed bins that looks like a px.histogram of the same data."""
+    centers = (edges[:-1] + edges[1:]) / 2
+    fig = go.Figure(go.Bar(
+        x=centers.tolist(),
+        y=counts.tolist(),
+        customdata=np.column_stack([edges[:-1], edges[1:]]).tolist(),
+        marker_color=color,
+        hovertemplate=f"{x_label}: %{{customdata[0]:.2f}}–%{{customdata[1]:.2f}}<br>%{{y}} {unit}<extra></extra>",
+    ))
+    fig.update_layout(template=template, showlegend=False, bargap=0.05, **layout)
+    fig.update_xaxes(title_text=x_label)
+    fig.update_yaxes(title_text="count")
+    return fig
+
+
+# ── Mood maps ─────────────────────────────────────────────────────────────────
+
+def mood_map_mode(n_points: int) -> str:
+    """"svg", "webgl" or "density", by number of tracks."""
+    if n_points > DENSITY_POINTS:
+        return "density"
+    return "webgl" if n_points > WEBGL_POINTS else "svg"
+
+
+def mood_cells(valence, energy, bins: int = MOOD_BINS) -> np.ndarray:
+    """Grid cell (row-major, energy rows) of each track; 1.0 falls in the last cell.
+
+    Tracks missing either value get NO_CELL rather than whatever cell a cast NaN lands in.
+    """
+    valence = np.asarray(valence, dtype=np.float64)
+    energy = np.asarray(energy, dtype=np.float64)
+    valid = np.isfinite(valence) & np.isfinite(energy)
+    x = np.clip((np.where(valid, valence, 0) * bins).astype(np.int64), 0, bins - 1)
+    y = np.clip((np.where(valid, energy, 0) * bins).astype(np.int64), 0, bins - 1)
+    return np.where(valid, y * bins + x, NO_CELL)
+
+
+def mood_density_figure(valence, energy, *, color: str, template: str, bins: int = MOOD_BINS,
+                        **layout) -> "go.Figure":
+    """Track counts per valence × energy cell.
+
+    The heatmap draws the grid; an invisible marker on each non-empty cell
+    carries its index in customdata so point and box selections report cells.
+    """
+    cells = mood_cells(valence, energy, bins)
+    cells = cells[cells != NO_CELL]
+    counts = np.bincount(cells, minlength=bins * bins)
+    centers = (np.arange(bins) + 0.5) / bins
+    grid = np.where(counts > 0, counts, None).reshape(bins, bins)  # empty cells stay blank
+
+    filled = np.flatnonzero(counts)
+    fig = go.Figure()
+    fig.add_trace(go.Heatmap(
+        x=centers.tolist(), y=centers.tolist(), z=grid.tolist(),
+        colorscale=[[0, "#1f3d2b"], [1, color]], colorbar=dict(title="tracks"),
+        hoverinfo="skip", xgap=1, ygap=1,
+    ))
+    fig.add_trace(go.Scatter(
+        x=centers[filled % bins].tolist(),
+        y=centers[filled // bins].tolist(),
+        mode="markers",
+        marker=dict(symbol="square", size=18, color=color, opacity=0),
+        selected=dict(marker=dict(opacity=0.35)),
+        unselected=dict(marker=dict(opacity=0)),
+        customdata=np.column_stack([filled, counts[filled]]).tolist(),
+        hovertemplate="Valence %{x:.2f} · Energy %{y:.2f}<br>%{customdata[1]} tracks<extra></extra>",
+        showlegend=False,
+    ))
+    fig.update_layout(template=template, dragmode="select", **layout)
+    fig.update_xaxes(range=[0, 1], title_text="Valence (sad → happy)")
+    fig.update_yaxes(range=[0, 1], title_text="Energy (calm → intense)")
+    return fig
+
+
+def selected_cells(event) -> list[int]:
+    """Cell indices picked in a density figure, from st.plotly_chart's selection event."""
+    if not event:
+        return []
+    return [int(point["customdata"][0]) for point in event["selection"]["points"] if point.get("customdata")]
+
+
+def mood_quadrants(fig: "go.Figure", height: int = 480) -> "go.Figure":
+    """Quadrant labels and midlines shared by the scatter and density mood maps."""
+    for x, y, label in [
+        (0.12, 0.88, "Angry / Intense"),
+        (0.75, 0.88, "Happy / Energetic"),
+        (0.12, 0.12, "Sad / Calm"),
+        (0.75, 0.12, "Peaceful / Content"),
+    ]:
+        fig.add_annotation(x=x, y=y, text=label, showarrow=False,
+                           font=dict(color="#535353", size=11))
+
+    fig.add_hline(y=0.5, line_dash="dot", line_color="#535353")
+    fig.add_vline(x=0.5, line_dash="dot", line_color="#535353")
+    fig.update_layout(height=height, margin=dict(l=0, r=0, t=10, b=0))
+    return fig
+
+
+def mood_scatter(df: "pd.DataFrame", mode: str, *, color: str, template: str, height: int = 480) -> "go.Figure":
+    """Per-track mood map; WebGL markers and lighter hover data for large track sets."""
+    webgl = mode == "webgl"
+    return mood_quadrants(px.scatter(
+        df,
+        x="valence",
+        y="energy",
+        hover_name="name",
+        hover_data={"artist": True} if webgl else {
+            "artist": True, "valence": ":.2f", "energy": ":.2f", "danceability": ":.2f",
+        },
+        color="danceability",
+        color_continuous_scale=[[0, "#191414"], [1, color]],
+        size="popularity",
+        size_max=20,
+        render_mode="webgl" if webgl else "svg",
+        template=template,
+        labels={"valence": "Valence (sad → happy)", "energy": "Energy (calm → intense)"},
+    ), height)
+
+
+@timed_cache_resource(ttl=3600, max_entries=32)
+def mood_density(data_hash: str, _df: "pd.DataFrame", color: str, template: str, height: int = 480) -> "go.Figure":
+    """Density grid for track sets too large to plot track by track."""
+    return mood_quadrants(mood_density_figure(_df["valence"].to_numpy(), _df["energy"].to_numpy(),
+                                              color=color, template=template), height)
+
+
+def mood_map(df: "pd.DataFrame", mode: str, *, key: str, color: str, template: str, height: int = 480):
+    """Draw the mood map for `mode` (see mood_map_mode). A density map lists the
+    tracks in the cells picked on it below, as a scatter of their own."""
+    if mode != "density":
+        st.plotly_chart(mood_scatter(df, mode, color=color, template=template, height=height),
+                        use_container_width=True)
+        return
+    event = st.plotly_chart(
+        mood_density(dataset_hash(df, ["valence", "energy"]), df, color, template, height),
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode=("points", "box"),
+        key=key,
+    )
+    cells = selected_cells(event)
+    if cells:
+        picked = df[np.isin(mood_cells(df["valence"], df["energy"]), cells)]
+        st.caption(f"{len(picked):,} tracks in the selected cells")
+        st.plotly_chart(mood_scatter(picked, "svg" if len(picked) <= WEBGL_POINTS else "webgl",
+                                     color=color, template=template, height=360),
+                        use_container_width=True)
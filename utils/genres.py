@@ -0,0 +1,131 @@
+"""Artist→genre index over every artist in the shared catalog.
+
+The catalog keeps artist→genre edges with interned genre IDs; this module
+loads them into a CSR-style sparse artist × genre matrix (indptr/indices
+arrays), so genre share, co-occurrence and genre-over-time are a handful of
+NumPy operations however many artists the library and history cover.
+"""
+import threading
+
+import numpy as np
+
+from utils.catalog import get_catalog
+from utils.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+UNKNOWN = "Unknown"
+
+
+class GenreIndex:
+    def __init__(self, genres: list[str], artists: list[tuple[str, str]], edges: list[tuple[str, int]]):
+        self.genres = np.array(genres, dtype=object)
+        self.artist_ids = [artist_id for artist_id, _ in artists]
+        self.row = {artist_id: i for i, artist_id in enumerate(self.artist_ids)}
+        self.by_name = {}
+        for i, (_, name) in enumerate(artists):
+            self.by_name.setdefault((name or "").casefold(), i)
+
+        rows = np.fromiter((self.row.get(a, -1) for a, _ in edges), np.int64, len(edges))
+        cols = np.fromiter((g for _, g in edges), np.int64, len(edges))
+        keep = rows >= 0
+        rows, cols = rows[keep], cols[keep]
+        order = np.lexsort((cols, rows))
+        self.indices = cols[order]
+        self.indptr = np.r_[0, np.cumsum(np.bincount(rows, minlength=len(self.artist_ids)))]
+        # How many artists carry each genre; broad genres rank above niche ones.
+        self.artist_counts = np.bincount(self.indices, minlength=len(self.genres))
+
+    def __len__(self):
+        return len(self.artist_ids)
+
+    def rows_for(self, artist_ids) -> np.ndarray:
+        """Matrix rows for the given artist IDs (-1 when not indexed)."""
+        return np.fromiter((self.row.get(a, -1) for a in artist_ids), np.int64)
+
+    def rows_for_names(self, names) -> np.ndarray:
+        """Matrix rows for artist names; joined names ("A, B") match on the first artist."""
+        return np.fromiter((self.by_name.get(n.split(", ")[0].casefold(), -1) for n in names), np.int64)
+
+    def _edges(self, rows: np.ndarray, weights: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(position in rows, genre ID, weight) for every genre of the given rows."""
+        weights = np.ones(len(rows)) if weights is None else np.asarray(weights, float)
+        known = rows >= 0
+        positions = np.flatnonzero(known)
+        rows, weights = rows[known], weights[known]
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        genre_ids = self.indices[np.repeat(starts, lengths) + offsets]
+        return np.repeat(positions, lengths), genre_ids, np.repeat(weights, lengths)
+
+    def genre_share(self, rows: np.ndarray, weights=None, top: int | None = None) -> "pd.DataFrame":
+        """Artists (or weight, e.g. tracks) per genre, largest first."""
+        _, genre_ids, w = self._edges(rows, weights)
+        totals = np.bincount(genre_ids, w, minlength=len(self.genres))
+        order = np.argsort(-totals, kind="stable")
+        order = order[totals[order] > 0][:top]
+        count = totals[order]
+        return pd.DataFrame({
+            "genre": self.genres[order],
+            "count": count.astype(int) if weights is None else count,
+            "share": count / count.sum() if len(count) else count,
+        })
+
+    def primary_genres(self, rows: np.ndarray) -> list[str]:
+        """Each artist's most widespread genre, or UNKNOWN."""
+        positions, genre_ids, _ = self._edges(rows)
+        result = np.full(len(rows), UNKNOWN, dtype=object)
+        if len(genre_ids):
+            # Sort each artist's genres by how many artists carry them, then take the first.
+            order = np.lexsort((genre_ids, -self.artist_counts[genre_ids], positions))
+            first = order[np.r_[True, positions[order][1:] != positions[order][:-1]]]
+            result[positions[first]] = self.genres[genre_ids[first]]
+        return result.tolist()
+
+    def cooccurrence(self, rows: np.ndarray, weights=None, top: int = 15) -> "pd.DataFrame":
+        """How often the `top` genres appear on the same artist, as a genre × genre frame."""
+        positions, genre_ids, w = self._edges(rows, weights)
+        totals = np.bincount(genre_ids, w, minlength=len(self.genres))
+        top_ids = np.argsort(-totals, kind="stable")[:top]
+        top_ids = top_ids[totals[top_ids] > 0]
+        column = np.full(len(self.genres), -1)
+        column[top_ids] = np.arange(len(top_ids))
+        keep = column[genre_ids] >= 0
+        # artists × top-genres incidence; weighting one side gives weighted co-occurrence
+        dense = np.zeros((len(rows), len(top_ids)))
+        dense[positions[keep], column[genre_ids[keep]]] = 1
+        artist_w = np.ones(len(rows)) if weights is None else np.asarray(weights, float)
+        matrix = dense.T @ (dense * artist_w[:, None])
+        names = self.genres[top_ids]
+        return pd.DataFrame(matrix, index=names, columns=names)
+
+    def genre_over_time(self, months: list[str], artist_names: list[str], plays: np.ndarray,
+                        top: int = 8) -> "pd.DataFrame":
+        """Monthly plays per genre from a (months × artists) matrix, for the `top` genres overall."""
+        rows = self.rows_for_names(artist_names)
+        positions, genre_ids, _ = self._edges(rows)
+        by_genre = np.stack([
+            np.bincount(genre_ids, month[positions], minlength=len(self.genres)) for month in plays
+        ]) if len(months) else np.zeros((0, len(self.genres)))
+        order = np.argsort(-by_genre.sum(axis=0), kind="stable")[:top]
+        order = order[by_genre[:, order].sum(axis=0) > 0]
+        frame = pd.DataFrame(by_genre[:, order], index=months, columns=self.genres[order])
+        return frame.rename_axis("month").reset_index().melt("month", var_name="genre", value_name="plays")
+
+
+_index: GenreIndex | None = None
+_index_version = -1
+_index_lock = threading.Lock()
+
+
+def get_genre_index() -> GenreIndex:
+    """The process-wide index, rebuilt when any process has changed the catalog's artists."""
+    global _index, _index_version
+    catalog = get_catalog()
+    with _index_lock:
+        version = catalog.genre_version
+        if _index is None or _index_version != version:
+            _index = GenreIndex(*catalog.genre_edges())
+            _index_version = version
+        return _index
@@ -0,0 +1,306 @@
+"""Append-only listening history stored as month-partitioned Parquet.
+
+The recently-played endpoint only ever returns the last 50 plays. A
+background recorder polls it with the `after` cursor and appends new plays to
+`<HISTORY_DIR>/<user>/month=YYYY-MM/*.parquet`, so the listening stats can be
+computed over months of history. Reads only load the requested columns and
+months, which keeps memory bounded as the history grows. Appends also update
+a ListeningCube (pickled next to the partitions) that the stats read from.
+
+The dashboard, the CLI and an import can append to the same store from
+different processes, so the pickle records which part files the cube has
+folded in. Every append and read compares that with the files on disk and
+folds in parts written elsewhere, or rebuilds the cube when parts it counted
+are gone.
+"""
+import json
+import os
+import pickle
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from utils.aggregates import CUBE_COLUMNS, ListeningCube
+from utils.artists import resolve_artists
+from utils.config import HISTORY_DIR
+from utils.lazy import lazy_import
+from utils.paginate import with_backoff
+
+# pyarrow.dataset loads pandas; only reads and compaction need it.
+ds = lazy_import("pyarrow.dataset")
+
+RECENT_LIMIT = 50
+POLL_INTERVAL = 15 * 60  # 50 plays is ~2.5h of listening, so this never misses any
+MAX_FILES_PER_MONTH = 16
+
+RECONCILE_WINDOW_MS = 60_000  # StreamingHistory endTime is cut to the minute
+PLAY_KEY_COLUMNS = ["played_at", "name", "artist", "duration_ms", "source"]
+
+_text = pa.dictionary(pa.int32(), pa.string())
+
+HISTORY_SCHEMA = pa.schema([
+    ("played_at", pa.timestamp("ms", tz="UTC")),
+    ("track_id", pa.string()),
+    ("name", _text),
+    ("artist", _text),
+    ("album", _text),
+    ("duration_ms", pa.int32()),
+    ("hour", pa.int8()),
+    ("day_num", pa.int8()),
+    ("source", _text),
+])
+
+
+def play_row(played_at: datetime, track_id, name, artist, album, duration_ms, source) -> dict:
+    """One history row; hour and day_num match fetch_recently_played (UTC)."""
+    return {
+        "played_at": played_at,
+        "track_id": track_id,
+        "name": name,
+        "artist": artist,
+        "album": album,
+        "duration_ms": duration_ms,
+        "hour": played_at.hour,
+        "day_num": played_at.weekday(),
+        "source": source,
+    }
+
+
+def _play_keys(table: pa.Table) -> list[tuple]:
+    """(played_at ms, name, artist, duration_ms, source) per row."""
+    played_at = table["played_at"].cast(pa.int64()).to_pylist()
+    return list(zip(played_at, *(table[column].to_pylist() for column in PLAY_KEY_COLUMNS[1:])))
+
+
+def api_play_row(item: dict) -> dict:
+    track = item["track"]
+    return play_row(
+        datetime.fromisoformat(item["played_at"].replace("Z", "+00:00")),
+        track.get("id"),
+        track["name"],
+        ", ".join(a["name"] for a in track["artists"]),
+        track["album"]["name"],
+        track["duration_ms"],
+        "api",
+    )
+
+
+class HistoryStore:
+    def __init__(self, root):
+        self.root = root
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._state_path = root / "state.json"
+        self._cube_path = root / "cube.pickle"
+        self._cube = None
+        self._cube_parts: frozenset[str] = frozenset()  # part files folded into _cube
+        self._lock = threading.Lock()
+
+    def cursor(self) -> int | None:
+        """Unix ms of the newest stored play, used as the `after` cursor."""
+        if not self._state_path.exists():
+            return None
+        return json.loads(self._state_path.read_text()).get("cursor")
+
+    def _month_dir(self, month: str):
+        return self.root / f"month={month}"
+
+    def append(self, rows: list[dict] | pa.Table) -> int:
+        """Add plays, skipping any already stored (see _drop_known). Returns rows written."""
+        table = rows if isinstance(rows, pa.Table) else pa.Table.from_pylist(rows, schema=HISTORY_SCHEMA)
+        if table.num_rows == 0:
+            return 0
+        months = pc.strftime(table["played_at"], format="%Y-%m")
+
+        written = 0
+        with self._lock:
+            cube = self._load_cube()
+            for month in pc.unique(months).to_pylist():
+                part = table.filter(pc.equal(months, month))
+                part = self._drop_known(month, part)
+                if part.num_rows == 0:
+                    continue
+                month_dir = self._month_dir(month)
+                month_dir.mkdir(exist_ok=True)
+                path = month_dir / f"part-{uuid.uuid4().hex}.parquet"
+                pq.write_table(part, path)
+                cube.add(part.select(CUBE_COLUMNS))
+                self._cube_parts |= {self._part_name(path)}
+                written += part.num_rows
+                if len(list(month_dir.glob("*.parquet"))) > MAX_FILES_PER_MONTH:
+                    self._compact(month_dir)
+
+            if written:
+                self._save_cube()
+            newest = pc.max(table["played_at"]).value
+            if newest is not None and newest > (self.cursor() or 0):
+                self._state_path.write_text(json.dumps({"cursor": newest}))
+        return written
+
+    def cube(self) -> ListeningCube:
+        """Aggregates over every stored play, kept current by append()."""
+        with self._lock:
+            return self._load_cube()
+
+    def _part_name(self, path) -> str:
+        return f"{path.parent.name}/{path.name}"
+
+    def _load_cube(self) -> ListeningCube:
+        # Caller holds self._lock. Only parts this cube hasn't counted are read.
+        parts = frozenset(self._part_name(f) for f in self.root.glob("month=*/*.parquet"))
+        if self._cube is not None and self._cube_parts == parts:
+            return self._cube
+        # Start from whichever of the saved and in-memory cubes has counted more of
+        # the current parts; one that counted parts since compacted or removed can't be used.
+        usable = [(c, f) for c, f in (self._read_cube(), (self._cube, self._cube_parts)) if c is not None and f <= parts]
+        cube, folded = max(usable, key=lambda candidate: len(candidate[1]), default=(ListeningCube(), frozenset()))
+        new = sorted(parts - folded)
+        if new:
+            dataset = ds.dataset([self.root / name for name in new], format="parquet", schema=HISTORY_SCHEMA)
+            cube.add(dataset.to_table(columns=CUBE_COLUMNS))
+        self._cube, self._cube_parts = cube, parts
+        if new:
+            self._save_cube()
+        return cube
+
+    def _read_cube(self) -> tuple[ListeningCube | None, frozenset[str]]:
+        try:
+            state = pickle.loads(self._cube_path.read_bytes())
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None, frozenset()
+        if not isinstance(state, dict):
+            return None, frozenset()  # a pickle from before parts were tracked
+        return state["cube"], state["parts"]
+
+    def _save_cube(self):
+        tmp = self._cube_path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_bytes(pickle.dumps({"cube": self._cube, "parts": self._cube_parts}))
+        tmp.replace(self._cube_path)
+
+    def _drop_known(self, month: str, part: pa.Table) -> pa.Table:
+        """The rows of `part` that are neither repeated within it nor already stored.
+
+        A play is identified by (played_at, name, artist, duration_ms), so
+        different tracks ending in the same minute of an export all count. A
+        row also matches a stored play of the same track less than
+        RECONCILE_WINDOW_MS away when the two come from different sources (the
+        API has milliseconds, exports end-of-play seconds or minutes), or when
+        both are exports with the same ms_played (the two export flavours).
+        """
+        rows = _play_keys(part)
+        seen, keep = set(), []
+        for i, key in enumerate(rows):
+            if key not in seen:
+                seen.add(key)
+                keep.append(i)
+
+        month_dir = self._month_dir(month)
+        if month_dir.exists() and any(month_dir.glob("*.parquet")):
+            existing = ds.dataset(month_dir, format="parquet").to_table(columns=PLAY_KEY_COLUMNS)
+            stored = _play_keys(existing)
+            known = {key[:4] for key in stored}
+            by_track = defaultdict(list)
+            for played_at, name, artist, duration, source in stored:
+                by_track[name, artist].append((played_at, duration, source))
+            keep = [i for i in keep if rows[i][:4] not in known and not any(
+                abs(rows[i][0] - played_at) < RECONCILE_WINDOW_MS
+                and (source != rows[i][4] or (source == "export" and duration == rows[i][3]))
+                for played_at, duration, source in by_track.get(rows[i][1:3], ())
+            )]
+        return part.take(pa.array(keep, pa.int64()))
+
+    def _compact(self, month_dir):
+        files = sorted(month_dir.glob("*.parquet"))
+        merged = ds.dataset(files, format="parquet", schema=HISTORY_SCHEMA).to_table()
+        merged = merged.sort_by("played_at")
+        path = month_dir / f"part-{uuid.uuid4().hex}.parquet"
+        pq.write_table(merged, path)
+        for f in files:
+            f.unlink()
+        old = frozenset(self._part_name(f) for f in files)
+        if old <= self._cube_parts:
+            # Same plays under a new name. Otherwise another process added one of
+            # the parts, and the next load rebuilds the cube.
+            self._cube_parts = self._cube_parts - old | {self._part_name(path)}
+
+    def is_empty(self) -> bool:
+        return not any(self.root.glob("month=*/*.parquet"))
+
+    def _files(self, start: datetime | None, end: datetime | None) -> list:
+        """Parquet files whose month partition overlaps [start, end)."""
+        first = start.strftime("%Y-%m") if start else ""
+        last = end.strftime("%Y-%m") if end else "9999-99"
+        return [
+            f for f in sorted(self.root.glob("month=*/*.parquet"))
+            if first <= f.parent.name.removeprefix("month=") <= last
+        ]
+
+    def scan(self, columns: list[str] | None = None, start: datetime | None = None,
+             end: datetime | None = None) -> pa.Table:
+        """Read the requested columns for plays in [start, end)."""
+        files = self._files(start, end)
+        if not files:
+            return HISTORY_SCHEMA.empty_table().select(columns or HISTORY_SCHEMA.names)
+        played_at = ds.field("played_at")
+        ts_type = HISTORY_SCHEMA.field("played_at").type
+        condition = None
+        if start is not None:
+            condition = played_at >= pa.scalar(start, ts_type)
+        if end is not None:
+            upper = played_at < pa.scalar(end, ts_type)
+            condition = upper if condition is None else condition & upper
+        dataset = ds.dataset(files, format="parquet", schema=HISTORY_SCHEMA)
+        return dataset.to_table(columns=columns, filter=condition)
+
+
+def record_recent_plays(sp, store: HistoryStore) -> int:
+    """Fetch plays newer than the store's cursor and append them."""
+    written = 0
+    after = store.cursor()
+    while True:
+        results = with_backoff(sp.current_user_recently_played, limit=RECENT_LIMIT, after=after)
+        items = [item for item in results["items"] if item.get("track")]
+        written += store.append([api_play_row(item) for item in items])
+        # Keeps the genre index covering everything in the history.
+        resolve_artists(sp, [a["id"] for item in items for a in item["track"]["artists"]])
+        next_after = (results.get("cursors") or {}).get("after")
+        if len(results["items"]) < RECENT_LIMIT or not next_after or int(next_after) == after:
+            return written
+        after = int(next_after)
+
+
+_stores: dict[str, HistoryStore] = {}
+_recorders: dict[str, threading.Thread] = {}
+_registry_lock = threading.Lock()
+
+
+def open_history(user_id: str) -> HistoryStore:
+    with _registry_lock:
+        if user_id not in _stores:
+            _stores[user_id] = HistoryStore(HISTORY_DIR / user_id)
+        return _stores[user_id]
+
+
+def start_history_recorder(sp, user_id: str, interval: float = POLL_INTERVAL):
+    """Start (once per user per process) a daemon thread that records new plays."""
+    store = open_history(user_id)
+
+    def run():
+        while True:
+            try:
+                record_recent_plays(sp, store)
+            except Exception:
+                pass  # network hiccups or expired sessions; try again next round
+            time.sleep(interval)
+
+    with _registry_lock:
+        if user_id in _recorders and _recorders[user_id].is_alive():
+            return
+        thread = threading.Thread(target=run, name=f"history-recorder-{user_id}", daemon=True)
+        _recorders[user_id] = thread
+        thread.start()
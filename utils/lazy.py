@@ -0,0 +1,38 @@
+"""Deferred imports for the heavy plotting and table libraries.
+
+pandas alone takes about half a second to import. A module-level
+`pd = lazy_import("pandas")` costs nothing until the first attribute access,
+so the Home page never loads pandas or plotly, and the other pages render
+their title before any chart or table code is imported.
+
+Annotations that mention a lazy module must be strings, or they would load it
+when the function is defined.
+"""
+import importlib
+import threading
+
+_lock = threading.Lock()
+
+
+class LazyModule:
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        with _lock:
+            if self._module is None:
+                self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._module or self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_import(name: str) -> LazyModule:
+    """A stand-in for `import name` that imports on first attribute access."""
+    return LazyModule(name)
@@ -0,0 +1,314 @@
+"""Local copy of a user's library, kept up to date with incremental syncs.
+
+The store holds every saved track, playlist and playlist item plus the top
+artist/track lists, so pages can read a whole library from SQLite instead of
+paging through the API on every load. Track objects themselves are public
+data and live in the shared catalog, which each user's store attaches.
+
+Syncs are incremental: saved tracks are read newest-first and the walk stops
+at the first (track, added_at) pair already stored, and a playlist's items are
+only refetched when its snapshot_id has changed. Each sync also resolves every
+artist in the library, so the genre index covers all of them.
+
+Pages and syncs share one connection. Every read and every write transaction
+holds the store lock, but a sync only takes it for its writes: the API calls
+run outside it, so pages keep reading while a sync is on the network.
+
+Every sync stamps last_synced; last_changed only moves when a sync actually
+changed saved tracks, playlists, top lists or artists, which is what decides
+whether a precomputed bundle is still current.
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from utils.artists import resolve_artists
+from utils.catalog import get_catalog
+from utils.config import LIBRARY_DIR
+from utils.paginate import paginate, with_backoff
+from utils.top_items import fetch_top_items
+
+SAVED_PAGE_SIZE = 50
+PLAYLIST_PAGE_SIZE = 50
+PLAYLIST_ITEMS_PAGE_SIZE = 100
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS saved_tracks (
+    track_id TEXT PRIMARY KEY,
+    added_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS saved_tracks_added ON saved_tracks (added_at);
+CREATE TABLE IF NOT EXISTS playlists (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    snapshot_id TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS playlist_items (
+    playlist_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    track_id TEXT NOT NULL,
+    added_at TEXT,
+    PRIMARY KEY (playlist_id, position)
+);
+CREATE TABLE IF NOT EXISTS top_items (
+    kind TEXT NOT NULL,
+    time_range TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, time_range)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class LibraryStore:
+    def __init__(self, path, catalog_path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(SCHEMA)
+        self._db.execute("ATTACH DATABASE ? AS catalog", (str(catalog_path),))
+        self._lock = threading.RLock()
+        self._sync_lock = threading.Lock()
+
+    # ── Reads ──────────────────────────────────────────────────────────────
+
+    def _query(self, sql: str, params=()) -> list[tuple]:
+        """Rows of one read, never part of another thread's open transaction."""
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _meta(self, key: str) -> str | None:
+        rows = self._query("SELECT value FROM meta WHERE key = ?", (key,))
+        return rows[0][0] if rows else None
+
+    def last_synced(self) -> float | None:
+        value = self._meta("last_synced")
+        return float(value) if value else None
+
+    def last_changed(self) -> float | None:
+        """When a sync last changed the library's contents, as a Unix time."""
+        # Stores synced before last_changed existed only have last_synced.
+        value = self._meta("last_changed") or self._meta("last_synced")
+        return float(value) if value else None
+
+    def saved_tracks(self, limit: int | None = None) -> list[dict]:
+        """Saved items newest first, shaped like the API's {added_at, track} items."""
+        rows = self._query(
+            """SELECT s.added_at, t.data FROM saved_tracks s JOIN catalog.tracks t ON t.id = s.track_id
+               ORDER BY s.added_at DESC LIMIT ?""",
+            (-1 if limit is None else limit,),
+        )
+        return [{"added_at": added_at, "track": json.loads(data)} for added_at, data in rows]
+
+    def playlists(self) -> list[dict]:
+        rows = self._query("SELECT data FROM playlists ORDER BY position")
+        return [json.loads(data) for (data,) in rows]
+
+    def playlist_tracks(self, playlist_id: str) -> list[dict]:
+        rows = self._query(
+            """SELECT t.data FROM playlist_items i JOIN catalog.tracks t ON t.id = i.track_id
+               WHERE i.playlist_id = ? ORDER BY i.position""",
+            (playlist_id,),
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    def playlist_memberships(self) -> list[tuple[str, str]]:
+        """(playlist_id, track_id) for every playlist item, duplicates included."""
+        return self._query("SELECT playlist_id, track_id FROM playlist_items")
+
+    def tracks(self, track_ids) -> dict[str, dict]:
+        ids = list(track_ids)
+        found = {}
+        for i in range(0, len(ids), 900):
+            chunk = ids[i:i + 900]
+            marks = ",".join("?" * len(chunk))
+            for track_id, data in self._query(f"SELECT id, data FROM catalog.tracks WHERE id IN ({marks})", chunk):
+                found[track_id] = json.loads(data)
+        return found
+
+    def artist_track_counts(self) -> dict[str, int]:
+        """Library tracks per artist, counting a track once however many playlists hold it."""
+        rows = self._query(
+            """SELECT json_extract(a.value, '$.id'), COUNT(*)
+               FROM (SELECT track_id FROM saved_tracks UNION SELECT track_id FROM playlist_items) l
+               JOIN catalog.tracks t ON t.id = l.track_id, json_each(t.data, '$.artists') a
+               GROUP BY 1"""
+        )
+        return {artist_id: n for artist_id, n in rows if artist_id}
+
+    def top_items(self, kind: str, time_range: str) -> list[dict] | None:
+        rows = self._query("SELECT data FROM top_items WHERE kind = ? AND time_range = ?", (kind, time_range))
+        return json.loads(rows[0][0]) if rows else None
+
+    # ── Writes ─────────────────────────────────────────────────────────────
+
+    @contextmanager
+    def _transaction(self):
+        """Hold the lock for one write transaction, rolled back if the block raises."""
+        with self._lock:
+            self._db.execute("BEGIN")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    def _set_meta(self, key: str, value: str):
+        self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, value))
+
+    def _put_tracks(self, tracks):
+        self._db.executemany(
+            "INSERT OR REPLACE INTO catalog.tracks VALUES (?, ?)",
+            [(t["id"], json.dumps(t, separators=(",", ":"))) for t in tracks],
+        )
+
+    def _known_saved(self, track_id: str, added_at: str) -> bool:
+        return bool(self._query(
+            "SELECT 1 FROM saved_tracks WHERE track_id = ? AND added_at = ?", (track_id, added_at)
+        ))
+
+
+def _playable(items):
+    """Drop local files and removed tracks, which have no track ID."""
+    return [item for item in items if item.get("track") and item["track"].get("id")]
+
+
+def _sync_saved_tracks(sp, store: LibraryStore, full: bool) -> tuple[int, bool]:
+    """Return (items written, whether the saved set changed)."""
+    new_items = []
+    total = None
+    if not full:
+        offset = 0
+        while True:
+            page = with_backoff(sp.current_user_saved_tracks, limit=SAVED_PAGE_SIZE, offset=offset)
+            total = page["total"]
+            fresh = []
+            for item in _playable(page["items"]):
+                if store._known_saved(item["track"]["id"], item["added_at"]):
+                    break
+                fresh.append(item)
+            new_items.extend(fresh)
+            if len(fresh) < len(_playable(page["items"])) or not page["next"]:
+                break
+            offset += SAVED_PAGE_SIZE
+
+        # Removals can't be seen from the newest-first walk; fall back to a
+        # full resync when the totals no longer line up.
+        full = store._meta("saved_total") != str(total - len(new_items))
+
+    if full:
+        items = paginate(
+            lambda offset, limit: sp.current_user_saved_tracks(limit=limit, offset=offset),
+            limit=SAVED_PAGE_SIZE,
+        )
+        total = len(items)
+        new_items = _playable(items)
+        before = set(store._query("SELECT track_id, added_at FROM saved_tracks"))
+        changed = before != {(item["track"]["id"], item["added_at"]) for item in new_items}
+    else:
+        changed = bool(new_items)
+
+    with store._transaction():
+        if full:
+            store._db.execute("DELETE FROM saved_tracks")
+        store._put_tracks(item["track"] for item in new_items)
+        store._db.executemany(
+            "INSERT OR REPLACE INTO saved_tracks VALUES (?, ?)",
+            [(item["track"]["id"], item["added_at"]) for item in new_items],
+        )
+        store._set_meta("saved_total", str(total))
+    return len(new_items), changed
+
+
+def _sync_playlists(sp, store: LibraryStore) -> int:
+    """Return how many playlists were added, changed or removed."""
+    playlists = [p for p in paginate(
+        lambda offset, limit: sp.current_user_playlists(limit=limit, offset=offset),
+        limit=PLAYLIST_PAGE_SIZE,
+    ) if p]
+    known = dict(store._query("SELECT id, snapshot_id FROM playlists"))
+
+    changed = 0
+    for position, playlist in enumerate(playlists):
+        pid = playlist["id"]
+        items = None
+        if known.get(pid) != playlist.get("snapshot_id"):
+            items = _playable(paginate(
+                lambda offset, limit, pid=pid: sp.playlist_items(
+                    pid, limit=limit, offset=offset, additional_types=("track",)
+                ),
+                limit=PLAYLIST_ITEMS_PAGE_SIZE,
+            ))
+            changed += 1
+
+        with store._transaction():
+            store._db.execute(
+                "INSERT OR REPLACE INTO playlists VALUES (?, ?, ?, ?)",
+                (pid, position, playlist.get("snapshot_id"), json.dumps(playlist, separators=(",", ":"))),
+            )
+            if items is not None:
+                store._db.execute("DELETE FROM playlist_items WHERE playlist_id = ?", (pid,))
+                store._put_tracks(item["track"] for item in items)
+                store._db.executemany(
+                    "INSERT INTO playlist_items VALUES (?, ?, ?, ?)",
+                    [(pid, i, item["track"]["id"], item.get("added_at")) for i, item in enumerate(items)],
+                )
+
+    gone = set(known) - {p["id"] for p in playlists}
+    with store._transaction():
+        store._db.executemany("DELETE FROM playlists WHERE id = ?", [(pid,) for pid in gone])
+        store._db.executemany("DELETE FROM playlist_items WHERE playlist_id = ?", [(pid,) for pid in gone])
+    return changed + len(gone)
+
+
+def _sync_top_items(sp, store: LibraryStore) -> bool:
+    """Store the top lists and return whether any ranking changed."""
+    top = fetch_top_items(sp)
+    changed = any(
+        [item["id"] for item in store.top_items(kind, time_range) or []] != [item["id"] for item in items]
+        for (kind, time_range), items in top.items()
+    )
+    rows = [(kind, time_range, json.dumps(items, separators=(",", ":"))) for (kind, time_range), items in top.items()]
+    with store._transaction():
+        store._db.executemany("INSERT OR REPLACE INTO top_items VALUES (?, ?, ?)", rows)
+    return changed
+
+
+def sync_library(sp, store: LibraryStore, full: bool = False) -> dict:
+    """Bring the store up to date and return what changed."""
+    # Cached me/tracks and playlist pages would hide new saves and snapshot changes.
+    live = sp.fresh()
+    genre_version = get_catalog().genre_version
+    # One sync per store at a time; page reads only wait on the short write transactions.
+    with store._sync_lock:
+        saved, saved_changed = _sync_saved_tracks(live, store, full=full or store.last_synced() is None)
+        playlists = _sync_playlists(live, store)
+        top_changed = _sync_top_items(live, store)
+        artists = resolve_artists(sp, store.artist_track_counts())
+        now = str(time.time())
+        with store._transaction():
+            store._set_meta("last_synced", now)
+            # Newly resolved artists bump the catalog's genre version.
+            if saved_changed or playlists or top_changed or get_catalog().genre_version != genre_version:
+                store._set_meta("last_changed", now)
+    return {"saved_tracks": saved, "playlists": playlists, "artists": len(artists)}
+
+
+_stores: dict[str, LibraryStore] = {}
+_stores_lock = threading.Lock()
+
+
+def open_library(user_id: str) -> LibraryStore:
+    """The process-wide store for one user, opened on first use."""
+    with _stores_lock:
+        if user_id not in _stores:
+            _stores[user_id] = LibraryStore(LIBRARY_DIR / f"{user_id}.sqlite3", get_catalog().path)
+        return _stores[user_id]
@@ -0,0 +1,284 @@
+"""Process-wide timings for Spotify calls and cached page functions.
+
+Every HTTP response from the shared session is recorded per endpoint
+(latency, payload bytes, status), as are response-cache hits, coalesced
+waits and 429 retries made by SpotifyClient. Functions cached through
+timed_cache_data / timed_cache_resource, and swr_cache functions, record
+their latency per outcome (hit, miss, stale). The totals can be exported as
+JSON or Prometheus text.
+
+begin_page() also starts a per-run Metrics in a context variable, which every
+record made by that script run goes to as well, so render_diagnostics() shows
+only the current session's run even when other sessions share the process.
+Worker pools pass the run on to their threads with carry_run().
+"""
+import contextvars
+import functools
+import json
+import threading
+import time
+from collections import defaultdict
+
+import streamlit as st
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Series:
+    __slots__ = ("count", "seconds", "max_seconds", "bytes", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds: float, size: int = 0):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        self.bytes += size
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "seconds": self.seconds,
+            "max_seconds": self.max_seconds,
+            "bytes": self.bytes,
+            "buckets": dict(zip(map(str, LATENCY_BUCKETS), self.buckets)),
+        }
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.api = defaultdict(Series)  # (endpoint, source) -> Series
+            self.functions = defaultdict(Series)  # (function, outcome) -> Series
+            self.retries = defaultdict(int)  # (endpoint, reason) -> count
+            self.statuses = defaultdict(int)  # (endpoint, status) -> count
+            self.started = time.time()
+
+    def _current_run(self) -> "Metrics | None":
+        run = _run.get()
+        return run if run is not self else None
+
+    def observe_api(self, endpoint: str, source: str, seconds: float, size: int = 0, status: int | None = None):
+        """source is "network", "response_cache" or "coalesced"."""
+        with self._lock:
+            self.api[endpoint, source].observe(seconds, size)
+            if status is not None:
+                self.statuses[endpoint, status] += 1
+        if run := self._current_run():
+            run.observe_api(endpoint, source, seconds, size, status)
+
+    def observe_function(self, name: str, outcome: str, seconds: float):
+        with self._lock:
+            self.functions[name, outcome].observe(seconds)
+        if run := self._current_run():
+            run.observe_function(name, outcome, seconds)
+
+    def count_retry(self, endpoint: str, reason: str):
+        with self._lock:
+            self.retries[endpoint, reason] += 1
+        if run := self._current_run():
+            run.count_retry(endpoint, reason)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "since": self.started,
+                "api": [{"endpoint": e, "source": s, **v.as_dict()} for (e, s), v in sorted(self.api.items())],
+                "functions": [{"function": f, "outcome": o, **v.as_dict()} for (f, o), v in sorted(self.functions.items())],
+                "retries": [{"endpoint": e, "reason": r, "count": n} for (e, r), n in sorted(self.retries.items())],
+                "statuses": [{"endpoint": e, "status": s, "count": n} for (e, s), n in sorted(self.statuses.items())],
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        snap = self.snapshot()
+        lines = []
+
+        def histogram(name: str, help_text: str, rows: list[dict], labels: tuple[str, ...]):
+            lines.append(f"# HELP {name}_seconds {help_text}")
+            lines.append(f"# TYPE {name}_seconds histogram")
+            for row in rows:
+                tags = ",".join(f'{label}="{_escape(row[label])}"' for label in labels)
+                for bound, n in row["buckets"].items():
+                    lines.append(f'{name}_seconds_bucket{{{tags},le="{bound}"}} {n}')
+                lines.append(f'{name}_seconds_bucket{{{tags},le="+Inf"}} {row["count"]}')
+                lines.append(f"{name}_seconds_sum{{{tags}}} {row['seconds']:.6f}")
+                lines.append(f"{name}_seconds_count{{{tags}}} {row['count']}")
+
+        histogram("spotify_api_request", "Spotify API calls by endpoint and source.", snap["api"], ("endpoint", "source"))
+        lines.append("# HELP spotify_api_response_bytes_total Payload bytes received from the API.")
+        lines.append("# TYPE spotify_api_response_bytes_total counter")
+        for row in snap["api"]:
+            if row["source"] == "network":
+                lines.append(f'spotify_api_response_bytes_total{{endpoint="{_escape(row["endpoint"])}"}} {row["bytes"]}')
+        lines.append("# HELP spotify_api_responses_total API responses by status code.")
+        lines.append("# TYPE spotify_api_responses_total counter")
+        for row in snap["statuses"]:
+            lines.append(f'spotify_api_responses_total{{endpoint="{_escape(row["endpoint"])}",status="{row["status"]}"}} {row["count"]}')
+        lines.append("# HELP spotify_api_retries_total Retried API calls by reason.")
+        lines.append("# TYPE spotify_api_retries_total counter")
+        for row in snap["retries"]:
+            lines.append(f'spotify_api_retries_total{{endpoint="{_escape(row["endpoint"])}",reason="{row["reason"]}"}} {row["count"]}')
+        histogram("cached_function", "Cached page functions by outcome.", snap["functions"], ("function", "outcome"))
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+
+# The script run being recorded, if any; set by begin_page().
+_run: contextvars.ContextVar[Metrics | None] = contextvars.ContextVar("metrics_run", default=None)
+
+
+def carry_run(fn):
+    """fn, recording into the calling script run's metrics from whichever thread calls it."""
+    run = _run.get()
+    if run is None:
+        return fn
+
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        token = _run.set(run)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _run.reset(token)
+    return call
+
+# ── Cached-function instrumentation ───────────────────────────────────────────
+
+_calls = threading.local()
+
+
+def _timed(cache_decorator, **cache_kwargs):
+    """Wrap a Streamlit cache decorator so each call records a hit or a miss."""
+    def decorate(fn):
+        name = fn.__qualname__
+
+        @functools.wraps(fn)
+        def body(*args, **kwargs):
+            _calls.ran = True
+            return fn(*args, **kwargs)
+
+        cached = cache_decorator(**cache_kwargs)(body)
+
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            outer = getattr(_calls, "ran", None)
+            _calls.ran = False
+            start = time.perf_counter()
+            try:
+                return cached(*args, **kwargs)
+            finally:
+                METRICS.observe_function(name, "miss" if _calls.ran else "hit", time.perf_counter() - start)
+                _calls.ran = outer
+
+        call.clear = cached.clear
+        return call
+    return decorate
+
+
+def timed_cache_data(**kwargs):
+    """st.cache_data that also records hit/miss latency."""
+    return _timed(st.cache_data, **kwargs)
+
+
+def timed_cache_resource(**kwargs):
+    """st.cache_resource that also records hit/miss latency."""
+    return _timed(st.cache_resource, **kwargs)
+
+
+# ── Sidebar panel ─────────────────────────────────────────────────────────────
+
+def begin_page():
+    """Mark the start of a script run; call at the top of every page."""
+    _calls.page_started = time.perf_counter()
+    _run.set(Metrics())
+
+
+def end_section(name: str, started: float) -> float:
+    """Record a part of a page that began at perf_counter() `started`, as section:<name>.
+
+    Covers the server side only (data prep and serializing elements); the
+    benchmark harness reports these per page. Returns the seconds.
+    """
+    seconds = time.perf_counter() - started
+    METRICS.observe_function(f"section:{name}", "run", seconds)
+    return seconds
+
+
+def _totals(metrics: Metrics) -> dict:
+    snap = metrics.snapshot()
+    totals = defaultdict(lambda: [0, 0.0, 0])
+    for row in snap["api"]:
+        t = totals["api", row["endpoint"], row["source"]]
+        t[0] += row["count"]; t[1] += row["seconds"]; t[2] += row["bytes"]
+    for row in snap["functions"]:
+        t = totals["fn", row["function"], row["outcome"]]
+        t[0] += row["count"]; t[1] += row["seconds"]
+    return totals
+
+
+def render_diagnostics(page: str):
+    """Sidebar toggle showing where this run's time went, plus exports of the process totals."""
+    started = getattr(_calls, "page_started", None)
+    run = _run.get()
+    elapsed = time.perf_counter() - started if started is not None else None
+    if elapsed is not None:
+        METRICS.observe_function(f"page:{page}", "run", elapsed)
+    with st.sidebar:
+        if not st.toggle("Diagnostics", key="diagnostics"):
+            return
+        if elapsed is not None:
+            st.caption(f"This run: {elapsed * 1000:.0f} ms, of which the rows below are data loading; the rest is rendering.")
+
+        rows = []
+        for (kind, name, outcome), (count, seconds, size) in (_totals(run) if run else {}).items():
+            if not name.startswith(("page:", "section:")):
+                rows.append({
+                    "what": name,
+                    "kind": "API" if kind == "api" else "function",
+                    "outcome": outcome,
+                    "calls": count,
+                    "ms": seconds * 1000,
+                    "KB": size / 1024,
+                })
+        if rows:
+            st.dataframe(
+                sorted(rows, key=lambda r: -r["ms"]),
+                column_config={
+                    "ms": st.column_config.NumberColumn(format="%.1f"),
+                    "KB": st.column_config.NumberColumn(format="%.1f"),
+                },
+                hide_index=True,
+                use_container_width=True,
+            )
+        else:
+            st.caption("No API calls or cached-function calls in this run.")
+
+        snap = METRICS.snapshot()
+        retries = sum(r["count"] for r in snap["retries"])
+        calls = sum(r["count"] for r in snap["api"] if r["source"] == "network")
+        hits = sum(r["count"] for r in snap["api"] if r["source"] != "network")
+        st.caption(f"Whole process, all sessions, since start: {calls} API requests, "
+                   f"{hits} served without one, {retries} retries.")
+        col_json, col_prom = st.columns(2)
+        col_json.download_button("JSON", METRICS.to_json(), "metrics.json", "application/json")
+        col_prom.download_button("Prometheus", METRICS.to_prometheus(), "metrics.prom", "text/plain")
@@ -0,0 +1,64 @@
+"""Concurrent offset pagination for Spotify paging objects.
+
+The first page of any paged endpoint reports `total`, so every remaining
+offset is known up front. Instead of following `next` links one by one, the
+remaining pages are fetched through a bounded thread pool and reassembled in
+offset order.
+"""
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import spotipy
+
+from utils.metrics import METRICS, carry_run
+
+PAGE_WORKERS = 8
+MAX_RETRIES = 5
+BASE_DELAY = 1.0
+
+
+def retry_after(exc: spotipy.exceptions.SpotifyException) -> float | None:
+    """Seconds requested by a 429's Retry-After header, if any."""
+    value = (exc.headers or {}).get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def with_backoff(fn, *args, retries: int = MAX_RETRIES, **kwargs):
+    """Call fn, retrying 429 responses that carry no Retry-After with exponential backoff.
+
+    SpotifyClient already waits out and retries 429s that say how long to
+    wait; one of those only gets here once the client has given up on it, so
+    it is raised rather than retried on top.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args, **kwargs)
+        except spotipy.exceptions.SpotifyException as e:
+            if e.http_status != 429 or retry_after(e) is not None or attempt == retries:
+                raise
+            METRICS.count_retry(getattr(fn, "__name__", "call"), "429")
+            time.sleep(BASE_DELAY * 2 ** attempt + random.uniform(0, BASE_DELAY))
+
+
+def paginate(fetch_page, limit: int, max_workers: int = PAGE_WORKERS) -> list:
+    """Fetch every item of a paged endpoint.
+
+    fetch_page(offset, limit) must return a Spotify paging object. The first
+    page is fetched alone to learn `total`; the rest are fetched concurrently
+    and returned in their original order.
+    """
+    first = with_backoff(fetch_page, 0, limit)
+    items = list(first["items"])
+    offsets = range(limit, first.get("total") or 0, limit)
+    if not offsets:
+        return items
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(offsets))) as pool:
+        pages = pool.map(carry_run(lambda offset: with_backoff(fetch_page, offset, limit)), offsets)
+        for page in pages:
+            items.extend(page["items"])
+    return items
@@ -0,0 +1,97 @@
+"""In-memory search index over track names and artists.
+
+Text is accent-folded and case-folded, then indexed two ways:
+
+* a trigram index: queries of 3+ characters intersect the posting lists of
+  their trigrams and only verify the few surviving rows,
+* a sorted token list for 1–2 character queries, matched as word prefixes.
+
+Optional fuzzy matching maps each query word to close vocabulary words with
+difflib, which catches typos like "beyonse". Every word must still match a
+row, exactly or closely, so a typo in one word doesn't widen the search to
+everything the other words match.
+"""
+import bisect
+import difflib
+import unicodedata
+from collections import defaultdict
+
+import numpy as np
+
+_EMPTY = np.empty(0, dtype=np.int32)
+
+
+def normalize(text: str) -> str:
+    """Lowercase and strip accents: 'Beyoncé' -> 'beyonce'."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    def __init__(self, names, artists):
+        # The separator can't appear in a query, so matches never straddle fields.
+        self._docs = [f"{normalize(n)}\0{normalize(a)}" for n, a in zip(names, artists)]
+        self._all = np.arange(len(self._docs), dtype=np.int32)
+
+        grams = defaultdict(list)
+        tokens = defaultdict(list)
+        for row, doc in enumerate(self._docs):
+            for gram in trigrams(doc):
+                grams[gram].append(row)
+            for token in set(doc.replace("\0", " ").split()):
+                tokens[token].append(row)
+        self._grams = {g: np.array(rows, dtype=np.int32) for g, rows in grams.items()}
+        self._vocab = sorted(tokens)
+        self._tokens = {t: np.array(rows, dtype=np.int32) for t, rows in tokens.items()}
+        self._prefix_cache: dict[str, np.ndarray] = {}
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _prefix_rows(self, prefix: str) -> np.ndarray:
+        # Only 1–2 character prefixes land here, so there are few enough to memoize.
+        if prefix not in self._prefix_cache:
+            start = bisect.bisect_left(self._vocab, prefix)
+            end = bisect.bisect_left(self._vocab, prefix + "\uffff")
+            matches = [self._tokens[t] for t in self._vocab[start:end]]
+            self._prefix_cache[prefix] = np.unique(np.concatenate(matches)) if matches else _EMPTY
+        return self._prefix_cache[prefix]
+
+    def _substring_rows(self, query: str) -> np.ndarray:
+        postings = sorted((self._grams.get(g, _EMPTY) for g in trigrams(query)), key=len)
+        rows = postings[0]
+        for other in postings[1:]:
+            if len(rows) == 0:
+                break
+            rows = np.intersect1d(rows, other, assume_unique=True)
+        if len(query) == 3:
+            return rows  # the single trigram is the whole query
+        return np.array([r for r in rows if query in self._docs[r]], dtype=np.int32)
+
+    def _exact_rows(self, query: str) -> np.ndarray:
+        return self._substring_rows(query) if len(query) >= 3 else self._prefix_rows(query)
+
+    def _fuzzy_rows(self, query: str) -> np.ndarray:
+        """Rows where every query word matches, as typed or as a close vocabulary word."""
+        rows = None
+        for word in query.split():
+            close = [self._tokens[t] for t in difflib.get_close_matches(word, self._vocab, n=5, cutoff=0.75)]
+            word_rows = np.unique(np.concatenate([self._exact_rows(word), *close]))
+            rows = word_rows if rows is None else np.intersect1d(rows, word_rows, assume_unique=True)
+            if len(rows) == 0:
+                break
+        return _EMPTY if rows is None else rows.astype(np.int32)
+
+    def search(self, query: str, fuzzy: bool = False) -> np.ndarray:
+        """Positions of matching rows, in their original order."""
+        query = normalize(query).strip()
+        if not query:
+            return self._all
+        rows = self._exact_rows(query)
+        if fuzzy:
+            rows = np.union1d(rows, self._fuzzy_rows(query))
+        return rows
@@ -0,0 +1,126 @@
+"""Import Spotify's downloadable streaming-history dumps into the play history.
+
+Both export flavours are supported:
+
+* account data, `StreamingHistory*.json`:
+  {"endTime": "2023-01-31 18:02", "artistName", "trackName", "msPlayed"}
+* extended history, `endsong_*.json` / `Streaming_History_Audio_*.json`:
+  {"ts": "2023-01-31T18:02:11Z", "ms_played", "master_metadata_track_name",
+   "master_metadata_album_artist_name", "master_metadata_album_album_name",
+   "spotify_track_uri", ...}
+
+The files are JSON arrays that can run to hundreds of megabytes. They are read
+in fixed-size chunks and decoded one record at a time, and rows are written to
+the HistoryStore in batches, so memory stays flat regardless of file size.
+"""
+import json
+from datetime import datetime, timezone
+
+import pyarrow as pa
+
+from utils.history import HISTORY_SCHEMA, HistoryStore, play_row
+
+CHUNK_SIZE = 1 << 20
+BATCH_ROWS = 50_000
+
+_decoder = json.JSONDecoder()
+
+
+def iter_json_array(fp, chunk_size: int = CHUNK_SIZE):
+    """Yield the elements of a top-level JSON array from a text file object."""
+    buffer = ""
+    pos = 0
+    started = False
+    eof = False
+    while True:
+        # Skip whitespace and separators between elements.
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer) or eof:
+                break
+            buffer, pos = fp.read(chunk_size), 0
+            eof = not buffer
+
+        if pos >= len(buffer):
+            return
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("expected a JSON array")
+            started = True
+            pos += 1
+            continue
+        if buffer[pos] == "]":
+            return
+
+        try:
+            value, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            chunk = fp.read(chunk_size)
+            eof = not chunk
+            buffer, pos = buffer[pos:] + chunk, 0
+            continue
+        yield value
+        pos = end
+
+
+def _parse_ts(record: dict) -> datetime | None:
+    if "ts" in record:
+        return datetime.fromisoformat(record["ts"].replace("Z", "+00:00"))
+    if "endTime" in record:
+        return datetime.fromisoformat(record["endTime"]).replace(tzinfo=timezone.utc)
+    return None
+
+
+def normalize_record(record: dict) -> dict | None:
+    """Map one export record to a history row, or None for podcasts and blanks."""
+    played_at = _parse_ts(record)
+    if played_at is None:
+        return None
+    if "ts" in record:
+        name = record.get("master_metadata_track_name")
+        artist = record.get("master_metadata_album_artist_name")
+        album = record.get("master_metadata_album_album_name")
+        uri = record.get("spotify_track_uri") or ""
+        track_id = uri.rsplit(":", 1)[-1] if uri.startswith("spotify:track:") else None
+        ms_played = record.get("ms_played", 0)
+    else:
+        name = record.get("trackName")
+        artist = record.get("artistName")
+        album = None
+        track_id = None
+        ms_played = record.get("msPlayed", 0)
+    if not name or not artist:
+        return None
+    return play_row(played_at, track_id, name, artist, album, ms_played, "export")
+
+
+def iter_export_rows(fp):
+    for record in iter_json_array(fp):
+        row = normalize_record(record)
+        if row is not None:
+            yield row
+
+
+def import_streaming_history(fp, store: HistoryStore, batch_rows: int = BATCH_ROWS) -> int:
+    """Stream one export file (a text file object) into the store. Returns the number of new plays."""
+    written = 0
+    batch = []
+    for row in iter_export_rows(fp):
+        batch.append(row)
+        if len(batch) >= batch_rows:
+            written += store.append(pa.Table.from_pylist(batch, schema=HISTORY_SCHEMA))
+            batch = []
+    if batch:
+        written += store.append(pa.Table.from_pylist(batch, schema=HISTORY_SCHEMA))
+    return written
+
+
+def import_files(paths, store: HistoryStore) -> int:
+    written = 0
+    for path in paths:
+        with open(path, encoding="utf-8") as fp:
+            written += import_streaming_history(fp, store)
+    return written
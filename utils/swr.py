@@ -0,0 +1,174 @@
+"""Stale-while-revalidate caching for slow Spotify-backed functions.
+
+With st.cache_data, the first rerun after the TTL expires blocks on a full
+refetch, which for a large playlist takes many seconds. Functions decorated
+with swr_cache instead keep serving the stale value while a background thread
+refreshes it. A per-key lock makes sure concurrent reruns trigger only one
+refresh, and each entry records when it was last refreshed so pages can show
+how fresh their data is.
+
+Values are shared, not copied, between callers: don't mutate them. A
+function that can take a shortcut on its first load (a session's prefetch, a
+precomputed bundle) should check replacing() so a refresh doesn't take the
+same shortcut back to the value it is replacing.
+"""
+import functools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.metrics import METRICS
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="swr-refresh")
+_loading = threading.local()
+
+
+def replacing() -> float | None:
+    """Inside a cached function: when the value being replaced was stored, or None on a first load."""
+    return getattr(_loading, "replacing", None)
+
+
+def _load(fn, args, kwargs, previous: float | None):
+    _loading.replacing = previous
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        _loading.replacing = None
+
+
+class _Entry:
+    __slots__ = ("value", "refreshed_at")
+
+    def __init__(self, value, refreshed_at: float):
+        self.value = value
+        self.refreshed_at = refreshed_at
+
+
+class _SWRCache:
+    def __init__(self, ttl: float, max_age: float | None, max_entries: int, name: str = ""):
+        self.name = name
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._key_locks: dict = {}
+        self._lock = threading.Lock()
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def _store(self, key, value) -> _Entry:
+        with self._lock:
+            entry = self._entries[key] = _Entry(value, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                old_key, _ = self._entries.popitem(last=False)
+                self._key_locks.pop(old_key, None)
+            return entry
+
+    def _refresh_in_background(self, key, fn, args, kwargs, previous: float):
+        lock = self._key_lock(key)
+        if not lock.acquire(blocking=False):
+            return  # another rerun is already refreshing this key
+
+        def run():
+            try:
+                self._store(key, _load(fn, args, kwargs, previous))
+            except Exception:
+                pass  # keep serving the stale value; the next call retries
+            finally:
+                lock.release()
+
+        _executor.submit(run)
+
+    def call(self, fn, args, kwargs) -> _Entry:
+        """The entry served for this call; its value and refresh time belong together."""
+        start = time.perf_counter()
+        key = (args, tuple(sorted(kwargs.items())))
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            age = time.time() - entry.refreshed_at
+            if self.max_age is None or age <= self.max_age:
+                stale = age > self.ttl
+                if stale:
+                    self._refresh_in_background(key, fn, args, kwargs, entry.refreshed_at)
+                METRICS.observe_function(self.name, "stale" if stale else "hit", time.perf_counter() - start)
+                return entry
+
+        # Nothing usable yet: load in the foreground, once per key.
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is not None and time.time() - entry.refreshed_at <= self.ttl:
+                METRICS.observe_function(self.name, "hit", time.perf_counter() - start)
+                return entry
+            entry = self._store(key, _load(fn, args, kwargs, entry.refreshed_at if entry is not None else None))
+            METRICS.observe_function(self.name, "miss", time.perf_counter() - start)
+            return entry
+
+    def last_refreshed(self, args, kwargs) -> float | None:
+        with self._lock:
+            entry = self._entries.get((args, tuple(sorted(kwargs.items()))))
+        return entry.refreshed_at if entry else None
+
+    def is_refreshing(self, args, kwargs) -> bool:
+        lock = self._key_locks.get((args, tuple(sorted(kwargs.items()))))
+        return lock is not None and lock.locked()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_caches: dict[str, _SWRCache] = {}
+_caches_lock = threading.Lock()
+
+
+def swr_cache(ttl: float, max_age: float | None = 24 * 3600, max_entries: int = 64):
+    """Cache a function's results, refreshing them in the background after ttl seconds.
+
+    Values older than max_age are never served; the caller waits for fresh data.
+    Arguments must be hashable.
+    """
+    def decorator(fn):
+        # Page scripts redefine their functions on every rerun, so the cache
+        # is looked up by where the function is defined, not by identity.
+        name = f"{fn.__code__.co_filename}:{fn.__qualname__}"
+        with _caches_lock:
+            cache = _caches.setdefault(name, _SWRCache(ttl, max_age, max_entries, fn.__qualname__))
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return cache.call(fn, args, kwargs).value
+
+        def with_refreshed(*args, **kwargs):
+            """(value, refreshed_at) from one lookup; key derived state on this, since a
+            background refresh can land between separate value and last_refreshed calls."""
+            entry = cache.call(fn, args, kwargs)
+            return entry.value, entry.refreshed_at
+
+        wrapper.with_refreshed = with_refreshed
+        wrapper.last_refreshed = lambda *args, **kwargs: cache.last_refreshed(args, kwargs)
+        wrapper.is_refreshing = lambda *args, **kwargs: cache.is_refreshing(args, kwargs)
+        wrapper.clear = cache.clear
+        return wrapper
+
+    return decorator
+
+
+def clear_all():
+    with _caches_lock:
+        for cache in _caches.values():
+            cache.clear()
+
+
+def freshness_label(refreshed_at: float | None, refreshing: bool = False) -> str:
+    """Human-readable 'last refreshed' text for a caption."""
+    if refreshed_at is None:
+        return "Not loaded yet"
+    minutes = int((time.time() - refreshed_at) // 60)
+    age = "just now" if minutes < 1 else f"{minutes} min ago" if minutes < 120 else f"{minutes // 60} h ago"
+    return f"Last refreshed {age}" + (" · refreshing in the background…" if refreshing else "")
@@ -0,0 +1,118 @@
+"""The tables behind each page, built from API objects without Streamlit.
+
+Pages wrap these in their caches and pick the source (synced library,
+prefetched top items or the API); the headless CLI in main.py calls the same
+builders to precompute a bundle. Keeping one copy means a bundled table has
+exactly the columns and dtypes the page would have built itself.
+"""
+from datetime import datetime
+
+from utils.artists import first_artist_genres, remember_artists
+from utils.catalog import get_catalog
+from utils.genres import get_genre_index
+from utils.lazy import lazy_import
+from utils.tracks import build_track_table
+
+pd = lazy_import("pandas")
+
+
+def top_artist_table(items: list[dict]) -> "pd.DataFrame":
+    """Ranked top artists with their primary genre (Top Charts)."""
+    remember_artists(items)
+    index = get_genre_index()
+    primary = index.primary_genres(index.rows_for(a["id"] for a in items))
+    rows = []
+    for i, (artist, primary_genre) in enumerate(zip(items, primary), 1):
+        rows.append({
+            "rank": i,
+            "id": artist["id"],
+            "name": artist["name"],
+            "popularity": artist["popularity"],
+            "followers": artist["followers"]["total"],
+            "genres": artist.get("genres", []),
+            "primary_genre": primary_genre,
+            "image_url": artist["images"][0]["url"] if artist["images"] else None,
+            "spotify_url": artist["external_urls"]["spotify"],
+        })
+    return pd.DataFrame(rows)
+
+
+def top_track_table(items: list[dict]) -> "pd.DataFrame":
+    """Ranked top tracks (Top Charts)."""
+    rows = []
+    for i, track in enumerate(items, 1):
+        rows.append({
+            "rank": i,
+            "name": track["name"],
+            "artist": ", ".join(a["name"] for a in track["artists"]),
+            "album": track["album"]["name"],
+            "popularity": track["popularity"],
+            "duration_ms": track["duration_ms"],
+            "duration_min": round(track["duration_ms"] / 60000, 2),
+            "image_url": track["album"]["images"][0]["url"] if track["album"]["images"] else None,
+            "spotify_url": track["external_urls"]["spotify"],
+        })
+    return pd.DataFrame(rows)
+
+
+def feature_table(sp, tracks: list[dict]) -> "pd.DataFrame":
+    """Tracks that have audio features (Audio Features); empty if the endpoint is unavailable."""
+    if not tracks:
+        return pd.DataFrame()
+    feature_map = get_catalog().audio_features(sp, [t["id"] for t in tracks])
+    if feature_map is None:
+        return pd.DataFrame()
+    return build_track_table([t for t in tracks if feature_map.get(t["id"])], feature_map)
+
+
+def recent_play_table(items: list[dict]) -> "pd.DataFrame":
+    """Recently-played items with play time, hour and weekday (Listening Patterns)."""
+    played_at = pd.to_datetime([item["played_at"] for item in items], utc=True, format="ISO8601")
+    return build_track_table([item["track"] for item in items], extra={
+        "played_at": played_at,
+        "hour": played_at.hour.astype("int8"),
+        "day_num": played_at.weekday.astype("int8"),
+    })
+
+
+def saved_timeline_table(sp, items: list[dict]) -> "pd.DataFrame":
+    """Saved-track items with when they were added and their first artist's genres (Listening Patterns)."""
+    all_genres = first_artist_genres(sp, [item["track"] for item in items])
+    rows = []
+    for item, genres in zip(items, all_genres):
+        track = item["track"]
+        added_at = datetime.fromisoformat(item["added_at"].replace("Z", "+00:00"))
+        rows.append({
+            "name": track["name"],
+            "artist": ", ".join(a["name"] for a in track["artists"]),
+            "added_at": added_at,
+            "date": added_at.date(),
+            "month": added_at.strftime("%Y-%m"),
+            "genres": genres,
+        })
+    return pd.DataFrame(rows)
+
+
+def playlist_summaries(items: list[dict]) -> list[dict]:
+    """Non-empty playlists in the shape the playlist picker uses (Playlist Analysis)."""
+    playlists = []
+    for p in items:
+        if p and p.get("tracks", {}).get("total", 0) > 0:
+            playlists.append({
+                "id": p["id"],
+                "name": p["name"],
+                "total_tracks": p["tracks"]["total"],
+                "image_url": p["images"][0]["url"] if p.get("images") else None,
+                "owner": p["owner"]["display_name"],
+            })
+    return playlists
+
+
+def playlist_table(sp, tracks: list[dict]) -> "pd.DataFrame":
+    """A playlist's tracks with audio features, when available (Playlist Analysis)."""
+    if not tracks:
+        return pd.DataFrame()
+    feat_map = get_catalog().audio_features(sp, [t["id"] for t in tracks])
+    if feat_map is not None and not any(feat_map.values()):
+        feat_map = None
+    return build_track_table(tracks, feat_map)
@@ -0,0 +1,191 @@
+"""Local album-art thumbnails.
+
+Spotify's cover images are usually 640px, and the pages show them 48–110px
+wide, once per row. ThumbnailCache downloads each cover once, shrinks it to
+the displayed width (times PIXEL_RATIO for high-density screens) and keeps
+the JPEG on disk, so pages hand Streamlit a few KB of local bytes instead of
+pointing the browser at the full-size CDN image.
+
+Files are content-addressed (named by the SHA-256 of the thumbnail), so the
+same cover reached through different URLs is stored once. A small SQLite
+index maps (url, width) to a digest and tracks access times; the least
+recently used files are evicted when the directory outgrows its budget.
+"""
+import base64
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from utils.client import Coalescer
+from utils.config import THUMBNAIL_CACHE_MAX_BYTES, THUMBNAIL_DIR
+from utils.lazy import lazy_import
+from utils.metrics import METRICS, carry_run
+
+Image = lazy_import("PIL.Image")
+
+PIXEL_RATIO = 2
+JPEG_QUALITY = 85
+PREFETCH_WORKERS = 8
+DOWNLOAD_TIMEOUT = 10
+FAILURE_TTL = 600  # don't retry a broken image URL on every rerun
+
+
+class ThumbnailCache:
+    def __init__(self, root=THUMBNAIL_DIR, max_bytes: int = THUMBNAIL_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._coalescer = Coalescer()
+        self._failed: dict[tuple[str, int], float] = {}
+        self._session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=PREFETCH_WORKERS)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+        root.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(root / "index.sqlite3", check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                url TEXT NOT NULL,
+                width INTEGER NOT NULL,
+                digest TEXT NOT NULL,
+                PRIMARY KEY (url, width)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS thumbnails_digest ON thumbnails (digest);
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS blobs_lru ON blobs (accessed_at);
+        """)
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM blobs").fetchone()[0]
+
+    def _path(self, digest: str):
+        return self.root / digest[:2] / f"{digest}.jpg"
+
+    def get(self, url: str, width: int) -> bytes | None:
+        """The stored thumbnail, without downloading anything."""
+        start = time.perf_counter()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest FROM thumbnails WHERE url = ? AND width = ?", (url, width)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE blobs SET accessed_at = ? WHERE digest = ?", (time.time(), row[0]))
+        try:
+            data = self._path(row[0]).read_bytes()
+        except FileNotFoundError:
+            return None
+        METRICS.observe_api("images", "thumbnail_cache", time.perf_counter() - start)
+        return data
+
+    def fetch(self, url: str, width: int) -> bytes | None:
+        """The thumbnail, downloading and resizing the image on a miss; None if that fails."""
+        data = self.get(url, width)
+        if data is not None:
+            return data
+        if time.time() - self._failed.get((url, width), 0) < FAILURE_TTL:
+            return None
+        return self._coalescer.run(f"{width}/{url}", lambda: self._download(url, width))
+
+    def _download(self, url: str, width: int) -> bytes | None:
+        try:
+            response = self._session.get(url, timeout=DOWNLOAD_TIMEOUT)
+            METRICS.observe_api("images", "network", response.elapsed.total_seconds(),
+                                len(response.content), response.status_code)
+            response.raise_for_status()
+            data = shrink(response.content, width * PIXEL_RATIO)
+        except (requests.RequestException, OSError):
+            self._failed[(url, width)] = time.time()
+            return None
+        self._store(url, width, data)
+        return data
+
+    def _store(self, url: str, width: int, data: bytes):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if not path.exists():
+            path.parent.mkdir(exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+        with self._lock:
+            known = self._db.execute("SELECT 1 FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO blobs VALUES (?, ?, ?)", (digest, len(data), time.time()))
+            self._db.execute("INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?)", (url, width, digest))
+            if not known:
+                self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least-recently-used files until the cache is back to 90% of the budget."""
+        target = self.max_bytes * 0.9
+        rows = self._db.execute("SELECT digest, size FROM blobs ORDER BY accessed_at").fetchall()
+        doomed = []
+        for digest, size in rows:
+            if self._size <= target:
+                break
+            doomed.append((digest,))
+            self._size -= size
+            self._path(digest).unlink(missing_ok=True)
+        self._db.executemany("DELETE FROM thumbnails WHERE digest = ?", doomed)
+        self._db.executemany("DELETE FROM blobs WHERE digest = ?", doomed)
+
+    def prefetch(self, urls, width: int, max_workers: int = PREFETCH_WORKERS) -> dict[str, bytes]:
+        """Thumbnails for a page of rows, downloading the missing ones concurrently.
+
+        URLs that are empty or fail to load are left out of the result.
+        """
+        urls = list(dict.fromkeys(u for u in urls if u))
+        found = {url: self.get(url, width) for url in urls}
+        missing = [url for url, data in found.items() if data is None]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as pool:
+                found.update(zip(missing, pool.map(carry_run(lambda url: self.fetch(url, width)), missing)))
+        return {url: data for url, data in found.items() if data is not None}
+
+    def stats(self) -> dict:
+        with self._lock:
+            files = self._db.execute("SELECT COUNT(*) FROM blobs").fetchone()[0]
+        return {"files": files, "size_bytes": self._size, "max_bytes": self.max_bytes}
+
+
+def shrink(data: bytes, pixels: int) -> bytes:
+    """Re-encode an image as a JPEG at most `pixels` wide, keeping its aspect ratio."""
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("RGB", (pixels, pixels))  # JPEG sources decode at a reduced scale
+        image = image.convert("RGB")
+        if image.width > pixels:
+            image = image.resize((pixels, max(1, round(image.height * pixels / image.width))),
+                                 Image.Resampling.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def data_uri(data: bytes) -> str:
+    """Inline form for places that only take URLs, such as st.column_config.ImageColumn."""
+    return "data:image/jpeg;base64," + base64.b64encode(data).decode()
+
+
+_shared: ThumbnailCache | None = None
+_shared_lock = threading.Lock()
+
+
+def get_thumbnail_cache() -> ThumbnailCache:
+    """The process-wide thumbnail cache, opened on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = ThumbnailCache()
+        return _shared
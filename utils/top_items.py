@@ -0,0 +1,54 @@
+"""One-shot prefetch of every top-artist and top-track list.
+
+Top Charts and Audio Features both need the user's top items for each of the
+three time ranges. Instead of each page requesting its own slice on demand,
+all six lists are fetched once, in parallel and at the API's maximum limit,
+when a session starts. The pages then slice what they need, so switching time
+ranges never waits on the network.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from utils.metrics import carry_run
+from utils.paginate import with_backoff
+
+TOP_LIMIT = 50  # API maximum
+TIME_RANGES = ("short_term", "medium_term", "long_term")
+KINDS = ("artists", "tracks")
+
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="top-items-prefetch")
+
+
+def fetch_top_list(sp, kind: str, time_range: str) -> list[dict]:
+    """One list, fetched now."""
+    calls = {"artists": sp.current_user_top_artists, "tracks": sp.current_user_top_tracks}
+    return with_backoff(calls[kind], limit=TOP_LIMIT, time_range=time_range)["items"]
+
+
+def fetch_top_items(sp) -> dict[tuple[str, str], list[dict]]:
+    """All six lists keyed by (kind, time_range), fetched concurrently."""
+    with ThreadPoolExecutor(max_workers=len(KINDS) * len(TIME_RANGES)) as pool:
+        futures = {
+            (kind, time_range): pool.submit(carry_run(fetch_top_list), sp, kind, time_range)
+            for kind in KINDS
+            for time_range in TIME_RANGES
+        }
+        return {key: future.result() for key, future in futures.items()}
+
+
+def prefetch_top_items(sp) -> Future:
+    """Start fetch_top_items in the background and return its future."""
+    return _executor.submit(fetch_top_items, sp)
+
+
+def resolve_top_items(sp, prefetched: Future | None = None, library=None) -> dict[tuple[str, str], list[dict]]:
+    """Prefer the session's prefetch, then a synced library, then fetch now."""
+    if prefetched is not None:
+        try:
+            return prefetched.result()
+        except Exception:
+            pass  # fall through and try again below
+    if library is not None and library.last_synced() is not None:
+        stored = {(kind, tr): library.top_items(kind, tr) for kind in KINDS for tr in TIME_RANGES}
+        if all(items is not None for items in stored.values()):
+            return stored
+    return fetch_top_items(sp)
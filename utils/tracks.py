@@ -0,0 +1,111 @@
+"""Compact, typed track tables built column by column from API track objects.
+
+Repeated strings (artist, album, cover art) are categoricals, names and IDs
+are Arrow strings, audio features are float32 and counts are int16/int32.
+Links are not stored: the table keeps track and image IDs, and
+with_display_columns() turns them back into URLs for the rows being shown.
+"""
+import sys
+
+import numpy as np
+
+from utils.lazy import lazy_import
+
+pd = lazy_import("pandas")
+
+TRACK_URL = "https://open.spotify.com/track/"
+IMAGE_URL = "https://i.scdn.co/image/"
+
+UNIT_FEATURES = [
+    "danceability", "energy", "valence", "acousticness",
+    "instrumentalness", "speechiness", "liveness",
+]
+FEATURES = UNIT_FEATURES + ["tempo", "loudness"]
+
+OBJECT_STR_BYTES = 8 + sys.getsizeof("")  # a pointer and an ASCII str header per value
+
+
+def track_url(track_id: str) -> str:
+    return TRACK_URL + track_id
+
+
+def image_url(image_id: str | None) -> str | None:
+    if image_id is None or pd.isna(image_id):
+        return None
+    return image_id if image_id.startswith("http") else IMAGE_URL + image_id
+
+
+def _image_id(album: dict) -> str | None:
+    images = album.get("images")
+    if not images:
+        return None
+    url = images[0]["url"]
+    return url[len(IMAGE_URL):] if url.startswith(IMAGE_URL) else url
+
+
+def build_track_table(tracks: list[dict], features: dict | None = None, extra: dict | None = None) -> "pd.DataFrame":
+    """One row per track; `features` maps track ID to its audio features, `extra` adds caller columns."""
+    columns = {
+        "track_id": pd.array([t["id"] for t in tracks], dtype="string[pyarrow]"),
+        "name": pd.array([t["name"] for t in tracks], dtype="string[pyarrow]"),
+        "artist": pd.Categorical([", ".join(a["name"] for a in t["artists"]) for t in tracks]),
+        "album": pd.Categorical([t["album"]["name"] for t in tracks]),
+        "image_id": pd.Categorical([_image_id(t["album"]) for t in tracks]),
+        "popularity": np.fromiter((t.get("popularity", 0) for t in tracks), np.int16, len(tracks)),
+        "duration_ms": np.fromiter((t["duration_ms"] for t in tracks), np.int32, len(tracks)),
+    }
+    if features is not None:
+        feats = [features.get(t["id"]) or {} for t in tracks]
+        for name in FEATURES:
+            columns[name] = np.fromiter((f.get(name, np.nan) for f in feats), np.float32, len(feats))
+    if extra:
+        columns.update(extra)
+
+    return pd.DataFrame(columns)
+
+
+def with_display_columns(df: "pd.DataFrame") -> "pd.DataFrame":
+    """Add spotify_url, image_url and duration_min; meant for the handful of rows on screen."""
+    return df.assign(
+        spotify_url=[track_url(t) for t in df["track_id"]],
+        image_url=[image_url(i) for i in df["image_id"]],
+        duration_min=(df["duration_ms"] / 60000).round(2),
+    )
+
+
+def _str_lengths(series: "pd.Series") -> np.ndarray:
+    """Characters per value, -1 where missing."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        lengths = np.asarray(series.cat.categories.str.len(), dtype=np.int64)
+        return np.where(codes >= 0, lengths[np.maximum(codes, 0)], -1)
+    return series.str.len().fillna(-1).to_numpy(dtype=np.int64)
+
+
+def _object_bytes(lengths: np.ndarray, prefix: int = 0) -> int:
+    present = lengths >= 0
+    return int(len(lengths) * 8 + (lengths[present] + prefix + OBJECT_STR_BYTES - 8).sum())
+
+
+def memory_report(df: "pd.DataFrame") -> dict[str, int]:
+    """Bytes used now vs. an estimate for the same rows as object strings, full URLs and 64-bit numbers.
+
+    The untyped size is worked out from string lengths (ASCII str objects)
+    rather than by building that frame, so it costs little on large tables.
+    """
+    after = int(df.memory_usage(deep=True).sum())
+    before = int(df.index.memory_usage()) + len(df) * 8  # plus with_display_columns' duration_min
+    for col in df.columns:
+        series = df[col]
+        if col == "track_id":
+            before += _object_bytes(_str_lengths(series), len(TRACK_URL))  # as spotify_url
+        elif col == "image_id":
+            before += _object_bytes(_str_lengths(series), len(IMAGE_URL))  # as image_url
+        elif isinstance(series.dtype, (pd.CategoricalDtype, pd.StringDtype)):
+            before += _object_bytes(_str_lengths(series))
+        elif series.dtype.kind in "biufmM":
+            before += len(series) * 8
+        else:
+            before += int(series.memory_usage(deep=True, index=False))
+    return {"before": before, "after": after}
+